@@ -27,7 +27,63 @@
 #define NPY_NO_DEPRECATED_API NPY_1_5_API_VERSION
 #include <numpy/arrayobject.h>
 
+#include <math.h>
+#include <stdlib.h>
+#include <string.h>
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
 #include "angle_distribution.h"
+#include "neighbours.h"
+
+/*
+ * Add the angle between pairs p and p2 to the histogram h. If types is
+ * given, the histogram is resolved by the types of the central atom and
+ * the two neighbours.
+ */
+
+static inline void
+add_angle(npy_intp p, npy_intp p2, const npy_int *i, const npy_int *j,
+          const double *r, const npy_int *types, int ntypes, int nbins,
+          double cutoff_sq, npy_int *h)
+{
+  double n = r[3*p]*r[3*p] + r[3*p+1]*r[3*p+1] + r[3*p+2]*r[3*p+2];
+  if (cutoff_sq >= 0.0 && n >= cutoff_sq)  return;
+
+  double n2 = r[3*p2]*r[3*p2] + r[3*p2+1]*r[3*p2+1] + r[3*p2+2]*r[3*p2+2];
+  if (cutoff_sq >= 0.0 && n2 >= cutoff_sq)  return;
+
+  double angle = r[3*p]*r[3*p2] + r[3*p+1]*r[3*p2+1] + r[3*p+2]*r[3*p2+2];
+  angle = acos(angle/sqrt(n*n2));
+  int bin = (int) (nbins*angle/M_PI);
+  while (bin < 0)  bin += nbins;
+  while (bin >= nbins)  bin -= nbins;
+
+  if (types) {
+    bin += ((types[i[p]]*ntypes + types[j[p]])*ntypes + types[j[p2]])*nbins;
+  }
+  h[bin]++;
+}
+
+
+/*
+ * Check an optional integer array argument
+ */
+
+static PyObject *
+int_array_or_none(PyObject *py_arr, const char *name)
+{
+  if (!py_arr || py_arr == Py_None)  return NULL;
+  py_arr = PyArray_FROMANY(py_arr, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+  if (!py_arr) {
+    PyErr_Format(PyExc_TypeError, "%s needs to be one-dimensional integer "
+                 "array.", name);
+  }
+  return py_arr;
+}
+
 
 /*
  * Compute bond angle distribution
@@ -37,11 +93,18 @@ PyObject *
 py_angle_distribution(PyObject *self, PyObject *args)
 {
   PyObject *i_arr, *j_arr, *r_arr;
+  PyObject *py_types = NULL, *py_ij_t = NULL, *py_ik_t = NULL;
+  PyObject *py_num_threads = NULL, *py_out = NULL;
+  PyObject *types_arr = NULL, *ij_t_arr = NULL, *ik_t_arr = NULL;
+  PyObject *h_arr = NULL;
+  npy_int *seed = NULL;
   int nbins;
   double cutoff = -1.0;
 
-  if (!PyArg_ParseTuple(args, "O!O!O!i|d", &PyArray_Type, &i_arr, &PyArray_Type,
-                        &j_arr, &PyArray_Type, &r_arr, &nbins, &cutoff))
+  if (!PyArg_ParseTuple(args, "O!O!O!i|dOOOOO", &PyArray_Type, &i_arr,
+                        &PyArray_Type, &j_arr, &PyArray_Type, &r_arr, &nbins,
+                        &cutoff, &py_types, &py_ij_t, &py_ik_t,
+                        &py_num_threads, &py_out))
     return NULL;
 
   if (PyArray_NDIM(i_arr) != 1 || PyArray_TYPE(i_arr) != NPY_INT) {
@@ -60,6 +123,10 @@ py_angle_distribution(PyObject *self, PyObject *args)
                     "double array.");
     return NULL;
   }
+  if (nbins < 1) {
+    PyErr_SetString(PyExc_ValueError, "Number of bins must be positive.");
+    return NULL;
+  }
 
   npy_intp npairs = PyArray_DIM(i_arr, 0);
   if (PyArray_DIM(j_arr, 0) != npairs || PyArray_DIM(r_arr, 0) != npairs) {
@@ -68,59 +135,220 @@ py_angle_distribution(PyObject *self, PyObject *args)
     return NULL;
   }
 
-  npy_intp dim = nbins;
-  PyObject *h_arr = PyArray_ZEROS(1, &dim, NPY_INT, 1);
-  PyObject *tmp_arr = PyArray_ZEROS(1, &dim, NPY_INT, 1);
+  /* Number of threads, default is to use OpenMP default */
+  int nthreads = 1;
+#ifdef _OPENMP
+  nthreads = omp_get_max_threads();
+#endif
+  if (py_num_threads && py_num_threads != Py_None) {
+    long num_threads = PyLong_AsLong(py_num_threads);
+    if (PyErr_Occurred())  return NULL;
+    if (num_threads < 1) {
+      PyErr_SetString(PyExc_ValueError, "Number of threads must be positive.");
+      return NULL;
+    }
+#ifdef _OPENMP
+    nthreads = num_threads;
+#endif
+  }
+
+  i_arr = (PyObject *) PyArray_GETCONTIGUOUS((PyArrayObject *) i_arr);
+  j_arr = (PyObject *) PyArray_GETCONTIGUOUS((PyArrayObject *) j_arr);
+  r_arr = (PyObject *) PyArray_GETCONTIGUOUS((PyArrayObject *) r_arr);
 
-  npy_int *i = PyArray_DATA(i_arr);
-  npy_int *j = PyArray_DATA(j_arr);
-  double *r = PyArray_DATA(r_arr);
-  npy_int *h = PyArray_DATA(h_arr);
-  npy_int *tmp = PyArray_DATA(tmp_arr);
+  npy_int *i = PyArray_DATA((PyArrayObject *) i_arr);
+  npy_int *j = PyArray_DATA((PyArrayObject *) j_arr);
+  double *r = PyArray_DATA((PyArrayObject *) r_arr);
 
-  npy_int last_i = i[0], i_start = 0;
-  memset(tmp, 0, nbins*sizeof(npy_int));
-  int nangle = 1, p;
-  double cutoff_sq = cutoff*cutoff;
+  npy_intp p;
+  npy_int nat = 0;
   for (p = 0; p < npairs; p++) {
-    /* Avoid double counting */
-    if (last_i != i[p]) {
-      int bin;
-      for (bin = 0; bin < nbins; bin++) {
-        h[bin] += tmp[bin];
+    if (i[p] < 0 || j[p] < 0) {
+      PyErr_SetString(PyExc_ValueError, "Atom indices must be non-negative.");
+      goto fail;
+    }
+    if (i[p] >= nat)  nat = i[p]+1;
+    if (j[p] >= nat)  nat = j[p]+1;
+  }
+
+  /* Atom types, histogram is resolved by triplet type */
+  npy_int *types = NULL;
+  int ntypes = 0;
+  if (py_types && py_types != Py_None) {
+    types_arr = int_array_or_none(py_types, "Atom types");
+    if (!types_arr)  goto fail;
+    if (PyArray_DIM((PyArrayObject *) types_arr, 0) < nat) {
+      PyErr_SetString(PyExc_ValueError, "Atom types must be given for all "
+                      "atoms in the neighbour list.");
+      goto fail;
+    }
+    types = PyArray_DATA((PyArrayObject *) types_arr);
+    npy_intp k, ntypes_arr = PyArray_DIM((PyArrayObject *) types_arr, 0);
+    for (k = 0; k < ntypes_arr; k++) {
+      if (types[k] < 0) {
+        PyErr_SetString(PyExc_ValueError, "Atom types must be non-negative.");
+        goto fail;
       }
-      memset(tmp, 0, nbins*sizeof(npy_int));
-      last_i = i[p];
-      i_start = p;
+      if (types[k] >= ntypes)  ntypes = types[k]+1;
     }
+    if (py_out && py_out != Py_None && PyArray_Check(py_out) &&
+        PyArray_NDIM((PyArrayObject *) py_out) == 4) {
+      /* Number of types follows from the histogram we accumulate into */
+      npy_intp ntypes_out = PyArray_DIM((PyArrayObject *) py_out, 0);
+      if (ntypes_out < ntypes) {
+        PyErr_SetString(PyExc_ValueError, "Histogram has fewer types than "
+                        "there are atom types.");
+        goto fail;
+      }
+      ntypes = ntypes_out;
+    }
+  }
 
-    double n = r[3*p]*r[3*p] + r[3*p+1]*r[3*p+1] + r[3*p+2]*r[3*p+2];
-
-    if (cutoff < 0.0 || n < cutoff_sq) {
-      int p2;
-      for (p2 = i_start; i[p2] == last_i; p2++) {
-        if (p2 != p) {
-          double n2 = r[3*p2]*r[3*p2] + r[3*p2+1]*r[3*p2+1] + r[3*p2+2]*r[3*p2+2];
-          if (cutoff < 0.0 || n2 < cutoff_sq) {
-            double angle = r[3*p]*r[3*p2] + r[3*p+1]*r[3*p2+1] + r[3*p+2]*r[3*p2+2];
-            angle = acos(angle/sqrt(n*n2));
-            int bin = (int) (nbins*angle/M_PI);
-            while (bin < 0)  bin += nbins;
-            while (bin >= nbins)  bin -= nbins;
-            tmp[bin]++;
-            nangle++;
-          } /* n2 < cutoff_sq */
-        } /* p!= p */
+  /* Triplet list */
+  npy_int *ij_t = NULL, *ik_t = NULL;
+  npy_intp ntriplets = 0;
+  if ((py_ij_t && py_ij_t != Py_None) || (py_ik_t && py_ik_t != Py_None)) {
+    ij_t_arr = int_array_or_none(py_ij_t, "Triplet list");
+    if (!ij_t_arr)  goto fail;
+    ik_t_arr = int_array_or_none(py_ik_t, "Triplet list");
+    if (!ik_t_arr)  goto fail;
+    ntriplets = PyArray_DIM((PyArrayObject *) ij_t_arr, 0);
+    if (PyArray_DIM((PyArrayObject *) ik_t_arr, 0) != ntriplets) {
+      PyErr_SetString(PyExc_ValueError, "Triplet list arrays need to be of "
+                      "identical length.");
+      goto fail;
+    }
+    ij_t = PyArray_DATA((PyArrayObject *) ij_t_arr);
+    ik_t = PyArray_DATA((PyArrayObject *) ik_t_arr);
+    npy_intp t;
+    for (t = 0; t < ntriplets; t++) {
+      if (ij_t[t] < 0 || ij_t[t] >= npairs || ik_t[t] < 0 ||
+          ik_t[t] >= npairs) {
+        PyErr_SetString(PyExc_ValueError, "Triplet list refers to pairs not "
+                        "in the neighbour list.");
+        goto fail;
       }
-    } /* n < cutoff_sq */
+    }
   }
-  /* add angles of last element */
-  int bin;
-  for (bin = 0; bin < nbins; bin++) {
-    h[bin] += tmp[bin];
+
+  /* Histogram, either new or one we accumulate into */
+  int ndim = types ? 4 : 1;
+  npy_intp dims[4] = { ntypes, ntypes, ntypes, nbins };
+  if (!types)  dims[0] = nbins;
+  if (py_out && py_out != Py_None) {
+    if (!PyArray_Check(py_out) || PyArray_TYPE((PyArrayObject *) py_out) != NPY_INT ||
+        !PyArray_IS_C_CONTIGUOUS((PyArrayObject *) py_out) ||
+        !PyArray_ISWRITEABLE((PyArrayObject *) py_out)) {
+      PyErr_SetString(PyExc_TypeError, "Histogram needs to be a writeable, "
+                      "contiguous integer array.");
+      goto fail;
+    }
+    int shape_ok = PyArray_NDIM((PyArrayObject *) py_out) == ndim;
+    int d;
+    for (d = 0; shape_ok && d < ndim; d++) {
+      shape_ok = PyArray_DIM((PyArrayObject *) py_out, d) == dims[d];
+    }
+    if (!shape_ok) {
+      PyErr_SetString(PyExc_ValueError, "Histogram has wrong shape.");
+      goto fail;
+    }
+    Py_INCREF(py_out);
+    h_arr = py_out;
   }
-  
-  Py_DECREF(tmp_arr);
+  else {
+    h_arr = PyArray_ZEROS(ndim, dims, NPY_INT, 0);
+    if (!h_arr)  goto fail;
+  }
+  npy_int *h = PyArray_DATA((PyArrayObject *) h_arr);
+  npy_intp nh = PyArray_SIZE((PyArrayObject *) h_arr);
+
+  /* Without triplet list, angles are formed by all pairs of the same atom.
+     The neighbour list must be sorted by the first atom index. */
+  npy_int natoms_i = 0;
+  if (!ij_t && npairs > 0) {
+    natoms_i = i[npairs-1]+1;
+    seed = (npy_int *) malloc((natoms_i+1)*sizeof(npy_int));
+    if (!seed) {
+      PyErr_NoMemory();
+      goto fail;
+    }
+    first_neighbours(natoms_i, npairs, i, seed);
+    npy_int k;
+    for (k = 0; k < natoms_i && seed[k] < 0; k++)  seed[k] = 0;
+  }
+
+  double cutoff_sq = cutoff < 0.0 ? -1.0 : cutoff*cutoff;
+  int out_of_memory = 0;
+
+#pragma omp parallel num_threads(nthreads) if(nthreads > 1)
+  {
+    /* Each thread accumulates its own histogram */
+    npy_int *h_thread = (npy_int *) calloc(nh, sizeof(npy_int));
+
+    if (!h_thread) {
+#pragma omp atomic write
+      out_of_memory = 1;
+    }
+    else if (ij_t) {
+      npy_intp t;
+#pragma omp for schedule(static)
+      for (t = 0; t < ntriplets; t++) {
+        add_angle(ij_t[t], ik_t[t], i, j, r, types, ntypes, nbins, cutoff_sq,
+                  h_thread);
+      }
+    }
+    else {
+      npy_int a;
+#pragma omp for schedule(dynamic, 64)
+      for (a = 0; a < natoms_i; a++) {
+        npy_intp p1, p2;
+        for (p1 = seed[a]; p1 < seed[a+1]; p1++) {
+          for (p2 = seed[a]; p2 < seed[a+1]; p2++) {
+            if (p2 != p1) {
+              add_angle(p1, p2, i, j, r, types, ntypes, nbins, cutoff_sq,
+                        h_thread);
+            }
+          }
+        }
+      }
+    }
+
+    if (h_thread) {
+#pragma omp critical
+      {
+        npy_intp bin;
+        for (bin = 0; bin < nh; bin++) {
+          h[bin] += h_thread[bin];
+        }
+      }
+      free(h_thread);
+    }
+  }
+
+  if (out_of_memory) {
+    PyErr_NoMemory();
+    goto fail;
+  }
+
+  free(seed);
+  Py_XDECREF(types_arr);
+  Py_XDECREF(ij_t_arr);
+  Py_XDECREF(ik_t_arr);
+  Py_DECREF(i_arr);
+  Py_DECREF(j_arr);
+  Py_DECREF(r_arr);
 
   return h_arr;
+
+ fail:
+  free(seed);
+  Py_XDECREF(h_arr);
+  Py_XDECREF(types_arr);
+  Py_XDECREF(ij_t_arr);
+  Py_XDECREF(ik_t_arr);
+  Py_DECREF(i_arr);
+  Py_DECREF(j_arr);
+  Py_DECREF(r_arr);
+
+  return NULL;
 }
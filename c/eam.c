@@ -0,0 +1,286 @@
+/* ======================================================================
+   matscipy - Python materials science tools
+   https://github.com/libAtoms/matscipy
+
+   Copyright (2014) James Kermode, King's College London
+                    Lars Pastewka, Karlsruhe Institute of Technology
+
+   This program is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 2 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+   ====================================================================== */
+
+#include <Python.h>
+#define PY_ARRAY_UNIQUE_SYMBOL MATSCIPY_ARRAY_API
+#define NO_IMPORT_ARRAY
+#define NPY_NO_DEPRECATED_API NPY_1_5_API_VERSION
+#include <numpy/arrayobject.h>
+
+#include <math.h>
+#include <stdbool.h>
+#include <stdlib.h>
+
+#include "eam.h"
+
+/*
+ * Packed cubic splines on a uniform grid, see _pack_splines in
+ * matscipy/calculators/eam/calculator.py. Coefficients of spline k on grid
+ * interval g are stored at c[4*(k*nintervals+g)].
+ */
+
+typedef struct {
+    PyObject *py_c;
+    const double *c;
+    npy_intp nsplines, nintervals;
+    double inv_dx;
+} spline_table_t;
+
+static bool
+spline_table_init(spline_table_t *tab, PyObject *py_c, double inv_dx)
+{
+    tab->py_c = PyArray_FROMANY(py_c, NPY_DOUBLE, 3, 3, NPY_C_CONTIGUOUS);
+    if (!tab->py_c)  return false;
+    if (PyArray_DIM((PyArrayObject *) tab->py_c, 2) != 4 ||
+        PyArray_DIM((PyArrayObject *) tab->py_c, 1) < 1) {
+        PyErr_SetString(PyExc_TypeError, "Spline coefficients must have "
+                                         "shape (nb_splines, nb_intervals, "
+                                         "4).");
+        return false;
+    }
+    tab->c = PyArray_DATA((PyArrayObject *) tab->py_c);
+    tab->nsplines = PyArray_DIM((PyArrayObject *) tab->py_c, 0);
+    tab->nintervals = PyArray_DIM((PyArrayObject *) tab->py_c, 1);
+    tab->inv_dx = inv_dx;
+    return true;
+}
+
+/*
+ * Evaluate spline k and its derivative at x. Points outside of the grid
+ * are extrapolated with the polynomial of the closest interval.
+ */
+static inline void
+spline_eval(const spline_table_t *tab, npy_intp k, double x, double *y,
+            double *dy)
+{
+    x *= tab->inv_dx;
+    double g = floor(x);
+    npy_intp ig = 0;
+    if (g >= tab->nintervals-1)
+        ig = tab->nintervals-1;
+    else if (g > 0)
+        ig = (npy_intp) g;
+    double t = x - ig;
+    const double *c = tab->c + 4*(k*tab->nintervals + ig);
+    *y = c[0] + t*(c[1] + t*(c[2] + t*c[3]));
+    *dy = tab->inv_dx*(c[1] + t*(2*c[2] + t*3*c[3]));
+}
+
+/*
+ * Energy, virial and forces from a neighbour list. The electron density is
+ * accumulated in a first sweep over all pairs, forces and virial in a
+ * second sweep. Derivatives of the pair density are evaluated for both
+ * directions of each pair, such that the reverse pair is not required for
+ * full neighbour lists. Optionally, per-atom energies and virials are
+ * returned; pair contributions are split equally between both atoms.
+ */
+
+PyObject *
+py_eam_energy_virial_and_forces(PyObject *self, PyObject *args)
+{
+    PyObject *py_types, *py_i_n, *py_j_n, *py_dr_nc, *py_abs_dr_n;
+    PyObject *py_F, *py_f, *py_rep;
+    PyObject *py_virial = NULL, *py_forces = NULL;
+    PyObject *py_epot_i = NULL, *py_virial_iv = NULL;
+    spline_table_t F = { NULL }, f = { NULL }, rep = { NULL };
+    double inv_dF, inv_dr;
+    int half, per_atom = 0;
+    double *demb_i = NULL;
+
+    if (!PyArg_ParseTuple(args, "OOOOOOdOdOp|p", &py_types, &py_i_n, &py_j_n,
+                          &py_dr_nc, &py_abs_dr_n, &py_F, &inv_dF, &py_f,
+                          &inv_dr, &py_rep, &half, &per_atom))
+        return NULL;
+
+    /* Make sure our arrays are contiguous */
+    py_types = PyArray_FROMANY(py_types, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+    py_i_n = PyArray_FROMANY(py_i_n, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+    py_j_n = PyArray_FROMANY(py_j_n, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+    py_dr_nc = PyArray_FROMANY(py_dr_nc, NPY_DOUBLE, 2, 2, NPY_C_CONTIGUOUS);
+    py_abs_dr_n = PyArray_FROMANY(py_abs_dr_n, NPY_DOUBLE, 1, 1,
+                                  NPY_C_CONTIGUOUS);
+    if (!py_types || !py_i_n || !py_j_n || !py_dr_nc || !py_abs_dr_n)
+        goto fail;
+    if (!spline_table_init(&F, py_F, inv_dF) ||
+        !spline_table_init(&f, py_f, inv_dr) ||
+        !spline_table_init(&rep, py_rep, inv_dr))
+        goto fail;
+
+    npy_intp nat = PyArray_SIZE((PyArrayObject *) py_types);
+    npy_intp npairs = PyArray_SIZE((PyArrayObject *) py_i_n);
+    npy_intp nel = F.nsplines;
+    if (PyArray_SIZE((PyArrayObject *) py_j_n) != npairs ||
+        PyArray_SIZE((PyArrayObject *) py_abs_dr_n) != npairs ||
+        PyArray_DIM((PyArrayObject *) py_dr_nc, 0) != npairs ||
+        PyArray_DIM((PyArrayObject *) py_dr_nc, 1) != 3) {
+        PyErr_SetString(PyExc_TypeError, "Neighbour list arrays must have "
+                                         "identical length.");
+        goto fail;
+    }
+    if (f.nsplines != nel*nel || rep.nsplines != nel*nel) {
+        PyErr_SetString(PyExc_TypeError, "Density and pair functions must be "
+                                         "given for all pairs of elements.");
+        goto fail;
+    }
+
+    npy_int *types = PyArray_DATA((PyArrayObject *) py_types);
+    npy_int *i_n = PyArray_DATA((PyArrayObject *) py_i_n);
+    npy_int *j_n = PyArray_DATA((PyArrayObject *) py_j_n);
+    double *dr_nc = PyArray_DATA((PyArrayObject *) py_dr_nc);
+    double *abs_dr_n = PyArray_DATA((PyArrayObject *) py_abs_dr_n);
+
+    npy_intp n;
+    for (n = 0; n < nat; n++) {
+        if (types[n] < 0 || types[n] >= nel) {
+            PyErr_SetString(PyExc_ValueError, "Atom type out of bounds.");
+            goto fail;
+        }
+    }
+    for (n = 0; n < npairs; n++) {
+        if (i_n[n] < 0 || i_n[n] >= nat || j_n[n] < 0 || j_n[n] >= nat) {
+            PyErr_SetString(PyExc_ValueError, "Atom index out of bounds.");
+            goto fail;
+        }
+    }
+
+    npy_intp dims[2] = { nat, 3 };
+    py_forces = PyArray_ZEROS(2, dims, NPY_DOUBLE, 0);
+    dims[0] = 6;
+    py_virial = PyArray_ZEROS(1, dims, NPY_DOUBLE, 0);
+    demb_i = calloc(nat, sizeof(double));
+    if (!py_forces || !py_virial || !demb_i) {
+        if (!PyErr_Occurred())  PyErr_NoMemory();
+        goto fail;
+    }
+
+    double *forces_ic = PyArray_DATA((PyArrayObject *) py_forces);
+    double *virial_v = PyArray_DATA((PyArrayObject *) py_virial);
+
+    /* Per-atom energies and virials */
+    double *epot_i = NULL, *virial_iv = NULL;
+    if (per_atom) {
+        dims[0] = nat;
+        py_epot_i = PyArray_ZEROS(1, dims, NPY_DOUBLE, 0);
+        dims[1] = 6;
+        py_virial_iv = PyArray_ZEROS(2, dims, NPY_DOUBLE, 0);
+        if (!py_epot_i || !py_virial_iv)  goto fail;
+        epot_i = PyArray_DATA((PyArrayObject *) py_epot_i);
+        virial_iv = PyArray_DATA((PyArrayObject *) py_virial_iv);
+    }
+    double epot = 0.0;
+
+    Py_BEGIN_ALLOW_THREADS
+
+    /* Electron density */
+    for (n = 0; n < npairs; n++) {
+        npy_int i = i_n[n], j = j_n[n];
+        double y, dy;
+        spline_eval(&f, types[j]*nel+types[i], abs_dr_n[n], &y, &dy);
+        demb_i[i] += y;
+        if (half) {
+            spline_eval(&f, types[i]*nel+types[j], abs_dr_n[n], &y, &dy);
+            demb_i[j] += y;
+        }
+    }
+
+    /* Embedding energy; the density is replaced by the derivative of the
+       embedding energy */
+    for (n = 0; n < nat; n++) {
+        double y, dy;
+        spline_eval(&F, types[n], demb_i[n], &y, &dy);
+        epot += y;
+        if (epot_i)  epot_i[n] = y;
+        demb_i[n] = dy;
+    }
+
+    /* Pair energy, forces and virial */
+    double pair_factor = half ? 1.0 : 0.5;
+    for (n = 0; n < npairs; n++) {
+        npy_int i = i_n[n], j = j_n[n];
+        npy_int ti = types[i], tj = types[j];
+        double r = abs_dr_n[n];
+        double f_ji, df_ji, f_ij, df_ij, rep_n, drep_n;
+        spline_eval(&f, tj*nel+ti, r, &f_ji, &df_ji);
+        spline_eval(&f, ti*nel+tj, r, &f_ij, &df_ij);
+        /* Tabulated function is pair energy times distance */
+        spline_eval(&rep, ti*nel+tj, r, &rep_n, &drep_n);
+        rep_n /= r;
+        drep_n = (drep_n-rep_n)/r;
+        epot += pair_factor*rep_n;
+
+        double s = -pair_factor*(demb_i[i]*df_ji+demb_i[j]*df_ij+drep_n)/r;
+        double *dr_c = &dr_nc[3*n];
+        double df_c[3] = { s*dr_c[0], s*dr_c[1], s*dr_c[2] };
+        int c;
+        for (c = 0; c < 3; c++) {
+            forces_ic[3*j+c] += df_c[c];
+            forces_ic[3*i+c] -= df_c[c];
+        }
+        double w_v[6] = { -dr_c[0]*df_c[0], -dr_c[1]*df_c[1],
+                          -dr_c[2]*df_c[2], -dr_c[1]*df_c[2],
+                          -dr_c[0]*df_c[2], -dr_c[0]*df_c[1] };
+        int v;
+        for (v = 0; v < 6; v++)  virial_v[v] += w_v[v];
+
+        /* Pair energy and virial are split equally between both atoms */
+        if (epot_i) {
+            epot_i[i] += 0.5*pair_factor*rep_n;
+            epot_i[j] += 0.5*pair_factor*rep_n;
+            for (v = 0; v < 6; v++) {
+                virial_iv[6*i+v] += 0.5*w_v[v];
+                virial_iv[6*j+v] += 0.5*w_v[v];
+            }
+        }
+    }
+
+    Py_END_ALLOW_THREADS
+
+    free(demb_i);
+    Py_DECREF(py_types);
+    Py_DECREF(py_i_n);
+    Py_DECREF(py_j_n);
+    Py_DECREF(py_dr_nc);
+    Py_DECREF(py_abs_dr_n);
+    Py_DECREF(F.py_c);
+    Py_DECREF(f.py_c);
+    Py_DECREF(rep.py_c);
+
+    if (per_atom)
+        return Py_BuildValue("dNNNN", epot, py_virial, py_forces, py_epot_i,
+                             py_virial_iv);
+    return Py_BuildValue("dNN", epot, py_virial, py_forces);
+
+    fail:
+    free(demb_i);
+    Py_XDECREF(py_types);
+    Py_XDECREF(py_i_n);
+    Py_XDECREF(py_j_n);
+    Py_XDECREF(py_dr_nc);
+    Py_XDECREF(py_abs_dr_n);
+    Py_XDECREF(F.py_c);
+    Py_XDECREF(f.py_c);
+    Py_XDECREF(rep.py_c);
+    Py_XDECREF(py_virial);
+    Py_XDECREF(py_forces);
+    Py_XDECREF(py_epot_i);
+    Py_XDECREF(py_virial_iv);
+    return NULL;
+}
@@ -30,6 +30,7 @@
 #include <stddef.h>
 
 #include "angle_distribution.h"
+#include "eam.h"
 #include "islands.h"
 #include "neighbours.h"
 #include "ring_statistics.h"
@@ -51,6 +52,9 @@ static PyMethodDef module_methods[] = {
       "Enumerate shortest-path rings on a graph." },
     { "neighbour_list", (PyCFunction) py_neighbour_list, METH_VARARGS,
       "Compute a neighbour list for an atomic configuration." },
+    { "neighbour_list_batch", (PyCFunction) py_neighbour_list_batch,
+      METH_VARARGS,
+      "Compute neighbour lists for a sequence of atomic configurations." },
     { "first_neighbours", (PyCFunction) py_first_neighbours, METH_VARARGS,
       "Compute indices of first neighbours in neighbour list array." },
     { "triplet_list", (PyCFunction) py_triplet_list, METH_VARARGS,
@@ -58,6 +62,13 @@ static PyMethodDef module_methods[] = {
     { "get_jump_indicies", (PyCFunction) py_get_jump_indicies, METH_VARARGS,
       "Get jump indicies of an ordered list. Does not need list's length \
        as an argument - only the ordered list." },
+    { "find_common_neighbours", (PyCFunction) py_find_common_neighbours,
+      METH_VARARGS,
+      "Find common neighbours of pairs of atoms in a neighbour list." },
+    { "eam_energy_virial_and_forces",
+      (PyCFunction) py_eam_energy_virial_and_forces, METH_VARARGS,
+      "Compute energy, virial and forces of an embedded-atom method "
+      "potential from packed spline tables." },
     { "count_islands", (PyCFunction) py_count_islands, METH_VARARGS,
       "N/A" },
     { "count_segments", (PyCFunction) py_count_segments, METH_VARARGS,
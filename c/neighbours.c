@@ -31,6 +31,11 @@
 #include <float.h> 
 #include <stdbool.h>
 #include <stddef.h>
+#include <string.h>
+
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
 #include "tools.h"
 
@@ -58,8 +63,9 @@ bin_trunc(int i, int n)
 
 /* Map particle position to a cell index */
 void
-position_to_cell_index(double *cell_origin, double *inv_cell, double *ri,
-                       int n1, int n2, int n3, int *c1, int *c2, int *c3)
+position_to_cell_index(const double *cell_origin, const double *inv_cell,
+                       const double *ri, int n1, int n2, int n3,
+                       int *c1, int *c2, int *c3)
 {
     int i;
     double dri[3], si[3];
@@ -88,236 +94,1443 @@ check_bound(int c, int n)
 }
 
 /*
- * Neighbour list construction
+ * Cell subdivision for the neighbour search. The atoms are sorted into bins
+ * stored as linked lists: seed points to the first atom in each bin and next
+ * to the following atom within the same bin. For pair-type dependent
+ * cutoffs, atoms of each type are kept in separate lists so that every pair
+ * of types can be searched with a stencil matching its own cutoff.
  */
 
-PyObject *
-py_neighbour_list(PyObject *self, PyObject *args)
+typedef struct {
+    /* Simulation cell */
+    double cell_origin[3], inv_cell[9];
+    npy_bool *pbc;
+
+    /* Atomic positions and types */
+    double *r;
+    npy_int *types;
+
+    /* Cutoffs */
+    double cutoff_sq;
+    npy_intp ncutoffdims, ncutoffs;
+    double *cutoffs, *cutoffs_sq;
+
+    /* Only report pairs with i <= j (half neighbour list) */
+    bool half;
+
+    /* Number of bins and number of neighbouring bins to search */
+    int n1, n2, n3;
+    int nx, ny, nz;
+
+    /* Shape of a single bin */
+    double bin1[3], bin2[3], bin3[3];
+
+    /* Bin linked lists. If ntypes > 1, there is a separate set of lists
+       for each atom type and seed[t*n1*n2*n3+c] is the first atom of type t
+       in bin c. */
+    int ntypes;
+    int *seed, *next;
+
+    /* Number of neighbouring bins to search for each pair of types, stored
+       as stencil[3*(ti*ntypes+tj)+k]. A negative value means the two types
+       do not interact. Only used if ntypes > 1. */
+    int *stencil;
+} cell_list_t;
+
+/*
+ * Quantities that can be computed by the neighbour list
+ */
+
+#define Q_FIRST    1
+#define Q_SECND    2
+#define Q_DISTVEC  4
+#define Q_ABSDIST  8
+#define Q_SHIFT   16
+#define Q_REVERSE 32
+
+/*
+ * Growable buffer holding the neighbours of a contiguous range of atoms. Each
+ * thread fills its own buffers; these are concatenated in order afterwards.
+ */
+
+typedef struct {
+    npy_intp nneigh, neighsize;
+    npy_int *first, *secnd, *shift;
+
+    /* Distances are stored as npy_float if single is true, as npy_double
+       otherwise */
+    bool single;
+    size_t realsize;
+    void *distvec, *absdist;
+} neighbour_buffer_t;
+
+static bool
+neighbour_buffer_alloc(neighbour_buffer_t *buf, int flags, bool single,
+                       npy_intp neighsize)
 {
-    PyObject *py_cell_origin, *py_cell, *py_inv_cell, *py_pbc, *py_r;
-    PyObject *py_quantities, *py_cutoffs, *py_types = NULL;
-    double cutoff;
+    memset(buf, 0, sizeof(neighbour_buffer_t));
+    buf->neighsize = neighsize;
+    buf->single = single;
+    buf->realsize = single ? sizeof(npy_float) : sizeof(npy_double);
+    if ((flags & Q_FIRST) &&
+        !(buf->first = malloc(neighsize*sizeof(npy_int))))  return false;
+    if ((flags & Q_SECND) &&
+        !(buf->secnd = malloc(neighsize*sizeof(npy_int))))  return false;
+    if ((flags & Q_DISTVEC) &&
+        !(buf->distvec = malloc(3*neighsize*buf->realsize)))  return false;
+    if ((flags & Q_ABSDIST) &&
+        !(buf->absdist = malloc(neighsize*buf->realsize)))  return false;
+    if ((flags & Q_SHIFT) &&
+        !(buf->shift = malloc(3*neighsize*sizeof(npy_int))))  return false;
+    return true;
+}
 
-    /* Neighbour list */
-    int *seed = NULL, *last, *next = NULL;
+static bool
+neighbour_buffer_grow(neighbour_buffer_t *buf)
+{
+    npy_intp neighsize = 2*buf->neighsize;
+    void *p;
 
-    /* Optional quantities to be computed */
-    PyObject *py_first = NULL, *py_secnd = NULL, *py_distvec = NULL;
-    PyObject *py_absdist = NULL, *py_shift = NULL;
+    if (buf->first) {
+        if (!(p = realloc(buf->first, neighsize*sizeof(npy_int))))
+            return false;
+        buf->first = p;
+    }
+    if (buf->secnd) {
+        if (!(p = realloc(buf->secnd, neighsize*sizeof(npy_int))))
+            return false;
+        buf->secnd = p;
+    }
+    if (buf->distvec) {
+        if (!(p = realloc(buf->distvec, 3*neighsize*buf->realsize)))
+            return false;
+        buf->distvec = p;
+    }
+    if (buf->absdist) {
+        if (!(p = realloc(buf->absdist, neighsize*buf->realsize)))
+            return false;
+        buf->absdist = p;
+    }
+    if (buf->shift) {
+        if (!(p = realloc(buf->shift, 3*neighsize*sizeof(npy_int))))
+            return false;
+        buf->shift = p;
+    }
+    buf->neighsize = neighsize;
+    return true;
+}
 
-#if PY_MAJOR_VERSION >= 3
-    if (!PyArg_ParseTuple(args, "O!OOOOOO|O", &PyUnicode_Type, &py_quantities,
-                          &py_cell_origin, &py_cell, &py_inv_cell, &py_pbc,
-                          &py_r, &py_cutoffs, &py_types))
-#else
-    if (!PyArg_ParseTuple(args, "O!OOOOOO|O", &PyString_Type, &py_quantities,
-                          &py_cell_origin, &py_cell, &py_inv_cell, &py_pbc,
-                          &py_r, &py_cutoffs, &py_types))
-#endif
-        return NULL;
+static void
+neighbour_buffer_free(neighbour_buffer_t *buf)
+{
+    free(buf->first);
+    free(buf->secnd);
+    free(buf->distvec);
+    free(buf->absdist);
+    free(buf->shift);
+    memset(buf, 0, sizeof(neighbour_buffer_t));
+}
 
-    /* Make sure our arrays are contiguous */
-    py_cell_origin = PyArray_FROMANY(py_cell_origin, NPY_DOUBLE, 1, 1,
-                                     NPY_C_CONTIGUOUS);
-    if (!py_cell_origin) return NULL;
-    py_cell = PyArray_FROMANY(py_cell, NPY_DOUBLE, 2, 2,
-                              NPY_C_CONTIGUOUS);
-    if (!py_cell) return NULL;
-    py_inv_cell = PyArray_FROMANY(py_inv_cell, NPY_DOUBLE, 2, 2,
-                                  NPY_C_CONTIGUOUS);
-    if (!py_inv_cell) return NULL;
-    py_pbc = PyArray_FROMANY(py_pbc, NPY_BOOL, 1, 1, NPY_C_CONTIGUOUS);
-    if (!py_pbc) return NULL;
-    py_r = PyArray_FROMANY(py_r, NPY_DOUBLE, 2, 2, NPY_C_CONTIGUOUS);
-    if (!py_r) return NULL;
-    if (py_types) {
-        py_types = PyArray_FROMANY(py_types, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
-        if (!py_types) return NULL;
+/*
+ * Sort atoms into bins. The cell list keeps pointers to positions, types and
+ * cutoffs, which must stay valid while it is used. This function does not
+ * touch any Python object and can be called without holding the GIL. On
+ * failure, it returns false and points errmsg to a description of the error.
+ * If the number of bins had to be reduced to avoid an overflow, reduced_bins
+ * is set to true.
+ */
+
+#define REDUCED_BINS_WARNING "Ratio of simulation cell size to cutoff is " \
+    "very large; reducing number of bins for neighbour list search, but " \
+    "this may be slow. Are you using a cell with lots of vacuum?"
+
+static bool
+cell_list_build(cell_list_t *cl, const double *cell_origin,
+                const double *cell, const double *inv_cell, npy_bool *pbc,
+                npy_intp nat, double *r, npy_int *types, double cutoff,
+                npy_intp ncutoffdims, npy_intp ncutoffs, double *cutoffs,
+                double *cutoffs_sq, bool half, bool *reduced_bins,
+                const char **errmsg)
+{
+    npy_intp i;
+
+    memset(cl, 0, sizeof(cell_list_t));
+
+    /* Along nonperiodic directions, the bin grid only needs to cover the
+       region occupied by atoms. We replace the cell by the bounding box of
+       the atoms along these directions. This avoids empty bins in vacuum
+       regions and keeps atoms outside of the cell from piling up in the
+       boundary bins, which would make the search scale quadratically. The
+       bounding box is never thinner than the cutoff. Note that this also
+       means that the shift vectors are zero along nonperiodic directions. */
+    double bb_cell[9];
+    memcpy(cl->cell_origin, cell_origin, 3*sizeof(double));
+    memcpy(bb_cell, cell, 9*sizeof(double));
+    memcpy(cl->inv_cell, inv_cell, 9*sizeof(double));
+    if (nat > 0 && (!pbc[0] || !pbc[1] || !pbc[2])) {
+        double smin[3] = { DBL_MAX, DBL_MAX, DBL_MAX };
+        double smax[3] = { -DBL_MAX, -DBL_MAX, -DBL_MAX };
+        for (i = 0; i < nat; i++) {
+            double dri[3], si[3];
+            int k;
+            for (k = 0; k < 3; k++)  dri[k] = r[3*i+k] - cell_origin[k];
+            mat_mul_vec(inv_cell, dri, si);
+            for (k = 0; k < 3; k++) {
+                if (si[k] < smin[k])  smin[k] = si[k];
+                if (si[k] > smax[k])  smax[k] = si[k];
+            }
+        }
+        int k;
+        for (k = 0; k < 3; k++) {
+            if (pbc[k])  continue;
+            /* Height of the cell along direction k, i.e. inverse length of
+               the reciprocal vector */
+            double height = 1.0/normsq(&inv_cell[3*k]);
+            double smid = (smin[k]+smax[k])/2;
+            double slen = max(smax[k]-smin[k], cutoff/height);
+            if (slen <= 0.0)  slen = 1.0;
+            /* Pad such that no atom sits exactly on the upper boundary */
+            slen *= 1.0 + 1e-6;
+            smin[k] = smid - slen/2;
+            for (i = 0; i < 3; i++) {
+                cl->cell_origin[i] += smin[k]*cell[3*k+i];
+                bb_cell[3*k+i] *= slen;
+                cl->inv_cell[3*k+i] /= slen;
+            }
+        }
     }
 
-    /* FIXME! Check array shapes. */
-    npy_intp nat = PyArray_DIM((PyArrayObject *) py_r, 0);
+    double *cell1 = &bb_cell[0], *cell2 = &bb_cell[3], *cell3 = &bb_cell[6];
 
-    npy_intp ncutoffdims = 0;
-    npy_intp ncutoffs = 1;
-    npy_double *cutoffs = NULL;
-    double *cutoffs_sq = NULL;
-    if (PyFloat_Check(py_cutoffs)) {
-        cutoff = PyFloat_AsDouble(py_cutoffs);
-        py_cutoffs = NULL;
+    /* Compute vectors to opposite face */
+    double norm1[3], norm2[3], norm3[3];
+    cross_product(cell2, cell3, norm1);
+    cross_product(cell3, cell1, norm2);
+    cross_product(cell1, cell2, norm3);
+    double volume = fabs(cell3[0]*norm3[0] + cell3[1]*norm3[1] +
+                         cell3[2]*norm3[2]);
+
+    if (volume < 1e-12) {
+        *errmsg = "Zero cell volume.";
+        return false;
     }
-    else {
-        int i;
 
-        /* This must be an array of cutoffs */
-        py_cutoffs = PyArray_FROMANY(py_cutoffs, NPY_DOUBLE, 1, 2,
-                                     NPY_C_CONTIGUOUS);
-        if (!py_cutoffs) return NULL;
-        ncutoffdims = PyArray_NDIM((PyArrayObject *) py_cutoffs);
-        ncutoffs = PyArray_DIM((PyArrayObject *) py_cutoffs, 0);
-        cutoffs = PyArray_DATA((PyArrayObject *) py_cutoffs);
-        cutoff = 0.0;
-        if (ncutoffdims == 1) {
-            if (ncutoffs != nat) {
-                PyErr_SetString(PyExc_TypeError, "One-dimensional cutoff array "
-                                "must have length that corresponds to position "
-                                "array.");
-                goto fail;
+    double len1 = normsq(norm1), len2 = normsq(norm2), len3 = normsq(norm3);
+    for (i = 0; i < 3; i++) {
+        norm1[i] *= volume/(len1*len1);
+        norm2[i] *= volume/(len2*len2);
+        norm3[i] *= volume/(len3*len3);
+    }
+
+    /* Compute distance of cell faces */
+    len1 = volume/len1;
+    len2 = volume/len2;
+    len3 = volume/len3;
+
+    /* Pair-type dependent cutoffs get separate bin lists for each type, such
+       that short-ranged pairs are not searched with the stencil of the
+       longest cutoff. This requires all types to index the cutoff matrix. */
+    int ntypes = 1;
+    if (ncutoffdims == 2 && types && ncutoffs > 1) {
+        ntypes = ncutoffs;
+        for (i = 0; i < nat; i++) {
+            if (types[i] < 0 || types[i] >= ncutoffs) {
+                ntypes = 1;
+                break;
+            }
+        }
+    }
+
+    /* Number of cells for cell subdivision */
+    int n1 = max((int) floor(len1/cutoff), 1);
+    int n2 = max((int) floor(len2/cutoff), 1);
+    int n3 = max((int) floor(len3/cutoff), 1);
+
+    /* With multiple types, bins are made smaller than the largest cutoff
+       (down to the shortest nonzero pair cutoff, but at most by a factor of
+       four) such that each pair of types only searches bins within its own
+       cutoff. Stay with the coarse bins if the finer grid would need
+       considerably more bins than there are atoms. */
+    if (ntypes > 1) {
+        double bin_cutoff = cutoff;
+        for (i = 0; i < ncutoffs*ncutoffs; i++) {
+            if (cutoffs[i] > 0.0 && cutoffs[i] < bin_cutoff)
+                bin_cutoff = cutoffs[i];
+        }
+        bin_cutoff = max(bin_cutoff, cutoff/4);
+        int m1 = max((int) floor(len1/bin_cutoff), 1);
+        int m2 = max((int) floor(len2/bin_cutoff), 1);
+        int m3 = max((int) floor(len3/bin_cutoff), 1);
+        if (((double)m1)*m2*m3 <= max(((double)n1)*n2*n3, 8.0*nat)) {
+            n1 = m1;
+            n2 = m2;
+            n3 = m3;
+        }
+    }
+
+    /* Avoid overflow in total number of cells */
+    *reduced_bins = false;
+    while (((double)n1)*n2*n3*ntypes > INT_MAX) {
+      *reduced_bins = true;
+      n1 /= 2; if (n1 <= 0) n1 = 1;
+      n2 /= 2; if (n2 <= 0) n2 = 1;
+      n3 /= 2; if (n3 <= 0) n3 = 1;
+    }
+
+    assert(n1 > 0);
+    assert(n2 > 0);
+    assert(n3 > 0);
+
+    /* Find out over how many neighbor cells we need to loop (if the box is
+       small */
+    int nx = (int) ceil(cutoff*n1/len1);
+    int ny = (int) ceil(cutoff*n2/len2);
+    int nz = (int) ceil(cutoff*n3/len3);
+
+    /* Same for each pair of types */
+    if (ntypes > 1) {
+        cl->stencil = (int *) malloc(3*ntypes*ntypes*sizeof(int));
+        if (!cl->stencil) {
+            *errmsg = "Failed to allocate stencil array.";
+            return false;
+        }
+        for (i = 0; i < ntypes*ntypes; i++) {
+            double c = cutoffs[i];
+            if (c > 0.0) {
+                cl->stencil[3*i+0] = (int) ceil(c*n1/len1);
+                cl->stencil[3*i+1] = (int) ceil(c*n2/len2);
+                cl->stencil[3*i+2] = (int) ceil(c*n3/len3);
             }
-            for (i = 0; i < nat; i++) {
-                cutoff = max(cutoff, 2*cutoffs[i]);
+            else {
+                cl->stencil[3*i+0] = -1;
+                cl->stencil[3*i+1] = -1;
+                cl->stencil[3*i+2] = -1;
             }
         }
+    }
+
+    /* Sort particles into bins */
+    int ncells = n1*n2*n3;
+    cl->seed = (int *) malloc(ncells*ntypes*sizeof(int));
+    if (!cl->seed) {
+        *errmsg = "Failed to allocate seed array.";
+        return false;
+    }
+    int *last = (int *) malloc(ncells*ntypes*sizeof(int));
+    if (!last) {
+        *errmsg = "Failed to allocate last array.";
+        return false;
+    }
+    for (i = 0; i < ncells*ntypes; i++)  cl->seed[i] = -1;
+    cl->next = (int *) malloc(nat*sizeof(int));
+    if (!cl->next) {
+        free(last);
+        *errmsg = "Failed to allocate next array.";
+        return false;
+    }
+    for (i = 0; i < nat; i++) {
+        /* Get cell index */
+        int c1, c2, c3;
+        position_to_cell_index(cl->cell_origin, cl->inv_cell, &r[3*i],
+                               n1, n2, n3, &c1, &c2, &c3);
+
+        /* Periodic/non-periodic boundary conditions */
+        if (pbc[0])  c1 = bin_wrap(c1, n1);  else  c1 = bin_trunc(c1, n1);
+        if (pbc[1])  c2 = bin_wrap(c2, n2);  else  c2 = bin_trunc(c2, n2);
+        if (pbc[2])  c3 = bin_wrap(c3, n3);  else  c3 = bin_trunc(c3, n3);
+
+        /* Continuous cell index */
+        int ci = c1+n1*(c2+n2*c3);
+
+        assert(c1 >= 0 && c1 < n1);
+        assert(c2 >= 0 && c2 < n2);
+        assert(c3 >= 0 && c3 < n3);
+        assert(ci >= 0 && ci < ncells);
+
+        /* Separate lists for each type */
+        if (ntypes > 1)  ci += types[i]*ncells;
+
+        /* Put atom into appropriate bin */
+        if (cl->seed[ci] < 0) {
+            cl->next[i] = -1;
+            cl->seed[ci] = i;
+            last[ci] = i;
+        }
         else {
-            if (PyArray_DIM((PyArrayObject *) py_cutoffs, 1) != ncutoffs) {
-                PyErr_SetString(PyExc_TypeError, "Two-dimensional cutoff array "
-                                "must be square.");
-                goto fail;
+            cl->next[i] = -1;
+            cl->next[last[ci]] = i;
+            last[ci] = i;
+        }
+    }
+    free(last);
+
+    /* Store everything the search needs */
+    cl->pbc = pbc;
+    cl->r = r;
+    cl->types = types;
+    cl->cutoff_sq = cutoff*cutoff;
+    cl->ncutoffdims = ncutoffdims;
+    cl->ncutoffs = ncutoffs;
+    cl->cutoffs = cutoffs;
+    cl->cutoffs_sq = cutoffs_sq;
+    cl->half = half;
+    cl->ntypes = ntypes;
+    cl->n1 = n1;  cl->n2 = n2;  cl->n3 = n3;
+    cl->nx = nx;  cl->ny = ny;  cl->nz = nz;
+    for (i = 0; i < 3; i++) {
+        cl->bin1[i] = cell1[i]/n1;
+        cl->bin2[i] = cell2[i]/n2;
+        cl->bin3[i] = cell3[i]/n3;
+    }
+
+    return true;
+}
+
+/*
+ * Release the bins of a cell list
+ */
+
+static void
+cell_list_free(cell_list_t *cl)
+{
+    free(cl->seed);
+    free(cl->next);
+    free(cl->stencil);
+    cl->seed = NULL;
+    cl->next = NULL;
+    cl->stencil = NULL;
+}
+
+/*
+ * Find all neighbours of atoms i0 <= i < i1 and append them to buf. This
+ * function does not touch any Python object and can be called without
+ * holding the GIL. Returns false if memory allocation failed.
+ */
+
+static bool
+cell_list_search(const cell_list_t *cl, npy_intp i0, npy_intp i1,
+                 neighbour_buffer_t *buf)
+{
+    int n1 = cl->n1, n2 = cl->n2, n3 = cl->n3;
+    int ncells = n1*n2*n3, ntypes = cl->ntypes;
+    const double *bin1 = cl->bin1, *bin2 = cl->bin2, *bin3 = cl->bin3;
+    const npy_bool *pbc = cl->pbc;
+    npy_intp i;
+
+    for (i = i0; i < i1; i++) {
+        double *ri = &cl->r[3*i];
+
+        int ci01, ci02, ci03;
+        position_to_cell_index(cl->cell_origin, cl->inv_cell, ri, n1, n2, n3,
+                               &ci01, &ci02, &ci03);
+
+        /* Truncate if non-periodic and outside of simulation domain */
+        int ci1, ci2, ci3;
+        if (!pbc[0])  ci1 = bin_trunc(ci01, n1);  else  ci1 = ci01;
+        if (!pbc[1])  ci2 = bin_trunc(ci02, n2);  else  ci2 = ci02;
+        if (!pbc[2])  ci3 = bin_trunc(ci03, n3);  else  ci3 = ci03;
+
+        /* dri is the position relative to the lower left corner of the bin */
+        double dri[3];
+        dri[0] = ri[0] - ci1*bin1[0] - ci2*bin2[0] - ci3*bin3[0];
+        dri[1] = ri[1] - ci1*bin1[1] - ci2*bin2[1] - ci3*bin3[1];
+        dri[2] = ri[2] - ci1*bin1[2] - ci2*bin2[2] - ci3*bin3[2];
+
+        /* Apply periodic boundary conditions */
+        if (pbc[0])  ci1 = bin_wrap(ci01, n1);  else  ci1 = bin_trunc(ci01, n1);
+        if (pbc[1])  ci2 = bin_wrap(ci02, n2);  else  ci2 = bin_trunc(ci02, n2);
+        if (pbc[2])  ci3 = bin_wrap(ci03, n3);  else  ci3 = bin_trunc(ci03, n3);
+
+        /* Loop over types of neighbouring atoms */
+        npy_int ti = ntypes > 1 ? cl->types[i] : 0;
+        npy_int tj;
+        for (tj = 0; tj < ntypes; tj++) {
+            int nx = cl->nx, ny = cl->ny, nz = cl->nz;
+            double cutoff_sq = cl->cutoff_sq;
+            const int *seed = &cl->seed[tj*ncells];
+            if (ntypes > 1) {
+                const int *st = &cl->stencil[3*(ti*ntypes+tj)];
+                nx = st[0];  ny = st[1];  nz = st[2];
+                /* Skip if these types do not interact */
+                if (nx < 0)  continue;
+                cutoff_sq = cl->cutoffs_sq[ti*ntypes+tj];
             }
-            cutoffs_sq = malloc(ncutoffs*ncutoffs*sizeof(double));
-            if (!cutoffs_sq) {
-                PyErr_SetString(PyExc_RuntimeError, "Failed to allocate "
-                                                    "cutoffs_sq array.");
-                goto fail;
+
+            /* Loop over neighbouring bins */
+            int x, y, z;
+            for (z = -nz; z <= nz; z++) {
+                int cj3 = ci3 + z;
+                if (pbc[2])  cj3 = bin_wrap(cj3, n3);
+
+                /* Skip to next z value if cell is out of simulation bounds */
+                if (cj3 < 0 || cj3 >= n3)  continue;
+
+                cj3 = bin_trunc(cj3, n3);
+                int ncj3 = n2*cj3;
+
+                double off3[3];
+                off3[0] = z*bin3[0];
+                off3[1] = z*bin3[1];
+                off3[2] = z*bin3[2];
+
+                for (y = -ny; y <= ny; y++) {
+                    int cj2 = ci2 + y;
+                    if (pbc[1])  cj2 = bin_wrap(cj2, n2);
+
+                    /* Skip to next y value if cell is out of simulation
+                       bounds */
+                    if (cj2 < 0 || cj2 >= n2)  continue;
+
+                    cj2 = bin_trunc(cj2, n2);
+                    int ncj2 = n1*(cj2 + ncj3);
+
+                    double off2[3];
+                    off2[0] = off3[0] + y*bin2[0];
+                    off2[1] = off3[1] + y*bin2[1];
+                    off2[2] = off3[2] + y*bin2[2];
+
+                    for (x = -nx; x <= nx; x++) {
+                        /* Bin index of neighbouring bin */
+                        int cj1 = ci1 + x;
+                        if (pbc[0])  cj1 = bin_wrap(cj1, n1);
+
+                        /* Skip to next x value if cell is out of
+                           simulation bounds */
+                        if (cj1 < 0 || cj1 >= n1)  continue;
+
+                        cj1 = bin_trunc(cj1, n1);
+                        int ncj = cj1 + ncj2;
+
+                        assert(ncj == cj1+n1*(cj2+n2*cj3));
+
+                        /* Offset of the neighboring bins */
+                        double off[3];
+                        off[0] = off2[0] + x*bin1[0];
+                        off[1] = off2[1] + x*bin1[1];
+                        off[2] = off2[2] + x*bin1[2];
+
+                        /* Loop over all atoms in neighbouring bin */
+                        int j = seed[ncj];
+                        while (j >= 0) {
+                            /* For a half list, only pairs with i <= j are
+                               kept */
+                            if ((i != j || x != 0 || y != 0 || z != 0) &&
+                                !(cl->half && j < i)) {
+                                double *rj = &cl->r[3*j];
+
+                                int cj1, cj2, cj3;
+                                position_to_cell_index(cl->cell_origin,
+                                                       cl->inv_cell, rj,
+                                                       n1, n2, n3,
+                                                       &cj1, &cj2, &cj3);
+
+                                /* Truncate if non-periodic and outside of
+                                   simulation domain. */
+                                if (!pbc[0])  cj1 = bin_trunc(cj1, n1);
+                                if (!pbc[1])  cj2 = bin_trunc(cj2, n2);
+                                if (!pbc[2])  cj3 = bin_trunc(cj3, n3);
+
+                                /* drj is position relative to lower
+                                   left corner of the bin */
+                                double drj[3];
+                                drj[0] = rj[0] - cj1*bin1[0] - cj2*bin2[0] -
+                                    cj3*bin3[0];
+                                drj[1] = rj[1] - cj1*bin1[1] - cj2*bin2[1] -
+                                    cj3*bin3[1];
+                                drj[2] = rj[2] - cj1*bin1[2] - cj2*bin2[2] -
+                                    cj3*bin3[2];
+
+                                /* Compute distance between atoms */
+                                double dr[3];
+                                dr[0] = drj[0] - dri[0] + off[0];
+                                dr[1] = drj[1] - dri[1] + off[1];
+                                dr[2] = drj[2] - dri[2] + off[2];
+                                double abs_dr_sq = dr[0]*dr[0] + dr[1]*dr[1] +
+                                    dr[2]*dr[2];
+
+                                if (abs_dr_sq < cutoff_sq) {
+                                    bool inside_cutoff = true;
+                                    if (cl->ncutoffdims == 1) {
+                                        double c_sq =
+                                            cl->cutoffs[i]+cl->cutoffs[j];
+                                        c_sq *= c_sq;
+                                        inside_cutoff = abs_dr_sq < c_sq;
+                                    }
+                                    else if (cl->ncutoffdims == 2 &&
+                                             ntypes == 1 && cl->types) {
+                                        npy_int ti = cl->types[i];
+                                        npy_int tj = cl->types[j];
+                                        if (ti < cl->ncutoffs &&
+                                            tj < cl->ncutoffs) {
+                                            double c_sq = cl->cutoffs_sq[
+                                                ti*cl->ncutoffs+tj];
+                                            inside_cutoff = abs_dr_sq < c_sq;
+                                        }
+                                    }
+
+                                    /* An atom interacting with its own
+                                       periodic image appears twice in the
+                                       full list, with shift S and -S. The
+                                       half list keeps the image with the
+                                       lexicographically positive shift. For
+                                       i == j, the bin offset (x, y, z) has
+                                       the sign of the shift. */
+                                    if (inside_cutoff && cl->half && i == j) {
+                                        inside_cutoff = x > 0 ||
+                                            (x == 0 && (y > 0 ||
+                                                        (y == 0 && z > 0)));
+                                    }
+
+                                    if (inside_cutoff) {
+                                        npy_intp n = buf->nneigh;
+
+                                        if (n >= buf->neighsize &&
+                                            !neighbour_buffer_grow(buf))
+                                            return false;
+
+                                        if (buf->first)
+                                            buf->first[n] = i;
+                                        if (buf->secnd)
+                                            buf->secnd[n] = j;
+                                        if (buf->distvec && buf->single) {
+                                            npy_float *D = buf->distvec;
+                                            D[3*n+0] = dr[0];
+                                            D[3*n+1] = dr[1];
+                                            D[3*n+2] = dr[2];
+                                        }
+                                        else if (buf->distvec) {
+                                            npy_double *D = buf->distvec;
+                                            D[3*n+0] = dr[0];
+                                            D[3*n+1] = dr[1];
+                                            D[3*n+2] = dr[2];
+                                        }
+                                        if (buf->absdist && buf->single)
+                                            ((npy_float *) buf->absdist)[n] =
+                                                sqrt(abs_dr_sq);
+                                        else if (buf->absdist)
+                                            ((npy_double *) buf->absdist)[n] =
+                                                sqrt(abs_dr_sq);
+                                        if (buf->shift) {
+                                            buf->shift[3*n+0] =
+                                                (ci01 - cj1 + x)/n1;
+                                            buf->shift[3*n+1] =
+                                                (ci02 - cj2 + y)/n2;
+                                            buf->shift[3*n+2] =
+                                                (ci03 - cj3 + z)/n3;
+                                        }
+
+                                        buf->nneigh++;
+                                    }
+
+                                }
+                            }
+
+                            j = cl->next[j];
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+    return true;
+}
+
+/*
+ * Neighbours of an atom sorted by second atom index, used to look up pairs by
+ * bisection.
+ */
+
+typedef struct {
+    npy_int j, p;
+} pair_index_t;
+
+static int
+compare_pair_index(const void *a, const void *b)
+{
+    const pair_index_t *pa = (const pair_index_t *) a;
+    const pair_index_t *pb = (const pair_index_t *) b;
+    if (pa->j != pb->j)  return pa->j < pb->j ? -1 : 1;
+    /* Ties are sorted by pair index, i.e. we find the first matching pair */
+    if (pa->p != pb->p)  return pa->p < pb->p ? -1 : 1;
+    return 0;
+}
+
+/*
+ * Index of the reverse pair j-i for each pair i-j of a full neighbour list
+ * that is sorted by first atom index. A pair may occur multiple times in small
+ * periodic cells, hence the reverse pair is identified by the opposite shift
+ * vector in the periodic directions.
+ */
+
+static bool
+find_reverse_pairs(npy_intp nat, npy_intp nneigh, const npy_int *first,
+                   const npy_int *secnd, const npy_int *shift,
+                   const npy_bool *pbc, int nthreads, npy_int *reverse)
+{
+    npy_intp a, n;
+
+    npy_intp *seed = (npy_intp *) calloc(nat+1, sizeof(npy_intp));
+    pair_index_t *sorted = (pair_index_t *) malloc(nneigh*
+                                                   sizeof(pair_index_t));
+    if (!seed || !sorted) {
+        if (seed)  free(seed);
+        if (sorted)  free(sorted);
+        PyErr_SetString(PyExc_RuntimeError, "Failed to allocate reverse pair "
+                                            "arrays.");
+        return false;
+    }
+
+    /* Start of the neighbours of each atom */
+    for (n = 0; n < nneigh; n++)  seed[first[n]+1]++;
+    for (a = 0; a < nat; a++)  seed[a+1] += seed[a];
+
+    for (n = 0; n < nneigh; n++) {
+        sorted[n].j = secnd[n];
+        sorted[n].p = n;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+#pragma omp parallel num_threads(nthreads) if(nthreads > 1)
+#endif
+    {
+#ifdef _OPENMP
+#pragma omp for schedule(dynamic, 64)
+#endif
+        for (a = 0; a < nat; a++) {
+            if (seed[a+1] - seed[a] > 1)
+                qsort(&sorted[seed[a]], seed[a+1] - seed[a],
+                      sizeof(pair_index_t), compare_pair_index);
+        }
+
+#ifdef _OPENMP
+#pragma omp for schedule(static)
+#endif
+        for (n = 0; n < nneigh; n++) {
+            npy_int i = first[n], j = secnd[n];
+
+            /* Bisection for the first pair j-i */
+            npy_intp lo = seed[j], hi = seed[j+1];
+            while (lo < hi) {
+                npy_intp mid = lo + (hi - lo)/2;
+                if (sorted[mid].j < i)  lo = mid + 1;
+                else  hi = mid;
             }
-            for (i = 0; i < ncutoffs*ncutoffs; i++) {
-                cutoff = max(cutoff, cutoffs[i]);
-                cutoffs_sq[i] = cutoffs[i]*cutoffs[i];
+
+            reverse[n] = -1;
+            for (; lo < seed[j+1] && sorted[lo].j == i; lo++) {
+                npy_int m = sorted[lo].p;
+                if ((!pbc[0] || shift[3*m+0] == -shift[3*n+0]) &&
+                    (!pbc[1] || shift[3*m+1] == -shift[3*n+1]) &&
+                    (!pbc[2] || shift[3*m+2] == -shift[3*n+2])) {
+                    reverse[n] = m;
+                    break;
+                }
             }
         }
     }
+    Py_END_ALLOW_THREADS
+
+    free(seed);
+    free(sorted);
+    return true;
+}
+
+/*
+ * Convert the cutoff argument, either a float, per-atom radii or a matrix of
+ * cutoffs between types. On return, cutoff holds the largest cutoff.
+ * *py_arr holds a reference to the cutoff array (or NULL) and *cutoffs_sq
+ * the squared cutoff matrix, which must be freed by the caller.
+ */
 
+static bool
+parse_cutoffs(PyObject *py_cutoffs, npy_intp nat, PyObject **py_arr,
+              double *cutoff, npy_intp *ncutoffdims, npy_intp *ncutoffs,
+              double **cutoffs, double **cutoffs_sq)
+{
+    npy_intp i;
+
+    *py_arr = NULL;
+    *ncutoffdims = 0;
+    *ncutoffs = 1;
+    *cutoffs = NULL;
+    *cutoffs_sq = NULL;
+    if (PyFloat_Check(py_cutoffs)) {
+        *cutoff = PyFloat_AsDouble(py_cutoffs);
+        return true;
+    }
+
+    /* This must be an array of cutoffs */
+    *py_arr = PyArray_FROMANY(py_cutoffs, NPY_DOUBLE, 1, 2, NPY_C_CONTIGUOUS);
+    if (!*py_arr)  return false;
+    *ncutoffdims = PyArray_NDIM((PyArrayObject *) *py_arr);
+    *ncutoffs = PyArray_DIM((PyArrayObject *) *py_arr, 0);
+    *cutoffs = PyArray_DATA((PyArrayObject *) *py_arr);
+    *cutoff = 0.0;
+    if (*ncutoffdims == 1) {
+        if (*ncutoffs != nat) {
+            PyErr_SetString(PyExc_TypeError, "One-dimensional cutoff array "
+                            "must have length that corresponds to position "
+                            "array.");
+            return false;
+        }
+        for (i = 0; i < nat; i++) {
+            *cutoff = max(*cutoff, 2*(*cutoffs)[i]);
+        }
+    }
+    else {
+        if (PyArray_DIM((PyArrayObject *) *py_arr, 1) != *ncutoffs) {
+            PyErr_SetString(PyExc_TypeError, "Two-dimensional cutoff array "
+                            "must be square.");
+            return false;
+        }
+        *cutoffs_sq = malloc((*ncutoffs)*(*ncutoffs)*sizeof(double));
+        if (!*cutoffs_sq) {
+            PyErr_SetString(PyExc_RuntimeError, "Failed to allocate "
+                                                "cutoffs_sq array.");
+            return false;
+        }
+        for (i = 0; i < (*ncutoffs)*(*ncutoffs); i++) {
+            *cutoff = max(*cutoff, (*cutoffs)[i]);
+            (*cutoffs_sq)[i] = (*cutoffs)[i]*(*cutoffs)[i];
+        }
+    }
+    return true;
+}
+
+/*
+ * Convert the string of requested quantities to flags
+ */
+
+static bool
+parse_quantities(const char *quantities, bool half, int *flags)
+{
+    int i = 0;
+
+    *flags = 0;
+    while (quantities[i] != '\0') {
+        switch (quantities[i]) {
+        case 'i':
+            *flags |= Q_FIRST;
+            break;
+        case 'j':
+            *flags |= Q_SECND;
+            break;
+        case 'D':
+            *flags |= Q_DISTVEC;
+            break;
+        case 'd':
+            *flags |= Q_ABSDIST;
+            break;
+        case 'S':
+            *flags |= Q_SHIFT;
+            break;
+        case 'R':
+            *flags |= Q_REVERSE;
+            break;
+        default:
+            PyErr_SetString(PyExc_ValueError,
+                            "Unsupported quantity specified.");
+            return false;
+        }
+        i++;
+    }
+
+    /* Reverse pairs are found from first and second index and shift */
+    if (*flags & Q_REVERSE) {
+        if (half) {
+            PyErr_SetString(PyExc_ValueError, "Reverse pairs are not "
+                            "available for a half neighbour list.");
+            return false;
+        }
+        *flags |= Q_FIRST | Q_SECND | Q_SHIFT;
+    }
+    return true;
+}
+
+/*
+ * Return an array with dims[0] entries for quantity q. If the dictionary
+ * py_out (which may be NULL) holds an array for this quantity with at least
+ * dims[0] entries, a view on its leading entries is returned. Otherwise, a
+ * new array is allocated.
+ */
+
+static PyObject *
+output_array(PyObject *py_out, const char *q, int nd, npy_intp *dims,
+             int typenum)
+{
+    PyObject *py_arr = NULL;
+    if (py_out)  py_arr = PyDict_GetItemString(py_out, q);
+    if (py_arr && py_arr != Py_None) {
+        PyArrayObject *arr = (PyArrayObject *) py_arr;
+        if (!PyArray_Check(py_arr) ||
+            !PyArray_EquivTypenums(PyArray_TYPE(arr), typenum) ||
+            PyArray_NDIM(arr) != nd ||
+            (nd == 2 && PyArray_DIM(arr, 1) != dims[1]) ||
+            !PyArray_IS_C_CONTIGUOUS(arr) || !PyArray_ISWRITEABLE(arr)) {
+            PyErr_Format(PyExc_TypeError, "Output array for quantity '%s' "
+                         "has wrong data type, shape or memory layout.", q);
+            return NULL;
+        }
+        if (PyArray_DIM(arr, 0) >= dims[0])
+            return PySequence_GetSlice(py_arr, 0, dims[0]);
+    }
+    return PyArray_EMPTY(nd, dims, typenum, 0);
+}
+
+/*
+ * Neighbour list quantities as numpy arrays
+ */
+
+typedef struct {
+    PyObject *first, *secnd, *distvec, *absdist, *shift, *reverse;
+} neighbour_arrays_t;
+
+/*
+ * Concatenate the neighbour buffers into the arrays of arr. The buffers are
+ * freed. If offsets is not NULL, it receives the position of the first pair
+ * of each buffer in the final arrays and the total number of pairs as its
+ * last (nbuffers-th) entry.
+ */
+
+static bool
+neighbour_arrays_concatenate(neighbour_arrays_t *arr, npy_intp nbuffers,
+                             neighbour_buffer_t *buffers, int flags,
+                             bool single, PyObject *py_out, npy_intp *offsets)
+{
+    int realtype = single ? NPY_FLOAT : NPY_DOUBLE;
+    size_t realsize = single ? sizeof(npy_float) : sizeof(npy_double);
+    npy_intp ibuf;
+
+    /* Offsets of the individual buffers in the final neighbour list */
+    npy_intp nneigh = 0;
+    for (ibuf = 0; ibuf < nbuffers; ibuf++) {
+        npy_intp n = buffers[ibuf].nneigh;
+        buffers[ibuf].nneigh = nneigh;
+        if (offsets)  offsets[ibuf] = nneigh;
+        nneigh += n;
+    }
+    if (offsets)  offsets[nbuffers] = nneigh;
+
+    /* Allocate final arrays */
+    npy_intp dims[2] = { nneigh, 3 };
+    if (flags & Q_FIRST) {
+        arr->first = output_array(py_out, "i", 1, dims, NPY_INT);
+        if (!arr->first)  return false;
+    }
+    if (flags & Q_SECND) {
+        arr->secnd = output_array(py_out, "j", 1, dims, NPY_INT);
+        if (!arr->secnd)  return false;
+    }
+    if (flags & Q_DISTVEC) {
+        arr->distvec = output_array(py_out, "D", 2, dims, realtype);
+        if (!arr->distvec)  return false;
+    }
+    if (flags & Q_ABSDIST) {
+        arr->absdist = output_array(py_out, "d", 1, dims, realtype);
+        if (!arr->absdist)  return false;
+    }
+    if (flags & Q_SHIFT) {
+        arr->shift = output_array(py_out, "S", 2, dims, NPY_INT);
+        if (!arr->shift)  return false;
+    }
+
+    /* Concatenate buffers */
+    for (ibuf = 0; ibuf < nbuffers; ibuf++) {
+        neighbour_buffer_t *buf = &buffers[ibuf];
+        npy_intp offset = buf->nneigh;
+        npy_intp n = (ibuf+1 < nbuffers ? buffers[ibuf+1].nneigh : nneigh)
+            - offset;
+
+        if (arr->first)
+            memcpy((npy_int *) PyArray_DATA((PyArrayObject *) arr->first)
+                   + offset, buf->first, n*sizeof(npy_int));
+        if (arr->secnd)
+            memcpy((npy_int *) PyArray_DATA((PyArrayObject *) arr->secnd)
+                   + offset, buf->secnd, n*sizeof(npy_int));
+        if (arr->distvec)
+            memcpy((char *) PyArray_DATA((PyArrayObject *) arr->distvec)
+                   + 3*offset*realsize, buf->distvec, 3*n*realsize);
+        if (arr->absdist)
+            memcpy((char *) PyArray_DATA((PyArrayObject *) arr->absdist)
+                   + offset*realsize, buf->absdist, n*realsize);
+        if (arr->shift)
+            memcpy((npy_int *) PyArray_DATA((PyArrayObject *) arr->shift)
+                   + 3*offset, buf->shift, 3*n*sizeof(npy_int));
+        neighbour_buffer_free(buf);
+    }
+
+    return true;
+}
+
+/*
+ * Return the requested quantities in a tuple. The tuple starts with
+ * nprepend empty slots that can be filled by the caller.
+ */
+
+static PyObject *
+neighbour_arrays_tuple(neighbour_arrays_t *arr, const char *quantities,
+                       int nprepend)
+{
+    PyObject *py_ret = PyTuple_New(nprepend + strlen(quantities));
+    if (!py_ret)  return NULL;
+
+    int i = 0;
+    while (quantities[i] != '\0') {
+        PyObject *py_quantity = NULL;
+        switch (quantities[i]) {
+        case 'i':
+            py_quantity = arr->first;
+            break;
+        case 'j':
+            py_quantity = arr->secnd;
+            break;
+        case 'D':
+            py_quantity = arr->distvec;
+            break;
+        case 'd':
+            py_quantity = arr->absdist;
+            break;
+        case 'S':
+            py_quantity = arr->shift;
+            break;
+        case 'R':
+            py_quantity = arr->reverse;
+            break;
+        }
+        /* The same quantity may be requested more than once */
+        Py_INCREF(py_quantity);
+        PyTuple_SET_ITEM(py_ret, nprepend + i, py_quantity);
+        i++;
+    }
+    return py_ret;
+}
+
+static void
+neighbour_arrays_release(neighbour_arrays_t *arr)
+{
+    Py_XDECREF(arr->first);
+    Py_XDECREF(arr->secnd);
+    Py_XDECREF(arr->distvec);
+    Py_XDECREF(arr->absdist);
+    Py_XDECREF(arr->shift);
+    Py_XDECREF(arr->reverse);
+    memset(arr, 0, sizeof(neighbour_arrays_t));
+}
+
+/*
+ * Common arguments of neighbour_list and neighbour_list_batch
+ */
+
+static bool
+parse_options(PyObject *py_num_threads, PyObject *py_half,
+              PyObject *py_single, int *nthreads, bool *half, bool *single)
+{
+    /* Number of threads, default is to use OpenMP default */
+    *nthreads = 1;
+#ifdef _OPENMP
+    *nthreads = omp_get_max_threads();
+#endif
+    if (py_num_threads && py_num_threads != Py_None) {
+        long num_threads = PyLong_AsLong(py_num_threads);
+        if (PyErr_Occurred())  return false;
+        if (num_threads < 1) {
+            PyErr_SetString(PyExc_ValueError, "Number of threads must be "
+                                              "positive.");
+            return false;
+        }
+#ifdef _OPENMP
+        *nthreads = num_threads;
+#endif
+    }
+
+    /* Full or half neighbour list */
+    *half = false;
+    if (py_half) {
+        int is_true = PyObject_IsTrue(py_half);
+        if (is_true < 0)  return false;
+        *half = is_true;
+    }
+
+    /* Double or single precision distances */
+    *single = false;
+    if (py_single) {
+        int is_true = PyObject_IsTrue(py_single);
+        if (is_true < 0)  return false;
+        *single = is_true;
+    }
+    return true;
+}
+
+/*
+ * Neighbour list construction
+ */
+
+PyObject *
+py_neighbour_list(PyObject *self, PyObject *args)
+{
+    PyObject *py_cell_origin, *py_cell, *py_inv_cell, *py_pbc, *py_r;
+    PyObject *py_quantities, *py_cutoffs, *py_types = NULL;
+    PyObject *py_num_threads = NULL, *py_half = NULL, *py_single = NULL;
+    PyObject *py_out = NULL;
+#if PY_MAJOR_VERSION >= 3
+    PyObject *py_bquantities = NULL;
+#endif
+    double cutoff;
+
+    /* Cell subdivision */
+    cell_list_t cl;
+
+    /* Per-chunk neighbour buffers */
+    neighbour_buffer_t *buffers = NULL;
+    npy_intp ichunk, nchunks = 0;
+
+    /* Optional quantities to be computed */
+    neighbour_arrays_t arr;
+
+    memset(&cl, 0, sizeof(cell_list_t));
+    memset(&arr, 0, sizeof(neighbour_arrays_t));
+
+#if PY_MAJOR_VERSION >= 3
+    if (!PyArg_ParseTuple(args, "O!OOOOOO|OOOOO", &PyUnicode_Type,
+                          &py_quantities, &py_cell_origin, &py_cell,
+                          &py_inv_cell, &py_pbc, &py_r, &py_cutoffs, &py_types,
+                          &py_num_threads, &py_half, &py_single, &py_out))
+#else
+    if (!PyArg_ParseTuple(args, "O!OOOOOO|OOOOO", &PyString_Type,
+                          &py_quantities, &py_cell_origin, &py_cell,
+                          &py_inv_cell, &py_pbc, &py_r, &py_cutoffs, &py_types,
+                          &py_num_threads, &py_half, &py_single, &py_out))
+#endif
+        return NULL;
+
+    int nthreads;
+    bool half, single;
+    if (!parse_options(py_num_threads, py_half, py_single, &nthreads, &half,
+                       &single))
+        return NULL;
+
+    /* Preallocated output arrays */
+    if (py_out == Py_None)  py_out = NULL;
+    if (py_out && !PyDict_Check(py_out)) {
+        PyErr_SetString(PyExc_TypeError, "Output arrays must be passed as a "
+                                         "dictionary.");
+        return NULL;
+    }
+
+    /* Make sure our arrays are contiguous */
+    py_cell_origin = PyArray_FROMANY(py_cell_origin, NPY_DOUBLE, 1, 1,
+                                     NPY_C_CONTIGUOUS);
+    if (!py_cell_origin) return NULL;
+    py_cell = PyArray_FROMANY(py_cell, NPY_DOUBLE, 2, 2,
+                              NPY_C_CONTIGUOUS);
+    if (!py_cell) return NULL;
+    py_inv_cell = PyArray_FROMANY(py_inv_cell, NPY_DOUBLE, 2, 2,
+                                  NPY_C_CONTIGUOUS);
+    if (!py_inv_cell) return NULL;
+    py_pbc = PyArray_FROMANY(py_pbc, NPY_BOOL, 1, 1, NPY_C_CONTIGUOUS);
+    if (!py_pbc) return NULL;
+    py_r = PyArray_FROMANY(py_r, NPY_DOUBLE, 2, 2, NPY_C_CONTIGUOUS);
+    if (!py_r) return NULL;
+    if (py_types) {
+        py_types = PyArray_FROMANY(py_types, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+        if (!py_types) return NULL;
+    }
+
+    /* FIXME! Check array shapes. */
+    npy_intp nat = PyArray_DIM((PyArrayObject *) py_r, 0);
+
+    npy_intp ncutoffdims, ncutoffs;
+    npy_double *cutoffs;
+    double *cutoffs_sq = NULL;
+    if (!parse_cutoffs(py_cutoffs, nat, &py_cutoffs, &cutoff, &ncutoffdims,
+                       &ncutoffs, &cutoffs, &cutoffs_sq))
+        goto fail;
+
+    if (py_types && PyArray_DIM((PyArrayObject *) py_types, 0) != nat) {
+       PyErr_SetString(PyExc_TypeError, "Position and type arrays must have "
+                                        "identical first dimension.");
+       goto fail;
+    }
+
+    /* Get pointers to array data */
+    npy_double *cell_origin = PyArray_DATA((PyArrayObject *) py_cell_origin);
+    npy_double *cell = PyArray_DATA((PyArrayObject *) py_cell);
+    npy_double *inv_cell = PyArray_DATA((PyArrayObject *) py_inv_cell);
+    npy_bool *pbc = PyArray_DATA((PyArrayObject *) py_pbc);
+    npy_double *r = PyArray_DATA((PyArrayObject *) py_r);
+    npy_int *types = NULL;
+    if (py_types) types = PyArray_DATA((PyArrayObject *) py_types);
+
+    /* Cell subdivision */
+    const char *errmsg = NULL;
+    bool reduced_bins = false;
+    if (!cell_list_build(&cl, cell_origin, cell, inv_cell, pbc, nat, r, types,
+                         cutoff, ncutoffdims, ncutoffs, cutoffs, cutoffs_sq,
+                         half, &reduced_bins, &errmsg)) {
+        PyErr_SetString(PyExc_RuntimeError, errmsg);
+        goto fail;
+    }
+    if (reduced_bins &&
+        PyErr_WarnEx(NULL, REDUCED_BINS_WARNING, 1) < 0)  goto fail;
+
+#if PY_MAJOR_VERSION >= 3
+    py_bquantities = PyUnicode_AsASCIIString(py_quantities);
+    if (!py_bquantities) {
+        PyErr_SetString(PyExc_TypeError, "Conversion to ASCII string failed.");
+        goto fail;
+    }
+    char *quantities = PyBytes_AS_STRING(py_bquantities);
+#else
+    char *quantities = PyString_AsString(py_quantities);
+    if (!quantities) {
+        PyErr_SetString(PyExc_TypeError, "Conversion to string failed.");
+        goto fail;
+    }
+#endif
+    int flags;
+    if (!parse_quantities(quantities, half, &flags))  goto fail;
+
+    /* Split the atoms into contiguous chunks. Chunks are processed in
+       parallel, each into its own buffer. Since the chunks are concatenated
+       in order, the final list remains sorted by first atom index. Use more
+       chunks than threads for load balancing. */
+    nchunks = 1;
+    if (nthreads > 1)  nchunks = 8*nthreads;
+    if (nchunks > nat)  nchunks = nat;
+    if (nchunks < 1)  nchunks = 1;
+    buffers = (neighbour_buffer_t *) calloc(nchunks,
+                                            sizeof(neighbour_buffer_t));
+    if (!buffers) {
+        PyErr_SetString(PyExc_RuntimeError, "Failed to allocate neighbour "
+                                            "buffers.");
+        goto fail;
+    }
+    /* Initial guess for neighbour list size. If output arrays were passed,
+       their size is a better guess. */
+    npy_intp neighsize = max(nat/nchunks, 1);
+    if (py_out) {
+        PyObject *py_key, *py_arr;
+        Py_ssize_t pos = 0;
+        while (PyDict_Next(py_out, &pos, &py_key, &py_arr)) {
+            if (PyArray_Check(py_arr) &&
+                PyArray_NDIM((PyArrayObject *) py_arr) > 0) {
+                npy_intp n = PyArray_DIM((PyArrayObject *) py_arr, 0)/nchunks;
+                neighsize = max(neighsize, n+1);
+            }
+        }
+    }
+    for (ichunk = 0; ichunk < nchunks; ichunk++) {
+        if (!neighbour_buffer_alloc(&buffers[ichunk], flags, single,
+                                    neighsize)) {
+            PyErr_SetString(PyExc_RuntimeError, "Failed to allocate "
+                                                "neighbour buffers.");
+            goto fail;
+        }
+    }
+
+    /* Neighbour search proper, does not need the GIL */
+    int failed = 0;
+    Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+#pragma omp parallel for schedule(dynamic) num_threads(nthreads) if(nchunks > 1)
+#endif
+    for (ichunk = 0; ichunk < nchunks; ichunk++) {
+        if (!cell_list_search(&cl, ichunk*nat/nchunks, (ichunk+1)*nat/nchunks,
+                              &buffers[ichunk])) {
+#ifdef _OPENMP
+#pragma omp atomic write
+#endif
+            failed = 1;
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    if (failed) {
+        PyErr_SetString(PyExc_RuntimeError, "Failed to grow neighbour "
+                                            "buffers.");
+        goto fail;
+    }
+
+    /* Release cell subdivision information */
+    cell_list_free(&cl);
+    if (cutoffs_sq)  free(cutoffs_sq);
+    cutoffs_sq = NULL;
+
+    /* Collect the neighbours from all chunks */
+    if (!neighbour_arrays_concatenate(&arr, nchunks, buffers, flags, single,
+                                      py_out, NULL))
+        goto fail;
+    free(buffers);
+    buffers = NULL;
+
+    if (flags & Q_REVERSE) {
+        npy_intp nneigh = PyArray_DIM((PyArrayObject *) arr.first, 0);
+        arr.reverse = output_array(py_out, "R", 1, &nneigh, NPY_INT);
+        if (!arr.reverse)  goto fail;
+        if (!find_reverse_pairs(nat, nneigh,
+                                PyArray_DATA((PyArrayObject *) arr.first),
+                                PyArray_DATA((PyArrayObject *) arr.secnd),
+                                PyArray_DATA((PyArrayObject *) arr.shift),
+                                pbc, nthreads,
+                                PyArray_DATA((PyArrayObject *) arr.reverse)))
+            goto fail;
+    }
+
+    /* Build return tuple */
+    PyObject *py_ret = neighbour_arrays_tuple(&arr, quantities, 0);
+    if (!py_ret)  goto fail;
+    neighbour_arrays_release(&arr);
+    if (strlen(quantities) == 1) {
+        PyObject *py_tuple = py_ret;
+        py_ret = PyTuple_GET_ITEM(py_tuple, 0);
+        Py_INCREF(py_ret);
+        Py_DECREF(py_tuple);
+    }
+
+    /* Final cleanup */
+#if PY_MAJOR_VERSION >= 3
+    Py_DECREF(py_bquantities);
+#endif
+    Py_XDECREF(py_cutoffs);
+    Py_DECREF(py_cell_origin);
+    Py_DECREF(py_cell);
+    Py_DECREF(py_inv_cell);
+    Py_DECREF(py_pbc);
+    Py_DECREF(py_r);
+    Py_XDECREF(py_types);
+
+    return py_ret;
+
+    fail:
+    /* Cleanup. Sorry for the goto. */
+#if PY_MAJOR_VERSION >= 3
+    Py_XDECREF(py_bquantities);
+#endif
+    Py_XDECREF(py_cutoffs);
+    Py_XDECREF(py_cell_origin);
+    Py_XDECREF(py_cell);
+    Py_XDECREF(py_inv_cell);
+    Py_XDECREF(py_pbc);
+    Py_XDECREF(py_r);
+    Py_XDECREF(py_types);
+
+    cell_list_free(&cl);
+    if (cutoffs_sq)  free(cutoffs_sq);
+    if (buffers) {
+        for (ichunk = 0; ichunk < nchunks; ichunk++)
+            neighbour_buffer_free(&buffers[ichunk]);
+        free(buffers);
+    }
+    neighbour_arrays_release(&arr);
+    return NULL;
+}
+
+/*
+ * Neighbour lists for a sequence of frames with identical atoms
+ */
+
+PyObject *
+py_neighbour_list_batch(PyObject *self, PyObject *args)
+{
+    PyObject *py_cell_origin, *py_cell, *py_inv_cell, *py_pbc, *py_r;
+    PyObject *py_quantities, *py_cutoffs, *py_types = NULL;
+    PyObject *py_num_threads = NULL, *py_half = NULL, *py_single = NULL;
+#if PY_MAJOR_VERSION >= 3
+    PyObject *py_bquantities = NULL;
+#endif
+    PyObject *py_offsets = NULL;
+    double cutoff;
+
+    /* Per-frame neighbour buffers */
+    neighbour_buffer_t *buffers = NULL;
+    npy_intp iframe, nframes = 0;
+
+    /* Optional quantities to be computed */
+    neighbour_arrays_t arr;
+
+    memset(&arr, 0, sizeof(neighbour_arrays_t));
+
+#if PY_MAJOR_VERSION >= 3
+    if (!PyArg_ParseTuple(args, "O!OOOOOO|OOOO", &PyUnicode_Type,
+                          &py_quantities, &py_cell_origin, &py_cell,
+                          &py_inv_cell, &py_pbc, &py_r, &py_cutoffs, &py_types,
+                          &py_num_threads, &py_half, &py_single))
+#else
+    if (!PyArg_ParseTuple(args, "O!OOOOOO|OOOO", &PyString_Type,
+                          &py_quantities, &py_cell_origin, &py_cell,
+                          &py_inv_cell, &py_pbc, &py_r, &py_cutoffs, &py_types,
+                          &py_num_threads, &py_half, &py_single))
+#endif
+        return NULL;
+
+    int nthreads;
+    bool half, single;
+    if (!parse_options(py_num_threads, py_half, py_single, &nthreads, &half,
+                       &single))
+        return NULL;
+
+    /* Make sure our arrays are contiguous */
+    py_cell_origin = PyArray_FROMANY(py_cell_origin, NPY_DOUBLE, 2, 2,
+                                     NPY_C_CONTIGUOUS);
+    if (!py_cell_origin) return NULL;
+    py_cell = PyArray_FROMANY(py_cell, NPY_DOUBLE, 3, 3, NPY_C_CONTIGUOUS);
+    if (!py_cell) return NULL;
+    py_inv_cell = PyArray_FROMANY(py_inv_cell, NPY_DOUBLE, 3, 3,
+                                  NPY_C_CONTIGUOUS);
+    if (!py_inv_cell) return NULL;
+    py_pbc = PyArray_FROMANY(py_pbc, NPY_BOOL, 1, 1, NPY_C_CONTIGUOUS);
+    if (!py_pbc) return NULL;
+    py_r = PyArray_FROMANY(py_r, NPY_DOUBLE, 3, 3, NPY_C_CONTIGUOUS);
+    if (!py_r) return NULL;
+    if (py_types) {
+        py_types = PyArray_FROMANY(py_types, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+        if (!py_types) return NULL;
+    }
+
+    nframes = PyArray_DIM((PyArrayObject *) py_r, 0);
+    npy_intp nat = PyArray_DIM((PyArrayObject *) py_r, 1);
+
+    npy_intp ncutoffdims, ncutoffs;
+    npy_double *cutoffs;
+    double *cutoffs_sq = NULL;
+    if (!parse_cutoffs(py_cutoffs, nat, &py_cutoffs, &cutoff, &ncutoffdims,
+                       &ncutoffs, &cutoffs, &cutoffs_sq))
+        goto fail;
+
+    if (PyArray_DIM((PyArrayObject *) py_r, 2) != 3 ||
+        PyArray_DIM((PyArrayObject *) py_cell_origin, 0) != nframes ||
+        PyArray_DIM((PyArrayObject *) py_cell_origin, 1) != 3 ||
+        PyArray_DIM((PyArrayObject *) py_cell, 0) != nframes ||
+        PyArray_DIM((PyArrayObject *) py_cell, 1) != 3 ||
+        PyArray_DIM((PyArrayObject *) py_cell, 2) != 3 ||
+        PyArray_DIM((PyArrayObject *) py_inv_cell, 0) != nframes ||
+        PyArray_DIM((PyArrayObject *) py_inv_cell, 1) != 3 ||
+        PyArray_DIM((PyArrayObject *) py_inv_cell, 2) != 3 ||
+        PyArray_DIM((PyArrayObject *) py_pbc, 0) != 3) {
+        PyErr_SetString(PyExc_TypeError, "Positions must have shape "
+                        "(nframes, nat, 3), cell origins (nframes, 3) and "
+                        "cells (nframes, 3, 3).");
+        goto fail;
+    }
     if (py_types && PyArray_DIM((PyArrayObject *) py_types, 0) != nat) {
        PyErr_SetString(PyExc_TypeError, "Position and type arrays must have "
-                                        "identical first dimension.");
+                                        "identical number of atoms.");
        goto fail;
     }
 
     /* Get pointers to array data */
     npy_double *cell_origin = PyArray_DATA((PyArrayObject *) py_cell_origin);
     npy_double *cell = PyArray_DATA((PyArrayObject *) py_cell);
-    npy_double *cell1 = &cell[0], *cell2 = &cell[3], *cell3 = &cell[6];
     npy_double *inv_cell = PyArray_DATA((PyArrayObject *) py_inv_cell);
     npy_bool *pbc = PyArray_DATA((PyArrayObject *) py_pbc);
     npy_double *r = PyArray_DATA((PyArrayObject *) py_r);
     npy_int *types = NULL;
     if (py_types) types = PyArray_DATA((PyArrayObject *) py_types);
 
-    /* Compute vectors to opposite face */
-    double norm1[3], norm2[3], norm3[3];
-    cross_product(cell2, cell3, norm1);
-    cross_product(cell3, cell1, norm2);
-    cross_product(cell1, cell2, norm3);
-    double volume = fabs(cell3[0]*norm3[0] + cell3[1]*norm3[1] + cell3[2]*norm3[2]);
-
-    if (volume < 1e-12) {
-        PyErr_SetString(PyExc_RuntimeError, "Zero cell volume.");
-        goto fail;
-    }
-
-    double len1 = normsq(norm1), len2 = normsq(norm2), len3 = normsq(norm3);
-    int i;
-    for (i = 0; i < 3; i++) {
-        norm1[i] *= volume/(len1*len1);
-        norm2[i] *= volume/(len2*len2);
-        norm3[i] *= volume/(len3*len3);
-    }
-
-    /* Compute distance of cell faces */
-    len1 = volume/len1;
-    len2 = volume/len2;
-    len3 = volume/len3;
-
-    /* Number of cells for cell subdivision */
-    int n1 = max((int) floor(len1/cutoff), 1);
-    int n2 = max((int) floor(len2/cutoff), 1);
-    int n3 = max((int) floor(len3/cutoff), 1);
-
-    /* Avoid overflow in total number of cells */
-    bool warned = false;
-    while (((double)n1)*n2*n3 > INT_MAX) {
-      if (!warned) {
-        PyErr_WarnEx(NULL, "Ratio of simulation cell size to cutoff is very "
-                     "large; reducing number of bins for neighbour list "
-                     "search, but this may be slow. Are you using a cell with "
-                     "lots of vacuum?", 1);
-        warned = true;
-      }
-      n1 /= 2; if (n1 <= 0) n1 = 1;
-      n2 /= 2; if (n2 <= 0) n2 = 1;
-      n3 /= 2; if (n3 <= 0) n3 = 1;
-    }
-
-    assert(n1 > 0);
-    assert(n2 > 0);
-    assert(n3 > 0);
-
-    /* Find out over how many neighbor cells we need to loop (if the box is
-       small */
-    int nx = (int) ceil(cutoff*n1/len1);
-    int ny = (int) ceil(cutoff*n2/len2);
-    int nz = (int) ceil(cutoff*n3/len3);
-
-    /* Sort particles into bins */
-    int ncells = n1*n2*n3;
-    seed = (int *) malloc(ncells*sizeof(int));
-    if (!seed) {
-        PyErr_SetString(PyExc_RuntimeError, "Failed to allocate seed array.");
-        goto fail;
-    }
-    last = (int *) malloc(ncells*sizeof(int));
-    if (!last) {
-        PyErr_SetString(PyExc_RuntimeError, "Failed to allocate last array.");
-        goto fail;
-    }
-    for (i = 0; i < ncells; i++)  seed[i] = -1;
-    next = (int *) malloc(nat*sizeof(int));
-    if (!next) {
-        PyErr_SetString(PyExc_RuntimeError, "Failed to allocate next array.");
-        goto fail;
-    }
-    for (i = 0; i < nat; i++) {
-        /* Get cell index */
-        int c1, c2, c3;
-        position_to_cell_index(cell_origin, inv_cell, &r[3*i], n1, n2, n3,
-                               &c1, &c2, &c3);
-
-        /* Periodic/non-periodic boundary conditions */
-        if (pbc[0])  c1 = bin_wrap(c1, n1);  else  c1 = bin_trunc(c1, n1);
-        if (pbc[1])  c2 = bin_wrap(c2, n2);  else  c2 = bin_trunc(c2, n2);
-        if (pbc[2])  c3 = bin_wrap(c3, n3);  else  c3 = bin_trunc(c3, n3);
-
-        /* Continuous cell index */
-        int ci = c1+n1*(c2+n2*c3);
-
-        assert(c1 >= 0 && c1 < n1);
-        assert(c2 >= 0 && c2 < n2);
-        assert(c3 >= 0 && c3 < n3);
-        assert(ci >= 0 && ci < ncells);
-
-        /* Put atom into appropriate bin */
-        if (seed[ci] < 0) {
-            next[i] = -1;
-            seed[ci] = i;
-            last[ci] = i;
-        }
-        else {
-            next[i] = -1;
-            next[last[ci]] = i;
-            last[ci] = i;
-        }
-    }
-    free(last);
-
-    /* Neighbour list counter and size */
-    npy_intp nneigh = 0; /* Number of neighbours found */
-    npy_intp neighsize = nat; /* Initial guess for neighbour list size */
-
-    npy_int *first = NULL, *secnd = NULL, *shift = NULL;
-    npy_double *distvec = NULL, *absdist = NULL;
-
 #if PY_MAJOR_VERSION >= 3
-    PyObject *py_bquantities = PyUnicode_AsASCIIString(py_quantities);
+    py_bquantities = PyUnicode_AsASCIIString(py_quantities);
     if (!py_bquantities) {
         PyErr_SetString(PyExc_TypeError, "Conversion to ASCII string failed.");
         goto fail;
@@ -330,285 +1543,109 @@ py_neighbour_list(PyObject *self, PyObject *args)
         goto fail;
     }
 #endif
-    i = 0;
-    npy_intp dims[2] = { neighsize, 3 };
-    while (quantities[i] != '\0') {
-        switch (quantities[i]) {
-        case 'i':
-            py_first = PyArray_ZEROS(1, dims, NPY_INT, 0);
-            first = PyArray_DATA((PyArrayObject *) py_first);
-            break;
-        case 'j':
-            py_secnd = PyArray_ZEROS(1, dims, NPY_INT, 0);
-            secnd = PyArray_DATA((PyArrayObject *) py_secnd);
-            break;
-        case 'D':
-            py_distvec = PyArray_ZEROS(2, dims, NPY_DOUBLE, 0);
-            distvec = PyArray_DATA((PyArrayObject *) py_distvec);
-            break;
-        case 'd':
-            py_absdist = PyArray_ZEROS(1, dims, NPY_DOUBLE, 0);
-            absdist = PyArray_DATA((PyArrayObject *) py_absdist);
-            break;
-        case 'S':
-            py_shift = PyArray_ZEROS(2, dims, NPY_INT, 0);
-            shift = PyArray_DATA((PyArrayObject *) py_shift);
-            break;
-        default:
-            PyErr_SetString(PyExc_ValueError,
-                            "Unsupported quantity specified.");
-            goto fail;
-        }
-        i++;
+    int flags;
+    if (!parse_quantities(quantities, half, &flags))  goto fail;
+
+    buffers = (neighbour_buffer_t *) calloc(max(nframes, 1),
+                                            sizeof(neighbour_buffer_t));
+    if (!buffers) {
+        PyErr_SetString(PyExc_RuntimeError, "Failed to allocate neighbour "
+                                            "buffers.");
+        goto fail;
     }
 
-    /* We need the square of the cutoff */
-    double cutoff_sq = cutoff*cutoff;
+    /* Frames are independent and processed in parallel, each into its own
+       buffer. This does not need the GIL. */
+    const char *errmsg = NULL;
+    int reduced_bins = 0;
+    Py_BEGIN_ALLOW_THREADS
+#ifdef _OPENMP
+#pragma omp parallel for schedule(dynamic) num_threads(nthreads) if(nframes > 1)
+#endif
+    for (iframe = 0; iframe < nframes; iframe++) {
+        cell_list_t cl;
+        const char *msg = NULL;
+        bool reduced = false;
+
+        if (!neighbour_buffer_alloc(&buffers[iframe], flags, single,
+                                    max(nat, 1))) {
+            msg = "Failed to allocate neighbour buffers.";
+        }
+        else if (!cell_list_build(&cl, &cell_origin[3*iframe],
+                                  &cell[9*iframe], &inv_cell[9*iframe], pbc,
+                                  nat, &r[3*nat*iframe], types, cutoff,
+                                  ncutoffdims, ncutoffs, cutoffs, cutoffs_sq,
+                                  half, &reduced, &msg)) {
+            cell_list_free(&cl);
+        }
+        else {
+            if (!cell_list_search(&cl, 0, nat, &buffers[iframe]))
+                msg = "Failed to grow neighbour buffers.";
+            cell_list_free(&cl);
+        }
 
-    /* We need the shape of the bin */
-    double bin1[3], bin2[3], bin3[3];
-    for (i = 0; i < 3; i++) {
-        bin1[i] = cell1[i]/n1;
-        bin2[i] = cell2[i]/n2;
-        bin3[i] = cell3[i]/n3;
+        if (reduced) {
+#ifdef _OPENMP
+#pragma omp atomic write
+#endif
+            reduced_bins = 1;
+        }
+        if (msg) {
+#ifdef _OPENMP
+#pragma omp critical
+#endif
+            errmsg = msg;
+        }
     }
+    Py_END_ALLOW_THREADS
 
-    /* Loop over atoms */
-    for (i = 0; i < nat; i++) {
-        double *ri = &r[3*i];
-
-        int ci01, ci02, ci03;
-        position_to_cell_index(cell_origin, inv_cell, ri, n1, n2, n3,
-                               &ci01, &ci02, &ci03);
-
-        /* Truncate if non-periodic and outside of simulation domain */
-        int ci1, ci2, ci3;
-        if (!pbc[0])  ci1 = bin_trunc(ci01, n1);  else  ci1 = ci01;
-        if (!pbc[1])  ci2 = bin_trunc(ci02, n2);  else  ci2 = ci02;
-        if (!pbc[2])  ci3 = bin_trunc(ci03, n3);  else  ci3 = ci03;
-
-        /* dri is the position relative to the lower left corner of the bin */
-        double dri[3];
-        dri[0] = ri[0] - ci1*bin1[0] - ci2*bin2[0] - ci3*bin3[0];
-        dri[1] = ri[1] - ci1*bin1[1] - ci2*bin2[1] - ci3*bin3[1];
-        dri[2] = ri[2] - ci1*bin1[2] - ci2*bin2[2] - ci3*bin3[2];
-
-        /* Apply periodic boundary conditions */
-        if (pbc[0])  ci1 = bin_wrap(ci01, n1);  else  ci1 = bin_trunc(ci01, n1);
-        if (pbc[1])  ci2 = bin_wrap(ci02, n2);  else  ci2 = bin_trunc(ci02, n2);
-        if (pbc[2])  ci3 = bin_wrap(ci03, n3);  else  ci3 = bin_trunc(ci03, n3);
-
-        /* Loop over neighbouring bins */
-        int x, y, z;
-        for (z = -nz; z <= nz; z++) {
-            int cj3 = ci3 + z;
-            if (pbc[2])  cj3 = bin_wrap(cj3, n3);
-
-            /* Skip to next z value if cell is out of simulation bounds */
-            if (cj3 < 0 || cj3 >= n3)  continue;
-
-            cj3 = bin_trunc(cj3, n3);
-            int ncj3 = n2*cj3;
-
-            double off3[3];
-            off3[0] = z*bin3[0];
-            off3[1] = z*bin3[1];
-            off3[2] = z*bin3[2];
-
-            for (y = -ny; y <= ny; y++) {
-                int cj2 = ci2 + y;
-                if (pbc[1])  cj2 = bin_wrap(cj2, n2);
-
-                /* Skip to next y value if cell is out of simulation bounds */
-                if (cj2 < 0 || cj2 >= n2)  continue;
-
-                cj2 = bin_trunc(cj2, n2);
-                int ncj2 = n1*(cj2 + ncj3);
-
-                double off2[3];
-                off2[0] = off3[0] + y*bin2[0];
-                off2[1] = off3[1] + y*bin2[1];
-                off2[2] = off3[2] + y*bin2[2];
-
-                for (x = -nx; x <= nx; x++) {
-                    /* Bin index of neighbouring bin */
-                    int cj1 = ci1 + x;
-                    if (pbc[0])  cj1 = bin_wrap(cj1, n1);
-
-                    /* Skip to next x value if cell is out of simulation bounds
-                     */
-                    if (cj1 < 0 || cj1 >= n1)  continue;
-
-                    cj1 = bin_trunc(cj1, n1);
-                    int ncj = cj1 + ncj2;
-
-                    assert(ncj == cj1+n1*(cj2+n2*cj3));
-
-                    /* Offset of the neighboring bins */
-                    double off[3];
-                    off[0] = off2[0] + x*bin1[0];
-                    off[1] = off2[1] + x*bin1[1];
-                    off[2] = off2[2] + x*bin1[2];
-
-                    /* Loop over all atoms in neighbouring bin */
-                    int j = seed[ncj];
-                    while (j >= 0) {
-                        if (i != j || x != 0 || y != 0 || z != 0) {
-                            double *rj = &r[3*j];
-
-                            int cj1, cj2, cj3;
-                            position_to_cell_index(cell_origin, inv_cell, rj,
-                                                   n1, n2, n3,
-                                                   &cj1, &cj2, &cj3);
-
-                            /* Truncate if non-periodic and outside of
-                               simulation domain. */
-                            if (!pbc[0])  cj1 = bin_trunc(cj1, n1);
-                            if (!pbc[1])  cj2 = bin_trunc(cj2, n2);
-                            if (!pbc[2])  cj3 = bin_trunc(cj3, n3);
-
-                            /* drj is position relative to lower
-                               left corner of the bin */
-                            double drj[3];
-                            drj[0] = rj[0] - cj1*bin1[0] - cj2*bin2[0] -
-                                cj3*bin3[0];
-                            drj[1] = rj[1] - cj1*bin1[1] - cj2*bin2[1] -
-                                cj3*bin3[1];
-                            drj[2] = rj[2] - cj1*bin1[2] - cj2*bin2[2] -
-                                cj3*bin3[2];
-
-                            /* Compute distance between atoms */
-                            double dr[3];
-                            dr[0] = drj[0] - dri[0] + off[0];
-                            dr[1] = drj[1] - dri[1] + off[1];
-                            dr[2] = drj[2] - dri[2] + off[2];
-                            double abs_dr_sq = dr[0]*dr[0] + dr[1]*dr[1] +
-                                dr[2]*dr[2];
-
-                            if (abs_dr_sq < cutoff_sq) {
-                                bool inside_cutoff = true;
-                                if (ncutoffdims == 1) {
-                                    double c_sq = cutoffs[i]+cutoffs[j];
-                                    c_sq *= c_sq;
-                                    inside_cutoff = abs_dr_sq < c_sq;
-                                }
-                                else if (ncutoffdims == 2 && types) {
-                                    if (types[i] < ncutoffs &&
-                                        types[j] < ncutoffs){
-                                        double c_sq =
-                                            cutoffs_sq[types[i]*ncutoffs+
-                                                       types[j]];
-                                        inside_cutoff = abs_dr_sq < c_sq;
-                                    }
-                                }
-
-                                if (inside_cutoff) {
-
-                                    if (nneigh >= neighsize) {
-                                        neighsize *= 2;
-
-                                        if (py_first &&
-                                            !(first = resize_array(py_first,
-                                                                   neighsize)))
-                                            goto fail;
-                                        if (py_secnd &&
-                                            !(secnd = resize_array(py_secnd,
-                                                                   neighsize)))
-                                            goto fail;
-                                        if (py_distvec &&
-                                            !(distvec = resize_array(
-                                                py_distvec, neighsize)))
-                                            goto fail;
-                                        if (py_absdist &&
-                                            !(absdist = resize_array(
-                                                py_absdist, neighsize)))
-                                            goto fail;
-                                        if (py_shift &&
-                                            !(shift = resize_array(py_shift,
-                                                                   neighsize)))
-                                            goto fail;
-                                    }
-
-                                    if (py_first)
-                                        first[nneigh] = i;
-                                    if (py_secnd)
-                                        secnd[nneigh] = j;
-                                    if (py_distvec) {
-                                        distvec[3*nneigh+0] = dr[0];
-                                        distvec[3*nneigh+1] = dr[1];
-                                        distvec[3*nneigh+2] = dr[2];
-                                    }
-                                    if (py_absdist)
-                                        absdist[nneigh] = sqrt(abs_dr_sq);
-                                    if (py_shift) {
-                                        shift[3*nneigh+0] = (ci01 - cj1 + x)/n1;
-                                        shift[3*nneigh+1] = (ci02 - cj2 + y)/n2;
-                                        shift[3*nneigh+2] = (ci03 - cj3 + z)/n3;
-                                    }
-
-                                    nneigh++;
-                                }
-
-                            }
-                        }
-
-                        j = next[j];
-                    }
-                }
-            }
-        }
+    if (errmsg) {
+        PyErr_SetString(PyExc_RuntimeError, errmsg);
+        goto fail;
     }
+    if (reduced_bins &&
+        PyErr_WarnEx(NULL, REDUCED_BINS_WARNING, 1) < 0)  goto fail;
 
-    /* Release cell subdivision information */
-    free(seed);
-    free(next);
     if (cutoffs_sq)  free(cutoffs_sq);
-
-    seed = NULL;
-    next = NULL;
     cutoffs_sq = NULL;
 
-    /* Resize arrays to actual size of neighbour list */
-    if (py_first && !resize_array(py_first, nneigh))  goto fail;
-    if (py_secnd && !resize_array(py_secnd, nneigh))  goto fail;
-    if (py_distvec && !resize_array(py_distvec, nneigh))  goto fail;
-    if (py_absdist && !resize_array(py_absdist, nneigh))  goto fail;
-    if (py_shift && !resize_array(py_shift, nneigh))  goto fail;
-
-    /* Build return tuple */
-    PyObject *py_ret = PyTuple_New(strlen(quantities));
-    i = 0;
-    while (quantities[i] != '\0') {
-        switch (quantities[i]) {
-        case 'i':
-            PyTuple_SetItem(py_ret, i, py_first);
-            break;
-        case 'j':
-            PyTuple_SetItem(py_ret, i, py_secnd);
-            break;
-        case 'D':
-            PyTuple_SetItem(py_ret, i, py_distvec);
-            break;
-        case 'd':
-            PyTuple_SetItem(py_ret, i, py_absdist);
-            break;
-        case 'S':
-            PyTuple_SetItem(py_ret, i, py_shift);
-            break;
-        default:
-            PyErr_SetString(PyExc_ValueError,
-                            "Unsupported quantity specified.");
-            goto fail;
+    /* Concatenate frames */
+    npy_intp noffsets = nframes+1;
+    py_offsets = PyArray_EMPTY(1, &noffsets, NPY_INTP, 0);
+    if (!py_offsets)  goto fail;
+    npy_intp *offsets = PyArray_DATA((PyArrayObject *) py_offsets);
+    if (!neighbour_arrays_concatenate(&arr, nframes, buffers, flags, single,
+                                      NULL, offsets))
+        goto fail;
+    free(buffers);
+    buffers = NULL;
+
+    /* Reverse pairs, reported as index into the concatenated list */
+    if (flags & Q_REVERSE) {
+        arr.reverse = PyArray_EMPTY(1, &offsets[nframes], NPY_INT, 0);
+        if (!arr.reverse)  goto fail;
+        npy_int *first = PyArray_DATA((PyArrayObject *) arr.first);
+        npy_int *secnd = PyArray_DATA((PyArrayObject *) arr.secnd);
+        npy_int *shift = PyArray_DATA((PyArrayObject *) arr.shift);
+        npy_int *reverse = PyArray_DATA((PyArrayObject *) arr.reverse);
+        for (iframe = 0; iframe < nframes; iframe++) {
+            npy_intp n, n0 = offsets[iframe], n1 = offsets[iframe+1];
+            if (!find_reverse_pairs(nat, n1-n0, &first[n0], &secnd[n0],
+                                    &shift[3*n0], pbc, nthreads,
+                                    &reverse[n0]))
+                goto fail;
+            for (n = n0; n < n1; n++) {
+                if (reverse[n] >= 0)  reverse[n] += n0;
+            }
         }
-        i++;
-    }
-    if (strlen(quantities) == 1) {
-        PyObject *py_tuple = py_ret;
-        py_ret = PyTuple_GET_ITEM(py_tuple, 0);
-        Py_INCREF(py_ret);
-        Py_DECREF(py_tuple);
     }
 
+    /* Build return tuple, offsets are the first entry */
+    PyObject *py_ret = neighbour_arrays_tuple(&arr, quantities, 1);
+    if (!py_ret)  goto fail;
+    PyTuple_SET_ITEM(py_ret, 0, py_offsets);
+    neighbour_arrays_release(&arr);
+
     /* Final cleanup */
 #if PY_MAJOR_VERSION >= 3
     Py_DECREF(py_bquantities);
@@ -634,16 +1671,16 @@ py_neighbour_list(PyObject *self, PyObject *args)
     Py_XDECREF(py_inv_cell);
     Py_XDECREF(py_pbc);
     Py_XDECREF(py_r);
-    Py_DECREF(py_types);
+    Py_XDECREF(py_types);
+    Py_XDECREF(py_offsets);
 
-    if (seed)  free(seed);
-    if (next)  free(next);
     if (cutoffs_sq)  free(cutoffs_sq);
-    Py_XDECREF(py_first);
-    Py_XDECREF(py_secnd);
-    Py_XDECREF(py_distvec);
-    Py_XDECREF(py_absdist);
-    Py_XDECREF(py_shift);
+    if (buffers) {
+        for (iframe = 0; iframe < nframes; iframe++)
+            neighbour_buffer_free(&buffers[iframe]);
+        free(buffers);
+    }
+    neighbour_arrays_release(&arr);
     return NULL;
 }
 
@@ -706,6 +1743,55 @@ py_first_neighbours(PyObject *self, PyObject *args)
     return py_seed;
 }
 
+/*
+ * Lookup of the pair j-k for a triplet i-j-k. The neighbours of each atom are
+ * sorted by the second atom index, such that the pair can be found by
+ * bisection.
+ */
+static bool
+find_jk_pairs(npy_intp nat, const npy_int *fi, npy_intp npairs,
+              const npy_int *j_p, npy_intp ntrip, const npy_int *ij_t,
+              const npy_int *ik_t, npy_int *jk_t)
+{
+    npy_intp a, p, t;
+
+    pair_index_t *sorted = (pair_index_t *) malloc(npairs*
+                                                   sizeof(pair_index_t));
+    if (!sorted) {
+        PyErr_SetString(PyExc_RuntimeError, "Failed to allocate pair index "
+                                            "array.");
+        return false;
+    }
+    for (p = 0; p < npairs; p++) {
+        sorted[p].j = j_p[p];
+        sorted[p].p = p;
+    }
+    for (a = 0; a < nat; a++) {
+        npy_intp s = max(fi[a], 0), e = fi[a+1];
+        if (e - s > 1)
+            qsort(&sorted[s], e - s, sizeof(pair_index_t), compare_pair_index);
+    }
+
+    for (t = 0; t < ntrip; t++) {
+        npy_int j = j_p[ij_t[t]], k = j_p[ik_t[t]];
+        jk_t[t] = -1;
+        if (j < 0 || j >= nat)  continue;
+
+        /* Bisection for the first pair with second index k */
+        npy_intp lo = max(fi[j], 0), hi = fi[j+1];
+        while (lo < hi) {
+            npy_intp mid = lo + (hi - lo)/2;
+            if (sorted[mid].j < k)  lo = mid + 1;
+            else  hi = mid;
+        }
+        if (lo < fi[j+1] && sorted[lo].j == k)
+            jk_t[t] = sorted[lo].p;
+    }
+
+    free(sorted);
+    return true;
+}
+
 /*
  * Python wrapper for triplet list calculation
  */
@@ -714,60 +1800,69 @@ PyObject *
 py_triplet_list(PyObject *self, PyObject *args)
 {
     /* parse python args */
-    PyObject *py_fi, *py_absdist = NULL, *py_cutoff = NULL;
+    PyObject *py_fi, *py_absdist = NULL, *py_cutoff = NULL, *py_j_p = NULL;
+    PyObject *py_ij_t = NULL, *py_ik_t = NULL, *py_jk_t = NULL;
     npy_double *absdist = NULL;
 
-    if (!PyArg_ParseTuple(args, "O|OO", &py_fi, &py_absdist, &py_cutoff)) {
+    if (!PyArg_ParseTuple(args, "O|OOO", &py_fi, &py_absdist, &py_cutoff,
+                          &py_j_p)) {
         return NULL;
     }
+    if (py_absdist == Py_None)  py_absdist = NULL;
+    if (py_cutoff == Py_None)  py_cutoff = NULL;
+    if (py_j_p == Py_None)  py_j_p = NULL;
 
-
-    npy_int *fi = NULL, *ij_t = NULL, *ik_t = NULL, *jk_t = NULL;
+    npy_int *fi = NULL, *ij_t = NULL, *ik_t = NULL, *j_p = NULL;
 
     py_fi = PyArray_FROMANY(py_fi, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+    if (!py_fi) return NULL;
     fi = PyArray_DATA((PyArrayObject *) py_fi);
 
-    if (!fi) return NULL;
-
     double cutoff = DBL_MAX;
 
     if (py_cutoff || py_absdist) {
         if (!py_absdist || !py_cutoff) {
-    	    PyErr_SetString(PyExc_TypeError, "Cutoff and distances must "
-                                                    "be specified together.");
-    	    return NULL;
-    	}
+            PyErr_SetString(PyExc_TypeError, "Cutoff and distances must "
+                                             "be specified together.");
+            py_absdist = NULL;
+            goto fail;
+        }
+        if (!PyFloat_Check(py_cutoff)) {
+            PyErr_SetString(PyExc_NotImplementedError, "Cutoff must be a "
+                                                       "single float.");
+            py_absdist = NULL;
+            goto fail;
+        }
+        cutoff = PyFloat_AsDouble(py_cutoff);
         py_absdist = PyArray_FROMANY(py_absdist, NPY_DOUBLE,
-				         1, 1, NPY_C_CONTIGUOUS);
-       	if (!py_absdist) {
+                                     1, 1, NPY_C_CONTIGUOUS);
+        if (!py_absdist) {
             PyErr_SetString(PyExc_TypeError, "Distances must be an "
                                              "array of floats.");
-            return NULL;
-	    }
-    	absdist = PyArray_DATA((PyArrayObject *) py_absdist);
-        // absdist_length = (int) PyArray_SIZE(py_absdist);
-    	if (PyFloat_Check(py_cutoff)) {
-        	cutoff = PyFloat_AsDouble(py_cutoff);
-        	py_cutoff = NULL;
-   	    }
-    	else {
-            PyErr_SetString(PyExc_NotImplementedError, "Cutoff must be a single "
-                                             "float.");
-            return NULL;
-    	}
+            goto fail;
+        }
+        absdist = PyArray_DATA((PyArrayObject *) py_absdist);
+    }
+
+    if (py_j_p) {
+        py_j_p = PyArray_FROMANY(py_j_p, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+        if (!py_j_p)  goto fail;
+        j_p = PyArray_DATA((PyArrayObject *) py_j_p);
     }
 
     /* guess initial triplet list size */
-    npy_intp dim = (int) PyArray_SIZE(py_fi);
+    npy_intp dim = (int) PyArray_SIZE((PyArrayObject *) py_fi);
     dim *= 2;
 
     /* initialize triplet lists */
-    PyObject *py_ij_t = PyArray_ZEROS(1, &dim, NPY_INT, 0);
+    py_ij_t = PyArray_ZEROS(1, &dim, NPY_INT, 0);
+    if (!py_ij_t)  goto fail;
     ij_t = PyArray_DATA((PyArrayObject *) py_ij_t);
-    PyObject *py_ik_t = PyArray_ZEROS(1, &dim, NPY_INT, 0);
+    py_ik_t = PyArray_ZEROS(1, &dim, NPY_INT, 0);
+    if (!py_ik_t)  goto fail;
     ik_t = PyArray_DATA((PyArrayObject *) py_ik_t);
 
-    int init_length = (int) PyArray_SIZE(py_fi);
+    int init_length = (int) PyArray_SIZE((PyArrayObject *) py_fi);
 
     /* compute the triplet list */
     int index_trip = 0;
@@ -775,56 +1870,67 @@ py_triplet_list(PyObject *self, PyObject *args)
         for (int ij= fi[r]; ij < fi[r+1]; ij++) {
             for (int ik = fi[r]; ik < fi[r+1]; ik++) {
                 /* resize array if necessary */
-                int length_trip = (int) PyArray_SIZE(py_ij_t);
+                int length_trip = (int) PyArray_SIZE((PyArrayObject *) py_ij_t);
                 if (index_trip >= length_trip) {
                     length_trip *= 2;
-                    if (py_ij_t && !(ij_t = resize_array(py_ij_t, length_trip)))
+                    if (!(ij_t = resize_array(py_ij_t, length_trip)))
                         goto fail;
-                    if (py_ik_t && !(ik_t = resize_array(py_ik_t, length_trip)))
+                    if (!(ik_t = resize_array(py_ik_t, length_trip)))
                         goto fail;
                 }
-        		if ((ij != ik)) {
-        		    if (absdist) { 
-            		    if ((absdist[ij] >= cutoff) || (absdist[ik] >= cutoff)) {
-        			        continue; 
-        			    };
-        		    }
-               	    ij_t[index_trip] = ij;
+                if ((ij != ik)) {
+                    if (absdist) {
+                        if ((absdist[ij] >= cutoff) || (absdist[ik] >= cutoff)) {
+                            continue;
+                        };
+                    }
+                    ij_t[index_trip] = ij;
                     ik_t[index_trip++] = ik;
-        	    }
+                }
             }
         }
     }
 
     /* set final array sizes of the triplet lists */
-    if (py_ij_t && !(ij_t = resize_array(py_ij_t, index_trip))) goto fail;
-    if (py_ik_t && !(ik_t = resize_array(py_ik_t, index_trip))) goto fail;
-
-    npy_intp d1 = (int) PyArray_SIZE(py_ij_t);
-    PyObject *py_jk_t = PyArray_ZEROS(1, &d1, NPY_INT, 0);
-    jk_t = PyArray_DATA((PyArrayObject *) py_jk_t);
-    index_trip++;
+    if (!(ij_t = resize_array(py_ij_t, index_trip))) goto fail;
+    if (!(ik_t = resize_array(py_ik_t, index_trip))) goto fail;
+
+    /* find the pair j-k for each triplet */
+    if (j_p) {
+        npy_intp npairs = PyArray_SIZE((PyArrayObject *) py_j_p);
+        if (init_length > 0 && fi[init_length-1] > npairs) {
+            PyErr_SetString(PyExc_TypeError, "Pair list is shorter than "
+                                             "indicated by first neighbours.");
+            goto fail;
+        }
+        npy_intp ntrip = index_trip;
+        py_jk_t = PyArray_ZEROS(1, &ntrip, NPY_INT, 0);
+        if (!py_jk_t)  goto fail;
+        if (!find_jk_pairs(init_length - 1, fi, npairs, j_p, ntrip, ij_t, ik_t,
+                           PyArray_DATA((PyArrayObject *) py_jk_t)))
+            goto fail;
+    }
 
-    // TODO: ask Lars and/or use an ordered j_n list
-    /*for (int t = 0; t < index_trip; t++) {
-    	int ij = ij_t[t];
-	int ik = ik_t[t];
-	continue;
-    } */
+    Py_DECREF(py_fi);
+    Py_XDECREF(py_absdist);
+    Py_XDECREF(py_j_p);
 
     /* create return tuple */
-    PyObject *py_ret = PyTuple_New(2);
+    PyObject *py_ret = PyTuple_New(py_jk_t ? 3 : 2);
     PyTuple_SetItem(py_ret, 0, py_ij_t);
     PyTuple_SetItem(py_ret, 1, py_ik_t);
+    if (py_jk_t)  PyTuple_SetItem(py_ret, 2, py_jk_t);
 
     return py_ret;
 
     fail:
     /* Cleanup */
-    if (py_fi)  Py_DECREF(py_fi);
-    if (py_cutoff)  Py_DECREF(py_cutoff);
-    if (py_ij_t)  Py_DECREF(py_ij_t);
-    if (py_ik_t)  Py_DECREF(py_ik_t);
+    Py_XDECREF(py_fi);
+    Py_XDECREF(py_absdist);
+    Py_XDECREF(py_j_p);
+    Py_XDECREF(py_ij_t);
+    Py_XDECREF(py_ik_t);
+    Py_XDECREF(py_jk_t);
     return NULL;
 }
 
@@ -867,3 +1973,114 @@ py_get_jump_indicies(PyObject *self, PyObject *args)
 
     return py_seed;
 }
+
+/*
+ * Common neighbours of pairs of atoms. For each pair (i1, j1) in the range
+ * [n0, n1) of the neighbour list, list all pairs (i2, j1) with the same j1.
+ * j_order sorts the neighbour list by second index and first_j points to the
+ * first entry of each j in the sorted list.
+ */
+
+PyObject *
+py_find_common_neighbours(PyObject *self, PyObject *args)
+{
+    PyObject *py_i_n, *py_j_n, *py_j_order, *py_first_j;
+    PyObject *py_cnl_i1_i2 = NULL, *py_cnl_j1 = NULL;
+    PyObject *py_nl_index_i1_j1 = NULL, *py_nl_index_i2_j1 = NULL;
+    npy_intp n0, n1, n, nrows, nat;
+
+    if (!PyArg_ParseTuple(args, "OOOOnn", &py_i_n, &py_j_n, &py_j_order,
+                          &py_first_j, &n0, &n1))
+        return NULL;
+
+    /* Make sure our arrays are contiguous */
+    py_i_n = PyArray_FROMANY(py_i_n, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+    py_j_n = PyArray_FROMANY(py_j_n, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+    py_j_order = PyArray_FROMANY(py_j_order, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+    py_first_j = PyArray_FROMANY(py_first_j, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+    if (!py_i_n || !py_j_n || !py_j_order || !py_first_j)  goto fail;
+
+    npy_intp npairs = PyArray_SIZE((PyArrayObject *) py_i_n);
+    nat = PyArray_SIZE((PyArrayObject *) py_first_j) - 1;
+    if (PyArray_SIZE((PyArrayObject *) py_j_n) != npairs ||
+        PyArray_SIZE((PyArrayObject *) py_j_order) != npairs) {
+        PyErr_SetString(PyExc_TypeError, "Neighbour list arrays must have "
+                                         "identical length.");
+        goto fail;
+    }
+    if (n0 < 0 || n1 > npairs || n0 > n1) {
+        PyErr_SetString(PyExc_ValueError, "Range of pairs out of bounds.");
+        goto fail;
+    }
+
+    npy_int *i_n = PyArray_DATA((PyArrayObject *) py_i_n);
+    npy_int *j_n = PyArray_DATA((PyArrayObject *) py_j_n);
+    npy_int *j_order = PyArray_DATA((PyArrayObject *) py_j_order);
+    npy_int *first_j = PyArray_DATA((PyArrayObject *) py_first_j);
+
+    /* Count rows */
+    nrows = 0;
+    for (n = n0; n < n1; n++) {
+        npy_int j1 = j_n[n];
+        if (j1 < 0 || j1 >= nat) {
+            PyErr_SetString(PyExc_ValueError, "Atom index out of bounds.");
+            goto fail;
+        }
+        nrows += first_j[j1+1] - first_j[j1];
+    }
+
+    npy_intp dims[2] = { nrows, 2 };
+    py_cnl_i1_i2 = PyArray_ZEROS(2, dims, NPY_INT, 0);
+    py_cnl_j1 = PyArray_ZEROS(1, dims, NPY_INT, 0);
+    py_nl_index_i1_j1 = PyArray_ZEROS(1, dims, NPY_INT, 0);
+    py_nl_index_i2_j1 = PyArray_ZEROS(1, dims, NPY_INT, 0);
+    if (!py_cnl_i1_i2 || !py_cnl_j1 || !py_nl_index_i1_j1 ||
+        !py_nl_index_i2_j1)  goto fail;
+
+    npy_int *cnl_i1_i2 = PyArray_DATA((PyArrayObject *) py_cnl_i1_i2);
+    npy_int *cnl_j1 = PyArray_DATA((PyArrayObject *) py_cnl_j1);
+    npy_int *nl_index_i1_j1 = PyArray_DATA((PyArrayObject *) py_nl_index_i1_j1);
+    npy_int *nl_index_i2_j1 = PyArray_DATA((PyArrayObject *) py_nl_index_i2_j1);
+
+    /* Fill rows, one block per pair (i1, j1) */
+    Py_BEGIN_ALLOW_THREADS
+    npy_intp row = 0;
+    for (n = n0; n < n1; n++) {
+        npy_int i1 = i_n[n], j1 = j_n[n];
+        npy_int k;
+        for (k = first_j[j1]; k < first_j[j1+1]; k++, row++) {
+            npy_int m = j_order[k];
+            nl_index_i1_j1[row] = n;
+            cnl_j1[row] = j1;
+            nl_index_i2_j1[row] = m;
+            cnl_i1_i2[2*row] = i1;
+            cnl_i1_i2[2*row+1] = i_n[m];
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    Py_DECREF(py_i_n);
+    Py_DECREF(py_j_n);
+    Py_DECREF(py_j_order);
+    Py_DECREF(py_first_j);
+
+    /* create return tuple */
+    PyObject *py_ret = PyTuple_New(4);
+    PyTuple_SetItem(py_ret, 0, py_cnl_i1_i2);
+    PyTuple_SetItem(py_ret, 1, py_cnl_j1);
+    PyTuple_SetItem(py_ret, 2, py_nl_index_i1_j1);
+    PyTuple_SetItem(py_ret, 3, py_nl_index_i2_j1);
+
+    return py_ret;
+
+    fail:
+    Py_XDECREF(py_i_n);
+    Py_XDECREF(py_j_n);
+    Py_XDECREF(py_j_order);
+    Py_XDECREF(py_first_j);
+    Py_XDECREF(py_cnl_i1_i2);
+    Py_XDECREF(py_cnl_j1);
+    Py_XDECREF(py_nl_index_i1_j1);
+    Py_XDECREF(py_nl_index_i2_j1);
+    return NULL;
+}
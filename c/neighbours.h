@@ -34,9 +34,11 @@ extern "C" {
  * Neighbour list construction
  */
 PyObject *py_neighbour_list(PyObject *self, PyObject *args);
+PyObject *py_neighbour_list_batch(PyObject *self, PyObject *args);
 PyObject *py_first_neighbours(PyObject *self, PyObject *args);
 PyObject *py_triplet_list(PyObject *self, PyObject *args);
 PyObject *py_get_jump_indicies(PyObject *self, PyObject *args);
+PyObject *py_find_common_neighbours(PyObject *self, PyObject *args);
 
 /*
  * Construct seed array that points to start of rows
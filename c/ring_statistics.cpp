@@ -31,6 +31,10 @@
 #include <array>
 #include <vector>
 
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
 #include "neighbours.h"
 #include "tools.h"
 
@@ -221,12 +225,133 @@ public:
 };
 
 
+/*
+ * Distances on the graph from a dense distance map computed by
+ * distances_on_graph
+ */
+class DenseDistances {
+public:
+    DenseDistances(int nat, const int *dist) : nat_(nat), dist_(dist) { }
+
+    /* Distances of all vertices from the root vertex */
+    const int *from_root(int root) { return &dist_[nat_*root]; }
+
+    /* Distance between two vertices, which is at most maxdist */
+    int between(int i, int j, int maxdist) { return dist_[nat_*i+j]; }
+
+private:
+    int nat_;
+    const int *dist_;
+};
+
+
+/*
+ * Breadth-first search from a single vertex that stops at a maximum depth.
+ * Vertices that have not been reached have distance -1. Memory is linear in
+ * the number of vertices and the cost of each search is proportional to the
+ * number of vertices reached.
+ */
+class TruncatedBFS {
+public:
+    TruncatedBFS(int nat) : dist_(nat, -1), source_(-1), depth_(0) { }
+
+    void run(const int *seed, const int *neighbours, int source, int depth) {
+        for (auto v: visited_)  dist_[v] = -1;
+        visited_.clear();
+
+        dist_[source] = 0;
+        visited_.push_back(source);
+        for (std::vector<int>::size_type k = 0; k < visited_.size(); k++) {
+            int i = visited_[k];
+            if (depth >= 0 && dist_[i] >= depth)  continue;
+            for (int ni = seed[i]; ni < seed[i+1]; ni++) {
+                int j = neighbours[ni];
+                if (dist_[j] < 0) {
+                    dist_[j] = dist_[i]+1;
+                    visited_.push_back(j);
+                }
+            }
+        }
+
+        source_ = source;
+        depth_ = depth;
+    }
+
+    /* Check if a previous search can be reused */
+    bool covers(int source, int depth) {
+        return source == source_ && (depth_ < 0 || (depth >= 0 && depth <= depth_));
+    }
+
+    const int *dist() const { return dist_.data(); }
+
+private:
+    std::vector<int> dist_, visited_;
+    int source_, depth_;
+};
+
+
+/*
+ * Distances on the graph computed on demand by breadth-first searches that
+ * are truncated at half the maximum ring length. Distances from the root
+ * vertex are needed for all vertices visited by the walkers, distances
+ * between two ring vertices are at most half the ring size.
+ */
+class OnDemandDistances {
+public:
+    OnDemandDistances(int nat, const int *seed, const int *neighbours,
+                      int maxlength) :
+        seed_(seed), neighbours_(neighbours), root_bfs_(nat), pair_bfs_(nat),
+        root_depth_(maxlength < 0 ? -1 : maxlength/2+1) { }
+
+    const int *from_root(int root) {
+        root_bfs_.run(seed_, neighbours_, root, root_depth_);
+        return root_bfs_.dist();
+    }
+
+    int between(int i, int j, int maxdist) {
+        if (!pair_bfs_.covers(i, maxdist))
+            pair_bfs_.run(seed_, neighbours_, i, maxdist);
+        return pair_bfs_.dist()[j];
+    }
+
+private:
+    const int *seed_, *neighbours_;
+    TruncatedBFS root_bfs_, pair_bfs_;
+    int root_depth_;
+};
+
+
+/*
+ * Rings are searched starting from each edge root-b with root < b, in the
+ * order of the neighbour list. An edge is not walked again once a search
+ * has started from it, such that every ring is found only once. This
+ * function determines whether edge i-j (entry ni of the neighbour list) has
+ * been visited before the search starting at entry nroot of the root vertex.
+ * The status follows from the order of the searches, hence the searches of
+ * different roots are independent.
+ */
+static inline bool
+edge_done(int i, int ni, int j, int root, int nroot,
+          const int *seed, const int *neighbours)
+{
+    if (i == j)  return false;
+    int lo = std::min(i, j), hi = std::max(i, j);
+    if (lo != root)  return lo < root;
+    if (i == root)  return ni <= nroot;
+    /* Reverse edge, visited together with the first forward edge */
+    for (int k = seed[root]; k <= nroot; k++) {
+        if (neighbours[k] == hi)  return true;
+    }
+    return false;
+}
+
+
 bool
 step_away(std::vector<Walker> &new_walkers, Walker &walker,
-          int root, /* root vertex */
-          int nat, int *seed, int *neighbours, double *r, /* neighbour list */
-          int *dist, /* distance map */
-          std::vector<bool> &done, npy_intp maxlength)
+          int root, int nroot, /* root vertex and first edge */
+          const int *seed, const int *neighbours, const double *r, /* neighbour list */
+          const int *root_dist, /* distances from root */
+          npy_intp maxlength, const char **error)
 {
     /* Loop over neighbours of walker atom */
     int i = walker.vertex;
@@ -235,10 +360,11 @@ step_away(std::vector<Walker> &new_walkers, Walker &walker,
         /* Check if edge has already been visited or if
            vertex is identical to previous_vertices vertex of
            walker k. (This would be a reverse jump.) */
-        if (!done[ni] && j != walker.previous_vertex) {
+        if (!edge_done(i, ni, j, root, nroot, seed, neighbours) &&
+            j != walker.previous_vertex) {
             /* Did we jump farther away from the root
                vertex? */
-            if (dist[nat*root+j] == dist[nat*root+i]+1) {
+            if (root_dist[j] == root_dist[i]+1) {
                 /* Don't continue stepping further if we are already at half the
                    maximum ring length */
                 if (maxlength < 0) {
@@ -251,14 +377,13 @@ step_away(std::vector<Walker> &new_walkers, Walker &walker,
             }
             /* Did we either not change distance from root vertex or moved
                closer to root vertex? */
-            else if (dist[nat*root+j] == dist[nat*root+i] ||
-                     dist[nat*root+j] == dist[nat*root+i]-1) {
+            else if (root_dist[j] == root_dist[i] ||
+                     root_dist[j] == root_dist[i]-1) {
                 /* This is a jump back towards the root */
                 new_walkers.push_back(Walker(walker, -j, &r[3*ni]));
             }
             else {
-                PyErr_SetString(PyExc_RuntimeError, "Distance map and "
-                                "graph do not match.");
+                *error = "Distance map and graph do not match.";
                 return false;
             }
         }
@@ -268,12 +393,13 @@ step_away(std::vector<Walker> &new_walkers, Walker &walker,
 }
 
 
+template<typename D>
 bool
 step_closer(std::vector<Walker> &new_walkers, Walker &walker,
-            int root, /* root vertex */
-            int nat, int *seed, int *neighbours, double *r, /* neighbour list */
-            int *dist, /* distance map */
-            std::vector<bool> &done,
+            int root, int nroot, /* root vertex and first edge */
+            const int *seed, const int *neighbours, const double *r, /* neighbour list */
+            const int *root_dist, /* distances from root */
+            D &distances, /* distances between ring vertices */
             std::vector<npy_int> &ringstat,
             std::vector<std::vector<npy_int>> &ringenum)
 {
@@ -284,7 +410,8 @@ step_closer(std::vector<Walker> &new_walkers, Walker &walker,
         /* Check if edge has already been visited or if
            vertex is identical to previous_vertices vertex of
            walker k. (This would be a reverse jump.) */
-        if (!done[ni] && j != walker.previous_vertex) {
+        if (!edge_done(i, ni, j, root, nroot, seed, neighbours) &&
+            j != walker.previous_vertex) {
             /* Are we back to the root vertex? */
             if (j == root) {
                 auto droot = walker.distances_to_root_vertex.back();
@@ -307,12 +434,13 @@ step_closer(std::vector<Walker> &new_walkers, Walker &walker,
                        distance. Otherwise, there is a short ring that cuts
                        this one. */
                     int ring_size = walker.ring_size();
-                    for (int m = 0; m < ring_size; m++) {
-                        for (int n = m+1; n < ring_size; n++) {
+                    for (int m = 0; m < ring_size && is_sp; m++) {
+                        for (int n = m+1; n < ring_size && is_sp; n++) {
                             int dn = n-m;
                             if (dn > ring_size/2) dn = ring_size-dn;
-                            if (dist[nat*abs(walker.ring_vertices[n])+
-                                     abs(walker.ring_vertices[m])] != dn)
+                            if (distances.between(abs(walker.ring_vertices[m]),
+                                                  abs(walker.ring_vertices[n]),
+                                                  ring_size/2) != dn)
                                 is_sp = false;
                         }
                     }
@@ -323,19 +451,11 @@ step_closer(std::vector<Walker> &new_walkers, Walker &walker,
                         ringstat[walker.ring_size()]++;
 
                         ringenum.push_back(walker.rings());
-
-                        
-                        /*for (int iii=0; iii<walker.rings().size();iii++){
-                                cout << walker.rings()[iii];
-                                cout << ' ';
-                            }
-                        cout << '$' << walker.ring_size();
-                        cout << endl;*/
                     }
                 }
             }
             /* Did we jump closer to the root vertex? */
-            else if (dist[nat*root+j] == dist[nat*root+i]-1) {
+            else if (root_dist[j] == root_dist[i]-1) {
                 new_walkers.push_back(Walker(walker, -j, &r[3*ni]));
             }
             /* We discard this path if we jump away again. */
@@ -347,65 +467,55 @@ step_closer(std::vector<Walker> &new_walkers, Walker &walker,
 
 
 /*
- * Look for the "shortest path" ring starting at atom *at*,
- * look only for elements *f*
+ * Look for the "shortest path" rings that start at vertex *root* with an
+ * edge to a vertex with larger index
  */
+template<typename D>
 bool
-find_sp_ring_vertices(int nat, int *seed, int neighbours_size, int *neighbours,
-                      double *r, int *dist, int maxlength,
-                      std::vector<int> &ringstat, 
-                      std::vector<std::vector<int>> &ringenum)
+find_sp_ring_vertices_from_root(int root, const int *seed,
+                                const int *neighbours, const double *r,
+                                D &distances, int maxlength,
+                                std::vector<npy_int> &ringstat,
+                                std::vector<std::vector<npy_int>> &ringenum,
+                                const char **error)
 {
-    std::vector<bool> done(neighbours_size, false);
-
-    /* Loop over all vertices */
-    for (int a = 0; a < nat; a++) {
-        /* Loop over neighbours of vertex a, i.e. walk on graph */
-        for (int na = seed[a]; na < seed[a+1]; na++) {
-            int b = neighbours[na];
-
-            /* Only walk in one direction */
-            if (a < b) {
-                /* We have visited this site. Loop over neighbours of b and
-                   mark reverse jump as visited. */
-                done[na] = true;
-                for (int ni = seed[b]; ni < seed[b+1]; ni++) {
-                    if (neighbours[ni] == a) done[ni] = true;
-                }
-
-                /* Initialize Single walker on atom b coming from atom a. */
-                std::vector<Walker> *walkers = 
-                    new std::vector<Walker>(1, Walker(b, a, &r[3*na]));
-
-                /* Continue loop while there are walkers active. */
-                while (walkers->size() > 0) {
-                    std::vector<Walker> *new_walkers = 
-                        new std::vector<Walker>(0);
-
-                    /* Loop over all walkers and advance them. */
-                    for (auto walker: *walkers) {
-                        /* Walker walks away from root */
-                        if (walker.vertex > 0) {
-                            if (!step_away(*new_walkers, walker, a,
-                                           nat, seed, neighbours, r,
-                                           dist, done,
-                                           maxlength))
-                                return false;
-                        }
-                        /* Walker walks towards root */
-                        else {
-                            if (!step_closer(*new_walkers, walker, a,
-                                             nat, seed, neighbours, r,
-                                             dist, done,
-                                             ringstat, ringenum))
-                                return false;
-                        }
+    const int *root_dist = NULL;
+
+    /* Loop over neighbours of the root vertex, i.e. walk on graph */
+    for (int nroot = seed[root]; nroot < seed[root+1]; nroot++) {
+        int b = neighbours[nroot];
+
+        /* Only walk in one direction */
+        if (root < b) {
+            if (!root_dist)  root_dist = distances.from_root(root);
+
+            /* Initialize Single walker on atom b coming from the root. */
+            std::vector<Walker> walkers(1, Walker(b, root, &r[3*nroot]));
+
+            /* Continue loop while there are walkers active. */
+            while (walkers.size() > 0) {
+                std::vector<Walker> new_walkers;
+
+                /* Loop over all walkers and advance them. */
+                for (auto walker: walkers) {
+                    /* Walker walks away from root */
+                    if (walker.vertex > 0) {
+                        if (!step_away(new_walkers, walker, root, nroot,
+                                       seed, neighbours, r, root_dist,
+                                       maxlength, error))
+                            return false;
+                    }
+                    /* Walker walks towards root */
+                    else {
+                        if (!step_closer(new_walkers, walker, root, nroot,
+                                         seed, neighbours, r, root_dist,
+                                         distances, ringstat, ringenum))
+                            return false;
                     }
-
-                    /* Copy new walker list to old walker list */
-                    delete walkers;
-                    walkers = new_walkers;
                 }
+
+                /* Copy new walker list to old walker list */
+                walkers.swap(new_walkers);
             }
         }
     }
@@ -415,76 +525,201 @@ find_sp_ring_vertices(int nat, int *seed, int neighbours_size, int *neighbours,
 
 
 /*
- * Python wrapper
+ * Look for all "shortest path" rings. The search is parallelized over the
+ * root vertices, each thread obtains its distances from *make_distances*.
+ * Rings are enumerated in the order of their root vertex.
  */
-extern "C" PyObject *
-py_find_sp_rings(PyObject *self, PyObject *args)
+template<typename F>
+bool
+find_sp_ring_vertices(int nat, const int *seed, const int *neighbours,
+                      const double *r, int maxlength, int nthreads,
+                      F make_distances,
+                      std::vector<npy_int> &ringstat,
+                      std::vector<std::vector<npy_int>> *ringenum)
 {
-    PyObject *py_i, *py_j, *py_r, *py_dist;
-    npy_int maxlength = -1;
+    std::vector<std::vector<std::vector<npy_int>>> ringenum_n(ringenum ? nat : 0);
+    const char *error = NULL;
+    int failed = 0;
 
-    if (!PyArg_ParseTuple(args, "OOOO|i", &py_i, &py_j, &py_r, &py_dist,
-                          &maxlength))
-        return NULL;
+#pragma omp parallel num_threads(nthreads) if(nthreads > 1)
+    {
+        auto distances = make_distances();
+        std::vector<npy_int> ringstat_t;
+        std::vector<std::vector<npy_int>> ringenum_t;
+
+#pragma omp for schedule(dynamic, 16)
+        for (int a = 0; a < nat; a++) {
+            int stop;
+#pragma omp atomic read
+            stop = failed;
+            if (stop)  continue;
+
+            const char *error_t = NULL;
+            ringenum_t.clear();
+            if (!find_sp_ring_vertices_from_root(a, seed, neighbours, r,
+                                                 distances, maxlength,
+                                                 ringstat_t, ringenum_t,
+                                                 &error_t)) {
+#pragma omp critical
+                error = error_t;
+#pragma omp atomic write
+                failed = 1;
+            }
+            if (ringenum)  ringenum_n[a].swap(ringenum_t);
+        }
 
-    /* Make sure our arrays are contiguous */
-    py_i = PyArray_FROMANY(py_i, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
-    if (!py_i) return NULL;
-    py_j = PyArray_FROMANY(py_j, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
-    if (!py_j) return NULL;
-    py_r = PyArray_FROMANY(py_r, NPY_DOUBLE, 2, 2, NPY_C_CONTIGUOUS);
-    if (!py_r) return NULL;
-    py_dist = PyArray_FROMANY(py_dist, NPY_INT, 2, 2, NPY_C_CONTIGUOUS);
-    if (!py_dist) return NULL;
+#pragma omp critical
+        {
+            if (ringstat.size() < ringstat_t.size())
+                ringstat.resize(ringstat_t.size());
+            for (std::vector<npy_int>::size_type k = 0; k < ringstat_t.size(); k++)
+                ringstat[k] += ringstat_t[k];
+        }
+    }
+
+    if (failed) {
+        PyErr_SetString(PyExc_RuntimeError, error);
+        return false;
+    }
 
+    if (ringenum) {
+        for (auto &rings: ringenum_n) {
+            ringenum->insert(ringenum->end(), rings.begin(), rings.end());
+        }
+    }
+
+    return true;
+}
+
+
+/*
+ * Search rings in contiguous neighbour list arrays
+ */
+static bool
+find_sp_rings_in_arrays(PyObject *py_i, PyObject *py_j, PyObject *py_r,
+                        PyObject *py_dist, int maxlength, int nthreads,
+                        std::vector<npy_int> &ringstat,
+                        std::vector<std::vector<npy_int>> *ringenum)
+{
     /* Check array shapes. */
     npy_intp nneigh = PyArray_DIM((PyArrayObject *) py_i, 0);
     if (PyArray_DIM((PyArrayObject *) py_j, 0) != nneigh) {
         PyErr_SetString(PyExc_ValueError, "Array must have same length.");
-        return NULL;
+        return false;
     }
     if (PyArray_DIM((PyArrayObject *) py_r, 0) != nneigh) {
         PyErr_SetString(PyExc_ValueError, "Array must have same length.");
-        return NULL;
+        return false;
     }
     if (PyArray_DIM((PyArrayObject *) py_r, 1) != 3) {
         PyErr_SetString(PyExc_ValueError, "Distance array must have second "
                                           "dimension of length 3.");
-        return NULL;
+        return false;
     }
 
+    /* No bonds, no rings */
+    if (nneigh == 0)  return true;
+
     /* Get total number of atoms */
     npy_int *i = (npy_int *) PyArray_DATA(py_i);
     int nat = *std::max_element(i, i+nneigh)+1;
 
     /* Check shape of distance map */
-    if (PyArray_DIM((PyArrayObject *) py_dist, 0) != nat ||
-        PyArray_DIM((PyArrayObject *) py_dist, 1) != nat) {
-        /*
-        char errstr[1024];
-        sprintf(errstr, "Distance map has shape %" NPY_INTP_FMT " x %" 
-                NPY_INTP_FMT " while number of atoms is %i.",
-                PyArray_DIM((PyArrayObject *) py_dist, 0),
-                PyArray_DIM((PyArrayObject *) py_dist, 1),
-                nat);
-        PyErr_SetString(PyExc_ValueError, errstr);
-        */
+    if (py_dist && (PyArray_DIM((PyArrayObject *) py_dist, 0) != nat ||
+                    PyArray_DIM((PyArrayObject *) py_dist, 1) != nat)) {
         PyErr_SetString(PyExc_ValueError, "Distance map has wrong shape.");
-        return NULL;
+        return false;
     }
 
-    /* Construct seed array */
-    int seed[nat+1];
-    first_neighbours(nat, nneigh, i, seed);
+    /* Construct seed array, atoms without neighbours before the first
+       atom with neighbours have an empty range */
+    std::vector<int> seed(nat+1);
+    first_neighbours(nat, nneigh, i, seed.data());
+    for (int k = 0; k < nat && seed[k] < 0; k++)  seed[k] = 0;
+
+    const int *j = (const int *) PyArray_DATA(py_j);
+    const double *r = (const double *) PyArray_DATA(py_r);
+
+    if (py_dist) {
+        const int *dist = (const int *) PyArray_DATA(py_dist);
+        return find_sp_ring_vertices(nat, seed.data(), j, r, maxlength,
+                                     nthreads,
+                                     [&]() { return DenseDistances(nat, dist); },
+                                     ringstat, ringenum);
+    }
+    else {
+        const int *s = seed.data();
+        return find_sp_ring_vertices(nat, s, j, r, maxlength, nthreads,
+                                     [&]() { return OnDemandDistances(nat, s, j, maxlength); },
+                                     ringstat, ringenum);
+    }
+}
+
+
+/*
+ * Common part of the Python wrappers: parse arguments and search rings
+ */
+static bool
+find_sp_rings_from_args(PyObject *args, std::vector<npy_int> &ringstat,
+                        std::vector<std::vector<npy_int>> *ringenum)
+{
+    PyObject *py_i, *py_j, *py_r, *py_dist, *py_num_threads = NULL;
+    npy_int maxlength = -1;
+
+    if (!PyArg_ParseTuple(args, "OOOO|iO", &py_i, &py_j, &py_r, &py_dist,
+                          &maxlength, &py_num_threads))
+        return false;
+
+    /* Number of threads, default is to use OpenMP default */
+    int nthreads = 1;
+#ifdef _OPENMP
+    nthreads = omp_get_max_threads();
+#endif
+    if (py_num_threads && py_num_threads != Py_None) {
+        long num_threads = PyLong_AsLong(py_num_threads);
+        if (PyErr_Occurred())  return false;
+        if (num_threads < 1) {
+            PyErr_SetString(PyExc_ValueError, "Number of threads must be "
+                                              "positive.");
+            return false;
+        }
+#ifdef _OPENMP
+        nthreads = num_threads;
+#endif
+    }
 
+    /* Make sure our arrays are contiguous, these are new references */
+    PyObject *i_arr = NULL, *j_arr = NULL, *r_arr = NULL, *dist_arr = NULL;
+    bool ok = false;
+    i_arr = PyArray_FROMANY(py_i, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+    if (i_arr)
+        j_arr = PyArray_FROMANY(py_j, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
+    if (j_arr)
+        r_arr = PyArray_FROMANY(py_r, NPY_DOUBLE, 2, 2, NPY_C_CONTIGUOUS);
+    if (r_arr && py_dist != Py_None)
+        dist_arr = PyArray_FROMANY(py_dist, NPY_INT, 2, 2, NPY_C_CONTIGUOUS);
+    if (r_arr && (py_dist == Py_None || dist_arr))
+        ok = find_sp_rings_in_arrays(i_arr, j_arr, r_arr, dist_arr, maxlength,
+                                     nthreads, ringstat, ringenum);
+
+    Py_XDECREF(i_arr);
+    Py_XDECREF(j_arr);
+    Py_XDECREF(r_arr);
+    Py_XDECREF(dist_arr);
+
+    return ok;
+}
+
+
+/*
+ * Python wrapper
+ */
+extern "C" PyObject *
+py_find_sp_rings(PyObject *self, PyObject *args)
+{
     std::vector<npy_int> ringstat;
-    std::vector<std::vector<npy_int>> ringenum;
-    if (!find_sp_ring_vertices(nat, seed, nneigh, (int *) PyArray_DATA(py_j),
-                               (npy_double *) PyArray_DATA(py_r),
-                               (npy_int *) PyArray_DATA(py_dist),
-                               maxlength, ringstat, ringenum)) {
+    if (!find_sp_rings_from_args(args, ringstat, NULL))
         return NULL;
-    }
 
     npy_intp ringstat_size = ringstat.size();
     PyObject *py_ringstat = PyArray_ZEROS(1, &ringstat_size, NPY_INT, 0);
@@ -498,106 +733,26 @@ py_find_sp_rings(PyObject *self, PyObject *args)
 extern "C" PyObject *
 py_enum_sp_rings(PyObject *self, PyObject *args)
 {
-    PyObject *py_i, *py_j, *py_r, *py_dist;
-    npy_int maxlength = -1;
-
-    if (!PyArg_ParseTuple(args, "OOOO|i", &py_i, &py_j, &py_r, &py_dist,
-                          &maxlength))
-        return NULL;
-
-    /* Make sure our arrays are contiguous */
-    py_i = PyArray_FROMANY(py_i, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
-    if (!py_i) return NULL;
-    py_j = PyArray_FROMANY(py_j, NPY_INT, 1, 1, NPY_C_CONTIGUOUS);
-    if (!py_j) return NULL;
-    py_r = PyArray_FROMANY(py_r, NPY_DOUBLE, 2, 2, NPY_C_CONTIGUOUS);
-    if (!py_r) return NULL;
-    py_dist = PyArray_FROMANY(py_dist, NPY_INT, 2, 2, NPY_C_CONTIGUOUS);
-    if (!py_dist) return NULL;
-
-    /* Check array shapes. */
-    npy_intp nneigh = PyArray_DIM((PyArrayObject *) py_i, 0);
-    if (PyArray_DIM((PyArrayObject *) py_j, 0) != nneigh) {
-        PyErr_SetString(PyExc_ValueError, "Array must have same length.");
-        return NULL;
-    }
-    if (PyArray_DIM((PyArrayObject *) py_r, 0) != nneigh) {
-        PyErr_SetString(PyExc_ValueError, "Array must have same length.");
-        return NULL;
-    }
-    if (PyArray_DIM((PyArrayObject *) py_r, 1) != 3) {
-        PyErr_SetString(PyExc_ValueError, "Distance array must have second "
-                                          "dimension of length 3.");
-        return NULL;
-    }
-
-    /* Get total number of atoms */
-    npy_int *i = (npy_int *) PyArray_DATA(py_i);
-    int nat = *std::max_element(i, i+nneigh)+1;
-
-    /* Check shape of distance map */
-    if (PyArray_DIM((PyArrayObject *) py_dist, 0) != nat ||
-        PyArray_DIM((PyArrayObject *) py_dist, 1) != nat) {
-        /*
-        char errstr[1024];
-        sprintf(errstr, "Distance map has shape %" NPY_INTP_FMT " x %" 
-                NPY_INTP_FMT " while number of atoms is %i.",
-                PyArray_DIM((PyArrayObject *) py_dist, 0),
-                PyArray_DIM((PyArrayObject *) py_dist, 1),
-                nat);
-        PyErr_SetString(PyExc_ValueError, errstr);
-        */
-        PyErr_SetString(PyExc_ValueError, "Distance map has wrong shape.");
-        return NULL;
-    }
-
-    /* Construct seed array */
-    int seed[nat+1];
-    first_neighbours(nat, nneigh, i, seed);
-
     std::vector<npy_int> ringstat;
     std::vector<std::vector<npy_int>> ringenum;
-    if (!find_sp_ring_vertices(nat, seed, nneigh, (int *) PyArray_DATA(py_j),
-                               (npy_double *) PyArray_DATA(py_r),
-                               (npy_int *) PyArray_DATA(py_dist),
-                               maxlength, ringstat, ringenum)) {
+    if (!find_sp_rings_from_args(args, ringstat, &ringenum))
         return NULL;
-    }
-
 
-    npy_int results[(int) ringenum.size()] [(int) ringstat.size() -1];
-
-    for (uint iii=0; iii<ringenum.size();iii++){
-        for(uint jjj=0 ;jjj<ringenum[iii].size();jjj++ ){
-                                results[iii][jjj] = abs(ringenum[iii][jjj]);
-                                //cout << results[iii][jjj]; cout << ' ';
+    /* One row per ring, padded with -1 to the size of the largest ring */
+    npy_intp dims[2];
+    dims[0] = ringenum.size();
+    dims[1] = std::max(int(ringstat.size())-1, 0);
+    PyObject *py_ringenum = PyArray_ZEROS(2, dims, NPY_INT, 0);
+    npy_int *ringenum_data = (npy_int *) PyArray_DATA(py_ringenum);
+
+    for (npy_intp k = 0; k < dims[0]; k++) {
+        for (npy_intp l = 0; l < dims[1]; l++) {
+            if (l < npy_intp(ringenum[k].size()))
+                ringenum_data[k*dims[1]+l] = abs(ringenum[k][l]);
+            else
+                ringenum_data[k*dims[1]+l] = -1;
         }
-                        if(ringenum[iii].size() < ringstat.size()-1){
-                            for(uint zzz = ringenum[iii].size(); zzz<ringstat.size();zzz++){results[iii][zzz] = -1; 
-                            //cout << results[iii][zzz]; cout << ' ';
-                            }
-                        }
-                        //cout << '$' << ringenum[iii].size();cout << endl;
-                        }
-
-
-    //for (uint iii=0; iii<ringenum.size();iii++){for(uint jjj=0 ;jjj<(uint) ringstat.size() -1;jjj++ ){results[iii][jjj] = 0;}}
-
-    npy_intp dims[] = {(int) ringenum.size(), (int) ringstat.size()-1};
-    PyObject *py_ringenum;
-    // py_ringenum = PyArray_SimpleNewFromData(2, dims, NPY_INT, (void*)results);
-    py_ringenum = PyArray_ZEROS(2, dims, NPY_INT, 0);
-
-    // std::copy(0, (int) ringenum.size(),(npy_int *) PyArray_DATA(py_ringenum));
-    for (uint iii=0; iii<ringenum.size();iii++){
-        for(uint jjj=0 ;jjj<(uint) ringstat.size() -1;jjj++ ){
-            //cout<< 'a' << endl;
-            if(PyArray_SETITEM(py_ringenum, PyArray_GETPTR2(py_ringenum, iii, jjj), PyLong_FromLong(results[iii][jjj]))){ 
-                string warn = "Error casting npy_int";
-                for (uint iwarn = 0;iwarn<sizeof(warn);iwarn++) {cout<< warn[iwarn];} 
-                cout << endl;
-                }
-            }}
+    }
 
-    return (PyObject*) py_ringenum;
+    return py_ringenum;
 }
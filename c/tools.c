@@ -33,7 +33,7 @@
  */
 
 void
-cross_product(double *a, double *b, double *c)
+cross_product(const double *a, const double *b, double *c)
 {
     c[0] = a[1]*b[2]-a[2]*b[1];
     c[1] = a[2]*b[0]-a[0]*b[2];
@@ -41,7 +41,7 @@ cross_product(double *a, double *b, double *c)
 }
 
 void
-mat_mul_vec(double *mat, double *vin, double *vout)
+mat_mul_vec(const double *mat, const double *vin, double *vout)
 {
     int i, j;
     for (i = 0; i < 3; i++, vout++){
@@ -53,7 +53,7 @@ mat_mul_vec(double *mat, double *vin, double *vout)
 }
 
 double
-normsq(double *a)
+normsq(const double *a)
 {
     return sqrt(a[0]*a[0] + a[1]*a[1] + a[2]*a[2]);
 }
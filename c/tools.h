@@ -43,9 +43,9 @@ extern "C" {
  * Some basic linear algebra
  */
 
-void cross_product(double *a, double *b, double *c);
-void mat_mul_vec(double *mat, double *vin, double *vout);
-double normsq(double *a);
+void cross_product(const double *a, const double *b, double *c);
+void mat_mul_vec(const double *mat, const double *vin, double *vout);
+double normsq(const double *a);
 
 /*
  * Helper functions
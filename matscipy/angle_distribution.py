@@ -25,7 +25,8 @@ import _matscipy
 
 ###
 
-def angle_distribution(i, j, dr, nbins, *args):
+def angle_distribution(i, j, dr, nbins, cutoff=None, types=None, ntypes=None,
+                       triplet_list=None, out=None, num_threads=None):
     """
     Compute a bond angle distribution from a neighbour list.
 
@@ -37,6 +38,42 @@ def angle_distribution(i, j, dr, nbins, *args):
         Number of bins for bond angle histogram.
     cutoff : float, optional
         Bond length cutoff, i.e. consider only bonds shorter than this length.
+    types : array_like, optional
+        Integer type of each atom, e.g. the inverse indices returned by
+        `np.unique(numbers, return_inverse=True)`. If given, the histogram is
+        resolved by the type of the central atom and the types of the two
+        neighbours.
+    ntypes : int, optional
+        Number of atom types. Default is the largest type plus one.
+    triplet_list : tuple of arrays, optional
+        Triplets `(ij_t, ik_t)` as returned by
+        `matscipy.neighbours.triplet_list`. Angles are computed for these
+        triplets only instead of for all pairs of neighbours of each atom.
+    out : array, optional
+        Integer histogram to which the angles are added, e.g. to accumulate
+        the distribution over many frames.
+    num_threads : int, optional
+        Number of OpenMP threads. Default is the OpenMP default.
+
+    Returns
+    -------
+    hist : array
+        Histogram of bond angles between 0 and pi. Each angle is counted
+        once for each order of the two neighbours. If `types` is given, the
+        histogram has shape `(ntypes, ntypes, ntypes, nbins)` and entry
+        `hist[ti, tj, tk]` contains the angles j-i-k.
     """
+    if cutoff is None:
+        cutoff = -1.0
+    if types is not None:
+        types = np.asarray(types, dtype=np.intc)
+        if out is None:
+            if ntypes is None:
+                ntypes = types.max() + 1 if len(types) > 0 else 0
+            out = np.zeros((ntypes, ntypes, ntypes, nbins), dtype=np.intc)
+    ij_t = ik_t = None
+    if triplet_list is not None:
+        ij_t, ik_t = triplet_list[:2]
     return _matscipy.angle_distribution(np.asarray(i), np.asarray(j),
-                                        np.asarray(dr), nbins, *args)
+                                        np.asarray(dr), nbins, cutoff, types,
+                                        ij_t, ik_t, num_threads, out)
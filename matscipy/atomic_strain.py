@@ -26,9 +26,9 @@ See: Falk, Langer, Phys. Rev. E 57, 7192 (1998)
 """
 
 import numpy as np
-import scipy
 
 from matscipy.neighbours import mic, neighbour_list
+from matscipy.numpy_tricks import mabincount
 
 ###
 
@@ -39,75 +39,91 @@ def get_XIJ(nat, i_now, dr_now, dr_old):
     # Do an element-wise outer product
     dr_dr = dr_now.reshape(-1,3,1)*dr_old.reshape(-1,1,3)
 
-    xij = np.zeros([nat,3,3])
-    for i in range(3):
-        for j in range(3):
-            # For each atom, sum over all neighbors
-            xij[:,i,j] = np.bincount(i_now, weights=dr_dr[:,i,j])
-
-    return xij
+    # For each atom, sum over all neighbors
+    return mabincount(i_now, dr_dr, nat)
 
 
 def get_YIJ(nat, i_now, dr_old):
     """
     Calculates the Y_{ij} matrix
     """
-    # Just do an element-wise outer product
-    dr_dr = dr_old.reshape(-1,3,1)*dr_old.reshape(-1,1,3)
+    return get_XIJ(nat, i_now, dr_old, dr_old)
+
 
-    yij = np.zeros([nat,3,3])
-    for i in range(3):
-        for j in range(3):
-            # For each atom, sum over all neighbors
-            yij[:,i,j] = np.bincount(i_now, weights=dr_dr[:,i,j])
+def get_XIJ_and_YIJ(nat, i_now, dr_now, dr_old):
+    """
+    Calculates the X_{ij} and Y_{ij} matrices with a single bin count
+    """
+    # Outer product of current and old distance vectors (X) and old
+    # distance vectors with themselves (Y)
+    dr_dr = np.stack((dr_now, dr_old), axis=1).reshape(-1,2,3,1)*dr_old.reshape(-1,1,1,3)
 
-    return yij
+    xyij = mabincount(i_now, dr_dr, nat)
+    return xyij[:,0], xyij[:,1]
 
 
 def array_inverse(A):
     """
     Compute inverse for each matrix in a list of matrices.
-    This is faster than calling numpy.linalg.inv for each matrix.
     """
-    A = np.ascontiguousarray(A, dtype=float)
-    n_eq = A.shape[1]
-    identity = np.eye(n_eq)
-    def lapack_inverse(a):
-        b = np.copy(identity)
-        lu, piv, x, info = scipy.linalg.lapack.dgesv(a, b)
-        if info > 0:
-            raise np.linalg.LinAlgError('Singular matrix')
-        return x
+    return np.linalg.inv(np.asarray(A, dtype=float))
 
-    return np.array([lapack_inverse(a) for a in A])
+
+def array_pseudo_inverse(A, rcond=1e-12):
+    """
+    Compute Moore-Penrose pseudo-inverse for each matrix in a list of
+    symmetric positive semi-definite matrices. Eigenvalues smaller than rcond
+    times the largest eigenvalue of each matrix are treated as zero.
+    """
+    w, v = np.linalg.eigh(np.asarray(A, dtype=float))
+    large = w > rcond*w[:,-1:]
+    inv_w = np.divide(1, w, out=np.zeros_like(w), where=large)
+    return np.einsum('nik,nk,njk->nij', v, inv_w, v)
 
 
 def get_delta_plus_epsilon_dgesv(nat, i_now, dr_now, dr_old):
     """
     Calculate delta_ij+epsilon_ij, i.e. the deformation gradient matrix
     """
-    XIJ = get_XIJ(nat, i_now, dr_now, dr_old)
-    YIJ = get_YIJ(nat, i_now, dr_old)
+    XIJ, YIJ = get_XIJ_and_YIJ(nat, i_now, dr_now, dr_old)
 
-    YIJ_invert = array_inverse(YIJ)
-
-    # Perform sum_k X_ik Y_jk^-1
-    epsilon = np.sum(XIJ.reshape(-1,3,1,3)*YIJ_invert.reshape(-1,1,3,3), axis=3)
+    # Perform sum_k X_ik Y_jk^-1 = (Y^-1 X^T)^T, Y is symmetric
+    epsilon = np.linalg.solve(YIJ, XIJ.transpose(0,2,1)).transpose(0,2,1)
 
     return epsilon
 
 
 def get_delta_plus_epsilon(nat, i_now, dr_now, dr_old):
     """
-    Calculate delta_ij+epsilon_ij, i.e. the deformation gradient matrix
+    Calculate delta_ij+epsilon_ij, i.e. the deformation gradient matrix.
+    This is the least-squares solution for each atom, which is also defined
+    if the neighbor distance vectors do not span three dimensions.
     """
-    epsilon = []
-    for i in range(nat):
-        mask = i_now==i
-        x, residuals, rank, s = np.linalg.lstsq(dr_old[mask], dr_now[mask])
-        epsilon += [ x.T ]
+    XIJ, YIJ = get_XIJ_and_YIJ(nat, i_now, dr_now, dr_old)
+
+    # Perform sum_k X_ik Y^+_jk, where Y^+ is the pseudo-inverse of Y
+    return np.matmul(XIJ, array_pseudo_inverse(YIJ))
+
+
+def get_residual(nat, i_now, dr_now, dr_old, delta_plus_epsilon):
+    """
+    Calculate the residual of the fit of the deformation gradient, i.e.
+    D^2_min of each atom
+    """
+    # Spread epsilon out for each neighbor index
+    delta_plus_epsilon_n = delta_plus_epsilon[i_now]
+
+    # Compute D^2_min (residual of the least squares fit)
+    residual_n = np.sum(
+        (
+        dr_now-
+        np.sum(delta_plus_epsilon_n.reshape(-1,3,3)*dr_old.reshape(-1,1,3),
+               axis=2)
+        )**2,
+        axis=1)
 
-    return np.array(epsilon)
+    # For each atom, sum over all neighbors
+    return np.bincount(i_now, weights=residual_n, minlength=nat)
 
 
 def get_D_square_min(atoms_now, atoms_old, i_now, j_now, delta_plus_epsilon=None):
@@ -135,20 +151,7 @@ def get_D_square_min(atoms_now, atoms_old, i_now, j_now, delta_plus_epsilon=None
         # Get minimum strain tensor
         delta_plus_epsilon = get_delta_plus_epsilon(nat, i_now, dr_now, dr_old)
 
-    # Spread epsilon out for each neighbor index
-    delta_plus_epsilon_n = delta_plus_epsilon[i_now]
-
-    # Compute D^2_min (residual of the least squares fit)
-    residual_n = np.sum(
-        (
-        dr_now-
-        np.sum(delta_plus_epsilon_n.reshape(-1,3,3)*dr_old.reshape(-1,1,3),
-               axis=2)
-        )**2,
-        axis=1)
-
-    # For each atom, sum over all neighbors
-    residual = np.bincount(i_now, weights=residual_n)
+    residual = get_residual(nat, i_now, dr_now, dr_old, delta_plus_epsilon)
 
     return delta_plus_epsilon, residual
 
@@ -196,3 +199,62 @@ def atomic_strain(atoms_now, atoms_old, cutoff=None, neighbours=None):
                                                     j_now)
 
     return delta_plus_epsilon, residual
+
+
+def atomic_strain_trajectory(frames, atoms_old, cutoff=None, neighbours=None):
+    """
+    Calculate deformation gradient tensor and D^2_min measure for non-affine
+    displacements for a sequence of configurations with respect to the same
+    reference configuration. The neighbor list is computed once for the
+    reference configuration and used for all frames.
+
+    Parameters:
+    -----------
+    frames : iterable of ase.Atoms
+        Current atomic configurations
+    atoms_old : ase.Atoms
+        Reference atomic configuration
+    cutoff : float
+        Neighbor list cutoff.
+    neighbours : ( array_like, array_like )
+        Neighbor list. Automatically computed for the reference configuration
+        if not provided.
+
+    Returns:
+    --------
+    generator of tuple
+        3x3 deformation gradient tensor and D^2_min norm for each atom and
+        each frame.
+    """
+
+    if neighbours is None:
+        if cutoff is None:
+            raise ValueError('Please provide either neighbor list or neighbor '
+                             'list cutoff.')
+
+        # Get neighbours
+        i_now, j_now = neighbour_list("ij", atoms_old, cutoff)
+    elif cutoff is not None:
+        raise ValueError('Please provide either neighbor list or neighbor '
+                         'list cutoff, not both.')
+    else:
+        i_now, j_now = neighbours
+
+    nat = len(atoms_old)
+    pos_old = atoms_old.positions
+    dr_old = mic(pos_old[i_now] - pos_old[j_now], atoms_old.cell)
+
+    # Y_{ij} only depends on the reference configuration
+    YIJ_invert = array_pseudo_inverse(get_YIJ(nat, i_now, dr_old))
+
+    for atoms_now in frames:
+        assert len(atoms_now) == nat
+
+        pos_now = atoms_now.positions
+        dr_now = mic(pos_now[i_now] - pos_now[j_now], atoms_now.cell)
+
+        delta_plus_epsilon = np.matmul(get_XIJ(nat, i_now, dr_now, dr_old),
+                                       YIJ_invert)
+        residual = get_residual(nat, i_now, dr_now, dr_old, delta_plus_epsilon)
+
+        yield delta_plus_epsilon, residual
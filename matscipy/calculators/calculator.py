@@ -20,15 +20,112 @@
 #
 import numpy as np
 
-from scipy.sparse.linalg import cg
+from scipy.sparse.linalg import LinearOperator
 
 from ase.calculators.calculator import Calculator
 
-from ..elasticity import Voigt_6_to_full_3x3_stress
+from ..elasticity import (Voigt_6_to_full_3x3_stress, Voigt_6x6_to_full_3x3x3x3,
+                          Voigt_notation)
 
 from ..numpy_tricks import mabincount
 
 
+def _hessian_operator(matvec, atoms, divide_by_masses=False):
+    """
+    Wrap a function that computes Hessian-vector products into a symmetric
+    linear operator, optionally scaled by the atomic masses.
+    """
+    shape = (3*len(atoms), 3*len(atoms))
+    if divide_by_masses:
+        inv_sqrt_mass_n = 1/np.sqrt(atoms.get_masses()).repeat(3)
+
+        def dynamical_matvec(v):
+            v = v.reshape(-1)
+            return inv_sqrt_mass_n*matvec(inv_sqrt_mass_n*v)
+
+        return LinearOperator(shape, matvec=dynamical_matvec,
+                              rmatvec=dynamical_matvec, dtype=float)
+    return LinearOperator(shape, matvec=matvec, rmatvec=matvec, dtype=float)
+
+
+def _block_cg(A, B_nm, atol=1e-5, maxiter=None):
+    """
+    Solve A X = B for all right-hand sides (columns of B) simultaneously
+    with a block conjugate-gradient method. The search directions of all
+    right-hand sides span a common Krylov space, which typically requires
+    far fewer iterations (and Hessian-vector products) than independent
+    CG solves. Linearly dependent search directions are dropped.
+
+    The translational modes of the atomic system (the null space of the
+    Hessian) are projected out of the right-hand sides and the residuals,
+    such that the solution is orthogonal to them.
+
+    Parameters
+    ----------
+    A : scipy.sparse.linalg.LinearOperator or sparse matrix
+        Symmetric, positive semi-definite matrix of shape (3*N, 3*N).
+    B_nm : array_like
+        Right-hand sides of shape (3*N, M).
+    atol : float
+        Convergence criterion on the norm of each residual.
+    maxiter : int, optional
+        Maximum number of iterations. (Default: 10*3*N, as in scipy's cg)
+
+    Returns
+    -------
+    X_nm : np.ndarray
+        Solutions of shape (3*N, M).
+    """
+    n, m = B_nm.shape
+    if maxiter is None:
+        maxiter = 10*n
+
+    def project(R_nm):
+        # Remove uniform translations
+        R_ncm = R_nm.reshape(-1, 3, m)
+        return (R_ncm - R_ncm.mean(axis=0)).reshape(n, m)
+
+    R_nm = project(np.array(B_nm, dtype=float))
+    X_nm = np.zeros_like(R_nm)
+
+    P_nk = R_nm
+    for it in range(maxiter):
+        if np.all(np.linalg.norm(R_nm, axis=0) <= atol):
+            return X_nm
+
+        # Orthonormal basis of the search space, drop dependent directions
+        U_nk, s_k, _ = np.linalg.svd(P_nk, full_matrices=False)
+        P_nk = U_nk[:, s_k > np.finfo(float).eps * n * s_k[0]]
+
+        Q_nk = A @ P_nk
+        PtQ_kk = P_nk.T @ Q_nk
+        alpha_km = np.linalg.solve(PtQ_kk, P_nk.T @ R_nm)
+        X_nm += P_nk @ alpha_km
+        R_nm = project(R_nm - Q_nk @ alpha_km)
+
+        # New search directions are A-conjugate to the current ones
+        beta_km = -np.linalg.solve(PtQ_kk, Q_nk.T @ R_nm)
+        P_nk = R_nm + P_nk @ beta_km
+
+    raise RuntimeError("Block CG tolerance not achieved: Exceeded number of "
+                       "iterations.")
+
+
+def _non_affine_elastic_constants(H, naforces_icab, atol=1e-5):
+    """
+    Non-affine contribution to the elastic constants (before division by
+    the volume) from the Hessian and the non-affine forces. Since the
+    elastic constants are symmetrized with respect to the strain indices,
+    only the six symmetric (Voigt) components of the non-affine forces
+    need to be solved for.
+    """
+    naforces_nv = np.transpose([
+        (naforces_icab[:, :, a, b] + naforces_icab[:, :, b, a]).reshape(-1) / 2
+        for a, b in Voigt_notation])
+    D_nv = _block_cg(H, naforces_nv, atol=atol)
+    return Voigt_6x6_to_full_3x3x3x3(naforces_nv.T @ D_nv)
+
+
 class MatscipyCalculator(Calculator):
     def get_hessian(self, atoms, format='sparse', divide_by_masses=False):
         """
@@ -67,6 +164,37 @@ class MatscipyCalculator(Calculator):
         """
         raise NotImplementedError
 
+    def get_hessian_operator(self, atoms, divide_by_masses=False):
+        """
+        Return the Hessian matrix as a linear operator that computes
+        Hessian-vector products without assembling the sparse matrix. The
+        products are computed from the Hessian blocks per atom pair
+        (format 'neighbour-list' of `get_hessian`); the diagonal blocks
+        follow from translational invariance.
+
+        Parameters
+        ----------
+        atoms: ase.Atoms
+            Atomic configuration in a local or global minima.
+        divide_by_masses : bool, optional
+            Return the dynamical matrix instead of the Hessian matrix.
+            (Default: False)
+
+        Returns
+        -------
+        hessian : scipy.sparse.linalg.LinearOperator
+            Hessian (or dynamical) matrix of shape (3*N, 3*N)
+        """
+        nat = len(atoms)
+        H_pcc, i_p, j_p, dr_pc, abs_dr_p = self.get_hessian(atoms, 'neighbour-list')
+
+        def matvec(v):
+            v_nc = v.reshape(nat, 3)
+            Hv_pc = np.einsum('pab,pb->pa', H_pcc, v_nc[j_p] - v_nc[i_p])
+            return mabincount(i_p, Hv_pc, nat).reshape(v.shape)
+
+        return _hessian_operator(matvec, atoms, divide_by_masses)
+
     def get_born_elastic_constants(self, atoms):
         """
         Compute the Born elastic constants. 
@@ -161,7 +289,8 @@ class MatscipyCalculator(Calculator):
     def get_non_affine_contribution_to_elastic_constants(self, atoms, eigenvalues=None, eigenvectors=None, tol=1e-5):
         """
         Compute the correction of non-affine displacements to the elasticity tensor.
-        The computation of the occuring inverse of the Hessian matrix is bypassed by using a cg solver.
+        The computation of the occuring inverse of the Hessian matrix is bypassed by using a block cg solver
+        for the six symmetric strain components.
 
         If eigenvalues and and eigenvectors are given the inverse of the Hessian can be easily computed.
 
@@ -200,17 +329,8 @@ class MatscipyCalculator(Calculator):
         else:
             H_nn = calc.get_hessian(atoms, "sparse")
             naforces_icab = calc.get_nonaffine_forces(atoms)
+            C_abab = _non_affine_elastic_constants(H_nn, naforces_icab, atol=tol)
 
-            D_iab = np.zeros((3*nat, 3, 3))
-            for i in range(3):
-                for j in range(3):
-                    x, info = cg(H_nn, naforces_icab[:, :, i, j].flatten(), atol=tol)
-                    if info != 0:
-                        raise RuntimeError(" info > 0: CG tolerance not achieved, info < 0: Exceeded number of iterations.")
-                    D_iab[:,i,j] = x
-
-            C_abab = np.sum(naforces_icab.reshape(3*nat, 3, 3, 1, 1) * D_iab.reshape(3*nat, 1, 1, 3, 3), axis=0)
-        
         # Symmetrize 
         C_abab = (C_abab + C_abab.swapaxes(0, 1) + C_abab.swapaxes(2, 3) + C_abab.swapaxes(0, 1).swapaxes(2, 3)) / 4             
 
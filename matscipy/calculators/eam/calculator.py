@@ -34,12 +34,15 @@ except:
     InterpolatedUnivariateSpline = None
 
 from scipy.sparse import bsr_matrix
+
+import _matscipy
 from matscipy.calculators.eam.io import read_eam
+from matscipy.numpy_tricks import mabincount
 from matscipy.neighbours import (
     neighbour_list, 
     first_neighbours, 
     find_indices_of_reversed_pairs,
-    find_common_neighbours
+    find_common_neighbours_chunked
 )
 
 
@@ -57,11 +60,49 @@ def _make_derivative(x, n=1):
     else:
         return x.derivative(n=n)
 
+def _pack_splines(dx, nb_grid_points, splines):
+    """
+    Pack cubic splines defined on a uniform grid with spacing dx into a
+    contiguous array of shape (nb_splines, nb_grid_points-1, 4). The last
+    axis contains the polynomial coefficients of each grid interval in
+    the reduced coordinate t = x/dx - g, with g the index of the interval.
+    """
+    x_g = np.arange(nb_grid_points-1)*dx
+    coeffs = []
+    for spline in np.ravel(np.array(splines, dtype=object)):
+        # The third derivative is constant within each interval
+        coeffs += [np.transpose([spline(x_g),
+                                 spline.derivative(1)(x_g)*dx,
+                                 spline.derivative(2)(x_g)*dx**2/2,
+                                 spline.derivative(3)(x_g+dx/2)*dx**3/6])]
+    return np.array(coeffs)
+
+def _evaluate_packed_splines(c_sgx, inv_dx, s_n, x_n, second_derivative=False):
+    """
+    Evaluate spline s_n at x_n, for all points in a single vectorized pass.
+    Points outside of the grid are extrapolated with the polynomial of the
+    closest interval, as for InterpolatedUnivariateSpline.
+
+    Returns
+    -------
+    y_n, dy_n[, ddy_n] : array
+        Value, first and second derivative
+    """
+    x_n = x_n*inv_dx
+    g_n = np.clip(np.floor(x_n).astype(int), 0, c_sgx.shape[1]-1)
+    t_n = x_n - g_n
+    c_xn = c_sgx[s_n, g_n].T
+    y_n = c_xn[0] + t_n*(c_xn[1] + t_n*(c_xn[2] + t_n*c_xn[3]))
+    dy_n = inv_dx*(c_xn[1] + t_n*(2*c_xn[2] + t_n*3*c_xn[3]))
+    if second_derivative:
+        return y_n, dy_n, inv_dx**2*(2*c_xn[2] + t_n*6*c_xn[3])
+    return y_n, dy_n
+
 
 ###
 
 class EAM(Calculator):
-    implemented_properties = ['energy', 'stress', 'forces']
+    implemented_properties = ['energy', 'free_energy', 'energies', 'stress', 'stresses', 'forces']
     default_parameters = {}
     name = 'EAM'
        
@@ -79,12 +120,26 @@ class EAM(Calculator):
             self.F = _make_splines(dF, F)
             self.f = _make_splines(dr, f)
             self.rep = _make_splines(dr, rep)
+
+            # Packed spline coefficients for vectorized evaluation. Density
+            # functions are indexed by the element pair (j, i), since
+            # atom j contributes to the density of atom i, and pair
+            # potentials are indexed by (i, j).
+            nb_elements = len(self._db_atomic_numbers)
+            self._inv_dr = 1/dr
+            self._inv_dF = 1/dF
+            self._F_sgx = _pack_splines(dF, np.shape(F)[-1], self.F)
+            self._f_sgx = _pack_splines(dr, np.shape(f)[-1], self.f)
+            if np.ndim(f) == 2:
+                self._f_sgx = np.repeat(self._f_sgx, nb_elements, axis=0)
+            self._rep_sgx = _pack_splines(dr, np.shape(rep)[-1], self.rep)
         else:
             self._db_atomic_numbers = atomic_numbers
             self.F = F
             self.f = f
             self.rep = rep
             self._db_cutoff = cutoff
+            self._F_sgx = None
 
         self.atnum_to_index = -np.ones(np.max(self._db_atomic_numbers)+1, dtype=int)
         self.atnum_to_index[self._db_atomic_numbers] = \
@@ -100,7 +155,119 @@ class EAM(Calculator):
         self.ddf = _make_derivative(self.f, n=2)
         self.ddrep = _make_derivative(self.rep, n=2)
 
-    def energy_virial_and_forces(self, atomic_numbers_i, i_n, j_n, dr_nc, abs_dr_n):
+    def _pair_density(self, atomic_numbers_i, i_n, j_n, abs_dr_n,
+                      second_derivative=False):
+        """
+        Contribution of atom j_n to the electron density of atom i_n and its
+        derivatives for each pair.
+        """
+        if self._F_sgx is not None:
+            t_i = self.atnum_to_index[atomic_numbers_i]
+            s_n = t_i[j_n]*len(self._db_atomic_numbers) + t_i[i_n]
+            return _evaluate_packed_splines(self._f_sgx, self._inv_dr, s_n,
+                                            abs_dr_n, second_derivative)
+
+        f_n = np.zeros_like(abs_dr_n)
+        df_n = np.zeros_like(abs_dr_n)
+        ddf_n = np.zeros_like(abs_dr_n)
+        for atidx1, atnum1 in enumerate(self._db_atomic_numbers):
+            f1 = self.f[atidx1]
+            df1 = self.df[atidx1]
+            ddf1 = self.ddf[atidx1]
+            mask1 = atomic_numbers_i[j_n]==atnum1
+            if mask1.sum() > 0:
+                if type(f1) == list:
+                    for atidx2, atnum2 in enumerate(self._db_atomic_numbers):
+                        f = f1[atidx2]
+                        df = df1[atidx2]
+                        ddf = ddf1[atidx2]
+                        mask = np.logical_and(mask1, atomic_numbers_i[i_n]==atnum2)
+                        if mask.sum() > 0:
+                            f_n[mask] = f(abs_dr_n[mask])
+                            df_n[mask] = df(abs_dr_n[mask])
+                            if second_derivative:
+                                ddf_n[mask] = ddf(abs_dr_n[mask])
+                else:
+                    f_n[mask1] = f1(abs_dr_n[mask1])
+                    df_n[mask1] = df1(abs_dr_n[mask1])
+                    if second_derivative:
+                        ddf_n[mask1] = ddf1(abs_dr_n[mask1])
+
+        if second_derivative:
+            return f_n, df_n, ddf_n
+        return f_n, df_n
+
+    def _pair_repulsion(self, atomic_numbers_i, i_n, j_n, abs_dr_n,
+                        second_derivative=False):
+        """
+        Pair energy of atoms i_n and j_n and its derivatives for each pair.
+        Note that the tabulated function is the pair energy times distance.
+        """
+        if self._F_sgx is not None:
+            t_i = self.atnum_to_index[atomic_numbers_i]
+            s_n = t_i[i_n]*len(self._db_atomic_numbers) + t_i[j_n]
+            rep_n, drep_n, ddrep_n = _evaluate_packed_splines(
+                self._rep_sgx, self._inv_dr, s_n, abs_dr_n,
+                second_derivative=True)
+        else:
+            rep_n = np.zeros_like(abs_dr_n)
+            drep_n = np.zeros_like(abs_dr_n)
+            ddrep_n = np.zeros_like(abs_dr_n)
+            for atidx1, atnum1 in enumerate(self._db_atomic_numbers):
+                rep1 = self.rep[atidx1]
+                drep1 = self.drep[atidx1]
+                ddrep1 = self.ddrep[atidx1]
+                mask1 = atomic_numbers_i[i_n]==atnum1
+                if mask1.sum() > 0:
+                    for atidx2, atnum2 in enumerate(self._db_atomic_numbers):
+                        rep = rep1[atidx2]
+                        drep = drep1[atidx2]
+                        ddrep = ddrep1[atidx2]
+                        mask = np.logical_and(mask1, atomic_numbers_i[j_n]==atnum2)
+                        if mask.sum() > 0:
+                            rep_n[mask] = rep(abs_dr_n[mask])
+                            drep_n[mask] = drep(abs_dr_n[mask])
+                            if second_derivative:
+                                ddrep_n[mask] = ddrep(abs_dr_n[mask])
+
+        rep_n /= abs_dr_n
+        drep_n = (drep_n-rep_n)/abs_dr_n
+        if second_derivative:
+            ddrep_n = (ddrep_n-2.0*drep_n)/abs_dr_n
+            return rep_n, drep_n, ddrep_n
+        return rep_n, drep_n
+
+    def _embedding_energy(self, atomic_numbers_i, density_i,
+                          second_derivative=False):
+        """
+        Embedding energy of each atom and its derivatives.
+        """
+        if self._F_sgx is not None:
+            return _evaluate_packed_splines(
+                self._F_sgx, self._inv_dF,
+                self.atnum_to_index[atomic_numbers_i], density_i,
+                second_derivative)
+
+        emb_i = np.zeros_like(density_i)
+        demb_i = np.zeros_like(density_i)
+        ddemb_i = np.zeros_like(density_i)
+        for atidx, atnum in enumerate(self._db_atomic_numbers):
+            F = self.F[atidx]
+            dF = self.dF[atidx]
+            ddF = self.ddF[atidx]
+            mask = atomic_numbers_i==atnum
+            if mask.sum() > 0:
+                emb_i[mask] = F(density_i[mask])
+                demb_i[mask] = dF(density_i[mask])
+                if second_derivative:
+                    ddemb_i[mask] = ddF(density_i[mask])
+
+        if second_derivative:
+            return emb_i, demb_i, ddemb_i
+        return emb_i, demb_i
+
+    def energy_virial_and_forces(self, atomic_numbers_i, i_n, j_n, dr_nc, abs_dr_n,
+                                 half=False, per_atom=False):
         """
         Compute the potential energy, the virial and the forces.
 
@@ -114,6 +281,13 @@ class EAM(Calculator):
             Distance vectors between neighbors
         abd_dr_n : array_like
             Length of distance vectors between neighbors
+        half : bool
+            Neighbor pairs are a half neighbor list, i.e. each pair is
+            contained only once. (Default: False)
+        per_atom : bool
+            Additionally return per-atom energies and virials. The pair
+            energy and virial of each pair is split equally between both
+            atoms. (Default: False)
 
         Returns
         -------
@@ -123,6 +297,10 @@ class EAM(Calculator):
             Virial
         forces_ic : array
             Forces acting on each atom
+        epot_i : array
+            Potential energy of each atom (only if per_atom is True)
+        virial_iv : array
+            Virial of each atom (only if per_atom is True)
         """
         nat = len(atomic_numbers_i)
         atnums_in_system = set(atomic_numbers_i)
@@ -132,60 +310,40 @@ class EAM(Calculator):
                                    'this atomic number has no EAM '
                                    'parametrization'.format(atnum))
 
-        # Density
-        f_n = np.zeros_like(abs_dr_n)
-        df_n = np.zeros_like(abs_dr_n)
-        for atidx1, atnum1 in enumerate(self._db_atomic_numbers):
-            f1 = self.f[atidx1]
-            df1 = self.df[atidx1]
-            mask1 = atomic_numbers_i[j_n]==atnum1
-            if mask1.sum() > 0:
-                if type(f1) == list:
-                    for atidx2, atnum2 in enumerate(self._db_atomic_numbers):
-                        f = f1[atidx2]
-                        df = df1[atidx2]
-                        mask = np.logical_and(mask1, atomic_numbers_i[i_n]==atnum2)
-                        if mask.sum() > 0:
-                            f_n[mask] = f(abs_dr_n[mask])
-                            df_n[mask] = df(abs_dr_n[mask])
-                else:
-                    f_n[mask1] = f1(abs_dr_n[mask1])
-                    df_n[mask1] = df1(abs_dr_n[mask1])
+        if self._F_sgx is not None:
+            # Compiled kernel that evaluates the packed splines
+            t_i = self.atnum_to_index[atomic_numbers_i].astype(np.int32)
+            return _matscipy.eam_energy_virial_and_forces(
+                t_i, i_n, j_n, dr_nc, abs_dr_n, self._F_sgx, self._inv_dF,
+                self._f_sgx, self._inv_dr, self._rep_sgx, half, per_atom)
 
-        density_i = np.bincount(i_n, weights=f_n, minlength=nat)
+        # Density
+        f_n, df_n = self._pair_density(atomic_numbers_i, i_n, j_n, abs_dr_n)
+        if half:
+            # Each pair appears only once, we need the contribution of i_n to
+            # the density of j_n explicitly
+            f_i_n, df_i_n = self._pair_density(atomic_numbers_i, j_n, i_n,
+                                               abs_dr_n)
+            density_i = np.bincount(i_n, weights=f_n, minlength=nat) + \
+                np.bincount(j_n, weights=f_i_n, minlength=nat)
+            pair_factor = 1.0
+        else:
+            density_i = np.bincount(i_n, weights=f_n, minlength=nat)
+            pair_factor = 0.5
 
         # Repulsion
-        rep_n = np.zeros_like(abs_dr_n)
-        drep_n = np.zeros_like(abs_dr_n)
-        for atidx1, atnum1 in enumerate(self._db_atomic_numbers):
-            rep1 = self.rep[atidx1]
-            drep1 = self.drep[atidx1]
-            mask1 = atomic_numbers_i[i_n]==atnum1
-            if mask1.sum() > 0:
-                for atidx2, atnum2 in enumerate(self._db_atomic_numbers):
-                    rep = rep1[atidx2]
-                    drep = drep1[atidx2]
-                    mask = np.logical_and(mask1, atomic_numbers_i[j_n]==atnum2)
-                    if mask.sum() > 0:
-                        r = rep(abs_dr_n[mask])/abs_dr_n[mask]
-                        rep_n[mask] = r
-                        drep_n[mask] = (drep(abs_dr_n[mask])-r)/abs_dr_n[mask]
+        rep_n, drep_n = self._pair_repulsion(atomic_numbers_i, i_n, j_n,
+                                             abs_dr_n)
 
         # Energy
-        epot = 0.5*np.sum(rep_n)
-        demb_i = np.zeros(nat)
-        for atidx, atnum in enumerate(self._db_atomic_numbers):
-            F = self.F[atidx]
-            dF = self.dF[atidx]
-            mask = atomic_numbers_i==atnum
-            if mask.sum() > 0:
-                epot += np.sum(F(density_i[mask]))
-                demb_i[mask] += dF(density_i[mask])
+        emb_i, demb_i = self._embedding_energy(atomic_numbers_i, density_i)
+        epot = pair_factor*np.sum(rep_n) + np.sum(emb_i)
 
         # Forces
-        reverse = find_indices_of_reversed_pairs(i_n, j_n, abs_dr_n)
-        df_i_n = np.take(df_n, reverse)
-        df_nc = -0.5*((demb_i[i_n]*df_n+demb_i[j_n]*df_i_n)+drep_n).reshape(-1,1)*dr_nc/abs_dr_n.reshape(-1,1)
+        if not half:
+            reverse = find_indices_of_reversed_pairs(i_n, j_n, abs_dr_n)
+            df_i_n = np.take(df_n, reverse)
+        df_nc = -pair_factor*((demb_i[i_n]*df_n+demb_i[j_n]*df_i_n)+drep_n).reshape(-1,1)*dr_nc/abs_dr_n.reshape(-1,1)
 
         # Sum for each atom
         fx_i = np.bincount(j_n, weights=df_nc[:,0], minlength=nat) - \
@@ -196,25 +354,41 @@ class EAM(Calculator):
             np.bincount(i_n, weights=df_nc[:,2], minlength=nat)
 
         # Virial
-        virial_v = -np.array([dr_nc[:,0]*df_nc[:,0],               # xx
-                              dr_nc[:,1]*df_nc[:,1],               # yy
-                              dr_nc[:,2]*df_nc[:,2],               # zz
-                              dr_nc[:,1]*df_nc[:,2],               # yz
-                              dr_nc[:,0]*df_nc[:,2],               # xz
-                              dr_nc[:,0]*df_nc[:,1]]).sum(axis=1)  # xy
-
-        return epot, virial_v, np.transpose([fx_i, fy_i, fz_i])
+        virial_nv = -np.transpose([dr_nc[:,0]*df_nc[:,0],  # xx
+                                   dr_nc[:,1]*df_nc[:,1],  # yy
+                                   dr_nc[:,2]*df_nc[:,2],  # zz
+                                   dr_nc[:,1]*df_nc[:,2],  # yz
+                                   dr_nc[:,0]*df_nc[:,2],  # xz
+                                   dr_nc[:,0]*df_nc[:,1]])  # xy
+        virial_v = virial_nv.sum(axis=0)
+
+        if not per_atom:
+            return epot, virial_v, np.transpose([fx_i, fy_i, fz_i])
+
+        # Per-atom energies and virials
+        rep_n *= 0.5*pair_factor
+        epot_i = emb_i + np.bincount(i_n, weights=rep_n, minlength=nat) + \
+            np.bincount(j_n, weights=rep_n, minlength=nat)
+        virial_iv = 0.5*(mabincount(i_n, virial_nv, nat) +
+                         mabincount(j_n, virial_nv, nat))
+
+        return epot, virial_v, np.transpose([fx_i, fy_i, fz_i]), epot_i, \
+            virial_iv
 
     def calculate(self, atoms, properties, system_changes):
         Calculator.calculate(self, atoms, properties, system_changes)
 
         i_n, j_n, dr_nc, abs_dr_n = neighbour_list('ijDd', self.atoms,
-                                                   self._db_cutoff)
+                                                   self._db_cutoff, half=True)
 
-        epot, virial_v, forces_ic = self.energy_virial_and_forces(self.atoms.numbers, i_n, j_n, dr_nc, abs_dr_n)
+        epot, virial_v, forces_ic, epot_i, virial_iv = \
+            self.energy_virial_and_forces(self.atoms.numbers, i_n, j_n, dr_nc,
+                                          abs_dr_n, half=True, per_atom=True)
 
         self.results = {'energy': epot, 'free_energy': epot,
+                        'energies': epot_i,
                         'stress': virial_v/self.atoms.get_volume(),
+                        'stresses': virial_iv/self.atoms.get_volume(),
                         'forces': forces_ic}
 
     def calculate_hessian_matrix(self, atoms, divide_by_masses=False):
@@ -355,67 +529,24 @@ class EAM(Calculator):
         # j_n: index of the neighbor atom
         # dr_nc: distance vector between the two
         # abs_dr_n: norm of distance vector
+        # reverse_n: index of the reversed pair j-i
         # Variable name ending with _n indicate arrays that contain
         # one element for each pair in the neighbor list. Names ending
         # with _i indicate arrays containing one element for each atom.
-        i_n, j_n, dr_nc, abs_dr_n = neighbour_list('ijDd', atoms,
-                                                   self._db_cutoff)
+        i_n, j_n, dr_nc, abs_dr_n, reverse = neighbour_list('ijDdR', atoms,
+                                                            self._db_cutoff)
 
         # Calculate derivatives of the pair energy
-        drep_n = np.zeros_like(abs_dr_n)  # first derivative
-        ddrep_n = np.zeros_like(abs_dr_n) # second derivative
-        for atidx1, atnum1 in enumerate(self._db_atomic_numbers):
-            rep1 = self.rep[atidx1]
-            drep1 = self.drep[atidx1]
-            ddrep1 = self.ddrep[atidx1]
-            mask1 = atnums[i_n]==atnum1
-            if mask1.sum() > 0:
-                for atidx2, atnum2 in enumerate(self._db_atomic_numbers):
-                    rep = rep1[atidx2]
-                    drep = drep1[atidx2]
-                    ddrep = ddrep1[atidx2]
-                    mask = np.logical_and(mask1, atnums[j_n]==atnum2)
-                    if mask.sum() > 0:
-                        r = rep(abs_dr_n[mask])/abs_dr_n[mask]
-                        drep_n[mask] = (drep(abs_dr_n[mask])-r) / abs_dr_n[mask]
-                        ddrep_n[mask] = (ddrep(abs_dr_n[mask]) - 2.0 * drep_n[mask]) / abs_dr_n[mask]
+        _, drep_n, ddrep_n = self._pair_repulsion(
+            atnums, i_n, j_n, abs_dr_n, second_derivative=True)
         # Calculate electron density and its derivatives
-        f_n = np.zeros_like(abs_dr_n)
-        df_n = np.zeros_like(abs_dr_n)  # first derivative
-        ddf_n = np.zeros_like(abs_dr_n) # second derivative
-        for atidx1, atnum1 in enumerate(self._db_atomic_numbers):
-            f1 = self.f[atidx1]     
-            df1 = self.df[atidx1]   
-            ddf1 = self.ddf[atidx1] 
-            mask1 = atnums[j_n]==atnum1
-            if mask1.sum() > 0:
-                if type(f1) == list:
-                    for atidx2, atnum2 in enumerate(self._db_atomic_numbers):
-                        f = f1[atidx2]
-                        df = df1[atidx2]
-                        ddf = ddf1[atidx2]
-                        mask = np.logical_and(mask1, atnums[i_n]==atnum2)
-                        if mask.sum() > 0:
-                            f_n[mask] = f(abs_dr_n[mask])
-                            df_n[mask] = df(abs_dr_n[mask])
-                            ddf_n[mask] = ddf(abs_dr_n[mask])
-                else:
-                    f_n[mask1] = f1(abs_dr_n[mask1])
-                    df_n[mask1] = df1(abs_dr_n[mask1])
-                    ddf_n[mask1] = ddf1(abs_dr_n[mask1])
+        f_n, df_n, ddf_n = self._pair_density(
+            atnums, i_n, j_n, abs_dr_n, second_derivative=True)
         # Accumulate density contributions
         density_i = np.bincount(i_n, weights=f_n, minlength=nat)
         # Calculate the derivatives of the embedding energy
-        demb_i = np.zeros(nat)   # first derivative
-        ddemb_i = np.zeros(nat)  # second derivative
-        for atidx, atnum in enumerate(self._db_atomic_numbers):
-            F = self.F[atidx]
-            dF = self.dF[atidx]
-            ddF = self.ddF[atidx]
-            mask = atnums==atnum
-            if mask.sum() > 0:
-                demb_i[mask] += dF(density_i[mask])
-                ddemb_i[mask] += ddF(density_i[mask])
+        _, demb_i, ddemb_i = self._embedding_energy(
+            atnums, density_i, second_derivative=True)
 
         # There are two ways to divide the Hessian by atomic masses, either
         # during or after construction. The former is preferable with regard
@@ -460,7 +591,6 @@ class EAM(Calculator):
         # i_n[r] to the derivative of j_n[r]. This value is also in df_n,
         # but at a different position. reverse[r] gives the new index s
         # where we find this value. The same indexing applies to ddf_n.
-        reverse = find_indices_of_reversed_pairs(i_n, j_n, abs_dr_n)
         df_i_n = np.take(df_n, reverse)
         ddf_i_n = np.take(ddf_n, reverse)
         #we already have ddf_j_n = ddf_n 
@@ -908,26 +1038,42 @@ class EAM(Calculator):
         -------
         D : scipy.sparse.bsr_matrix
         """
-        cnl_i1_i2, cnl_j1, nl_index_i1_j1, nl_index_i2_j1 = find_common_neighbours(i_n, j_n, nat)
-        unique_pairs_i1_i2, bincount_bins = np.unique(cnl_i1_i2, axis=0, return_inverse=True)
-        cnl_i1_i2 = None
-        tmp_3 = np.take(df_i_n, nl_index_i1_j1) * np.take(ddemb_i, cnl_j1) * np.take(df_i_n, nl_index_i2_j1)
-        cnl_j1 = None
-        tmp_3_summed = np.empty((unique_pairs_i1_i2.shape[0], 3, 3), dtype=e_nc.dtype)
-        for x, y in np.ndindex(3, 3):
-            weights = (tmp_3 * 
-                np.take(e_nc[:, x], nl_index_i1_j1) * 
-                np.take(e_nc[:, y], nl_index_i2_j1)
-            )
-            tmp_3_summed[:, x, y] = np.bincount(
-                    bincount_bins, weights=weights, 
-                    minlength=unique_pairs_i1_i2.shape[0]
-            ) 
-        nl_index_i1_j1 = None
-        nl_index_i2_j1 = None
-        weights = None
-        tmp_3 = None
-        bincount_bins = None
+        # The table of common neighbors is quadratic in the coordination
+        # number. It is processed in blocks that each contain all rows of a
+        # range of atoms i1, such that the sums for each pair (i1, i2) do not
+        # span multiple blocks.
+        unique_keys_i1_i2 = [np.zeros(0, dtype=np.int64)]
+        tmp_3_summed = [np.zeros((0, 3, 3), dtype=e_nc.dtype)]
+        for cnl_i1_i2, cnl_j1, nl_index_i1_j1, nl_index_i2_j1 in \
+                find_common_neighbours_chunked(i_n, j_n, nat):
+            key_i1_i2 = cnl_i1_i2[:, 0].astype(np.int64)*nat + cnl_i1_i2[:, 1]
+            cnl_i1_i2 = None
+            unique_key_i1_i2, bincount_bins = np.unique(key_i1_i2, return_inverse=True)
+            key_i1_i2 = None
+            tmp_3 = np.take(df_i_n, nl_index_i1_j1) * np.take(ddemb_i, cnl_j1) * np.take(df_i_n, nl_index_i2_j1)
+            cnl_j1 = None
+            block_summed = np.empty((unique_key_i1_i2.shape[0], 3, 3), dtype=e_nc.dtype)
+            for x, y in np.ndindex(3, 3):
+                weights = (tmp_3 * 
+                    np.take(e_nc[:, x], nl_index_i1_j1) * 
+                    np.take(e_nc[:, y], nl_index_i2_j1)
+                )
+                block_summed[:, x, y] = np.bincount(
+                        bincount_bins, weights=weights, 
+                        minlength=unique_key_i1_i2.shape[0]
+                ) 
+            nl_index_i1_j1 = None
+            nl_index_i2_j1 = None
+            weights = None
+            tmp_3 = None
+            bincount_bins = None
+            unique_keys_i1_i2 += [unique_key_i1_i2]
+            tmp_3_summed += [block_summed]
+        unique_keys_i1_i2 = np.concatenate(unique_keys_i1_i2)
+        unique_pairs_i1_i2 = np.transpose([unique_keys_i1_i2 // nat,
+                                           unique_keys_i1_i2 % nat]).astype(i_n.dtype)
+        unique_keys_i1_i2 = None
+        tmp_3_summed = np.concatenate(tmp_3_summed)
         if divide_by_masses:
             geom_mean_mass_i1_i2 = np.sqrt(
                 np.take(masses_i, unique_pairs_i1_i2[:, 0]) * np.take(masses_i, unique_pairs_i1_i2[:, 1])
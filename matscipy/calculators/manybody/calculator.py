@@ -31,6 +31,7 @@ Bond Order Potential.
 #   - n: Atomic index, i.e. array dimension of length nb_atoms
 #   - p: Pair index, i.e. array dimension of length nb_pairs
 #   - t: Triplet index, i.e. array dimension of length nb_triplets
+#   - q: Quadruplet index, i.e. array dimension of length nb_quadruplets
 #   - c: Cartesian index, array dimension of length 3
 #   - a: Cartesian index for the first dimension of the deformation gradient, array dimension of length 3
 #   - b: Cartesian index for the second dimension of the deformation gradient, array dimension of length 3
@@ -38,8 +39,6 @@ Bond Order Potential.
 
 import numpy as np
 
-from scipy.sparse.linalg import cg
-
 import ase
 
 from scipy.sparse import bsr_matrix
@@ -47,8 +46,9 @@ from scipy.sparse import bsr_matrix
 from ase.calculators.calculator import Calculator
 
 from ...elasticity import Voigt_6_to_full_3x3_stress
-from ...neighbours import find_indices_of_reversed_pairs, first_neighbours, neighbour_list, triplet_list
+from ...neighbours import first_neighbours, neighbour_list, triplet_list
 from ...numpy_tricks import mabincount
+from ..calculator import _hessian_operator, _non_affine_elastic_constants
 
 
 def _o(x, y, z=None):
@@ -59,12 +59,67 @@ def _o(x, y, z=None):
         return x.reshape(-1, 3, 1, 1) * y.reshape(-1, 1, 3, 1) * z.reshape(-1, 1, 1, 3)
 
 
+# Approximate size (in bytes) of the temporary arrays per triplet (and per
+# quadruplet) in `calculate` and `get_hessian`, used to split the triplet list
+# into blocks that fit into the memory budget
+_bytes_per_triplet_energy = 8 * 32
+_bytes_per_triplet_hessian = 8 * 192
+_bytes_per_quadruplet_hessian = 8 * 48
+
+
+def _atom_blocks(nb_bytes_n, memory_budget):
+    """
+    Split the atoms into blocks of consecutive atoms.
+
+    Parameters
+    ----------
+    nb_bytes_n: array
+        Cumulative memory (in bytes) required by the atoms, i.e. the memory
+        required by atoms 0 to i-1 is stored at index i.
+    memory_budget: int or None
+        Approximate upper bound (in bytes) of the memory per block. A block
+        contains at least one atom. If None, a single block is returned.
+
+    Returns
+    -------
+    iterator of tuple
+        First and (exclusive) last atom of each block.
+    """
+    nb_atoms = len(nb_bytes_n) - 1
+    if memory_budget is None:
+        yield 0, nb_atoms
+        return
+    a0 = 0
+    while a0 < nb_atoms:
+        a1 = np.searchsorted(nb_bytes_n, nb_bytes_n[a0] + memory_budget, side='right') - 1
+        a1 = min(max(a1, a0 + 1), nb_atoms)
+        yield a0, a1
+        a0 = a1
+
+
 class Manybody(Calculator):
-    implemented_properties = ['free_energy', 'energy', 'stress', 'forces']
+    implemented_properties = ['free_energy', 'energy', 'energies', 'stress', 'stresses', 'forces']
     default_parameters = {}
     name = 'Manybody'
 
-    def __init__(self, atom_type, pair_type, F, G, d1F, d2F, d11F, d22F, d12F, d1G, d11G, d2G, d22G, d12G, cutoff):
+    def __init__(self, atom_type, pair_type, F, G, d1F, d2F, d11F, d22F, d12F, d1G, d11G, d2G, d22G, d12G, cutoff,
+                 memory_budget=None):
+        """
+        Parameters
+        ----------
+        atom_type, pair_type: callable
+            Map atomic numbers to internal atom types and pairs of atom types
+            to internal pair types.
+        F, G, d1F, d2F, d11F, d22F, d12F, d1G, d11G, d2G, d22G, d12G: callable
+            Pair and triplet functions of the potential and their derivatives.
+        cutoff: float or array_like
+            Cutoff radius, either a single value or one per pair type.
+        memory_budget: int, optional
+            Approximate upper bound (in bytes) of the memory used by
+            per-triplet temporary arrays. If given, triplets are evaluated in
+            blocks of consecutive atoms and accumulated into per-pair arrays.
+            By default, all triplets are evaluated at once.
+        """
         Calculator.__init__(self)
         self.atom_type = atom_type
         self.pair_type = pair_type
@@ -82,6 +137,21 @@ class Manybody(Calculator):
         self.d12G = d12G
 
         self.cutoff = cutoff
+        self.memory_budget = memory_budget
+
+    def _blocks(self, first_n, ij_t, nb_bytes_per_triplet, nb_quadruplets_t=None):
+        """
+        Split pairs and triplets into blocks of consecutive atoms that fit
+        into the memory budget. Yields the pair and triplet slice of each
+        block.
+        """
+        first_t_n = np.searchsorted(ij_t, first_n)
+        nb_bytes_n = nb_bytes_per_triplet * first_t_n
+        if nb_quadruplets_t is not None:
+            first_q_t = np.append(0, np.cumsum(nb_quadruplets_t))
+            nb_bytes_n = nb_bytes_n + _bytes_per_quadruplet_hessian * first_q_t[first_t_n]
+        for a0, a1 in _atom_blocks(nb_bytes_n, self.memory_budget):
+            yield slice(first_n[a0], first_n[a1]), slice(first_t_n[a0], first_t_n[a1])
 
     def get_cutoff(self, atoms):
         if np.isscalar(self.cutoff):
@@ -116,51 +186,67 @@ class Manybody(Calculator):
         # normal vectors
         n_pc = (r_pc.T / r_p).T
 
-        # construct triplet list
-        first_n = first_neighbours(nb_atoms, i_p)
+        # construct triplet list (first_neighbours returns -1 for leading
+        # atoms without neighbours, hence pair offsets are obtained by search)
+        first_n = np.searchsorted(i_p, np.arange(nb_atoms + 1)).astype(i_p.dtype)
         ij_t, ik_t = triplet_list(first_n)
 
         # construct lists with atom and pair types
         ti_p = t_n[i_p]
         tij_p = self.pair_type(ti_p, t_n[j_p])
-        ti_t = t_n[i_p[ij_t]]
-        tij_t = self.pair_type(ti_t, t_n[j_p[ij_t]])
-        tik_t = self.pair_type(ti_t, t_n[j_p[ik_t]])
 
-        # potential-dependent functions
-        G_t = self.G(r_pc[ij_t], r_pc[ik_t], ti_t, tij_t, tik_t)
-        d1G_tc = self.d1G(r_pc[ij_t], r_pc[ik_t], ti_t, tij_t, tik_t)
-        d2G_tc = self.d2G(r_pc[ij_t], r_pc[ik_t], ti_t, tij_t, tik_t)
+        # Triplets are evaluated in blocks of consecutive atoms; all triplets
+        # of a block are formed by pairs within the block
+        blocks = list(self._blocks(first_n, ij_t, _bytes_per_triplet_energy))
 
-        xi_p = np.bincount(ij_t, weights=G_t, minlength=nb_pairs)
+        xi_p = np.zeros(nb_pairs)
+        for p, t in blocks:
+            ij, ik = ij_t[t], ik_t[t]
+            ti = ti_p[ij]
+            G_t = self.G(r_pc[ij], r_pc[ik], ti, tij_p[ij], tij_p[ik])
+            xi_p[p] += np.bincount(ij - p.start, weights=G_t, minlength=p.stop - p.start)
 
         F_p = self.F(r_p, xi_p, ti_p, tij_p)
         d1F_p = self.d1F(r_p, xi_p, ti_p, tij_p)
         d2F_p = self.d2F(r_p, xi_p, ti_p, tij_p)
-        d2F_d2G_t = (d2F_p[ij_t] * d2G_tc.T).T
 
         # calculate energy
         epot = 0.5 * np.sum(F_p)
 
         # calculate forces (per pair)
-        f_pc = (d1F_p * n_pc.T
-                + d2F_p * mabincount(ij_t, d1G_tc, nb_pairs).T
-                + mabincount(ik_t, d2F_d2G_t, nb_pairs).T).T
+        f_pc = (d1F_p * n_pc.T).T
+        for p, t in blocks:
+            ij, ik = ij_t[t], ik_t[t]
+            ti = ti_p[ij]
+            d1G_tc = self.d1G(r_pc[ij], r_pc[ik], ti, tij_p[ij], tij_p[ik])
+            d2G_tc = self.d2G(r_pc[ij], r_pc[ik], ti, tij_p[ij], tij_p[ik])
+            nb_pairs_blk = p.stop - p.start
+            f_pc[p] += (d2F_p[p] * mabincount(ij - p.start, d1G_tc, nb_pairs_blk).T).T \
+                + mabincount(ik - p.start, (d2F_p[ij] * d2G_tc.T).T, nb_pairs_blk)
 
         # collect atomic forces
         f_nc = 0.5 * (mabincount(i_p, f_pc, nb_atoms) - mabincount(j_p, f_pc, nb_atoms))
 
         # Virial 
-        virial_v = 0.5 * np.array([r_pc[:, 0] * f_pc.T[0],  # xx
-                                   r_pc[:, 1] * f_pc.T[1],  # yy
-                                   r_pc[:, 2] * f_pc.T[2],  # zz
-                                   r_pc[:, 1] * f_pc.T[2],  # yz
-                                   r_pc[:, 0] * f_pc.T[2],  # xz
-                                   r_pc[:, 0] * f_pc.T[1]]).sum(axis=1)  # xy
+        virial_pv = 0.5 * np.transpose([r_pc[:, 0] * f_pc.T[0],  # xx
+                                        r_pc[:, 1] * f_pc.T[1],  # yy
+                                        r_pc[:, 2] * f_pc.T[2],  # zz
+                                        r_pc[:, 1] * f_pc.T[2],  # yz
+                                        r_pc[:, 0] * f_pc.T[2],  # xz
+                                        r_pc[:, 0] * f_pc.T[1]])  # xy
+        virial_v = virial_pv.sum(axis=0)
+
+        # Per-atom energies and virials, the energy of a pair is attributed to
+        # its central atom and its virial equally to both atoms
+        epot_n = 0.5 * np.bincount(i_p, weights=F_p, minlength=nb_atoms)
+        virial_nv = 0.5 * (mabincount(i_p, virial_pv, nb_atoms)
+                           + mabincount(j_p, virial_pv, nb_atoms))
 
         self.results = {'free_energy': epot,
                         'energy': epot,
+                        'energies': epot_n,
                         'stress': virial_v / self.atoms.get_volume(),
+                        'stresses': virial_nv / self.atoms.get_volume(),
                         'forces': f_nc}
 
     def get_hessian(self, atoms, format='sparse', divide_by_masses=False):
@@ -198,41 +284,44 @@ class Manybody(Calculator):
         cutoff = self.get_cutoff(atoms)
 
         # construct neighbor list
-        i_p, j_p, r_p, r_pc = neighbour_list('ijdD', atoms=atoms, cutoff=2 * cutoff)
+        i_p, j_p, r_p, r_pc, tr_p = neighbour_list('ijdDR', atoms=atoms, cutoff=2 * cutoff)
 
         mask_p = r_p > cutoff
 
         nb_atoms = len(self.atoms)
         nb_pairs = len(i_p)
 
-        # reverse pairs
-        tr_p = find_indices_of_reversed_pairs(i_p, j_p, r_p)
-
         # normal vectors
         n_pc = (r_pc.T / r_p).T
 
         # construct triplet list (we need jk_t here, hence neighbor must be to 2 * cutoff)
-        first_n = first_neighbours(nb_atoms, i_p)
+        first_n = np.searchsorted(i_p, np.arange(nb_atoms + 1)).astype(i_p.dtype)
         ij_t, ik_t, jk_t = triplet_list(first_n, r_p, cutoff, i_p, j_p)
         first_p = first_neighbours(len(i_p), ij_t)
-        nb_triplets = len(ij_t)
 
         # construct lists with atom and pair types
         ti_p = t_n[i_p]
         tij_p = self.pair_type(ti_p, t_n[j_p])
-        ti_t = t_n[i_p[ij_t]]
-        tij_t = self.pair_type(ti_t, t_n[j_p[ij_t]])
-        tik_t = self.pair_type(ti_t, t_n[j_p[ik_t]])
-
-        # potential-dependent functions
-        G_t = self.G(r_pc[ij_t], r_pc[ik_t], ti_t, tij_t, tik_t)
-        d1G_tc = self.d1G(r_pc[ij_t], r_pc[ik_t], ti_t, tij_t, tik_t)
-        d2G_tc = self.d2G(r_pc[ij_t], r_pc[ik_t], ti_t, tij_t, tik_t)
-        d11G_tcc = self.d11G(r_pc[ij_t], r_pc[ik_t], ti_t, tij_t, tik_t)
-        d12G_tcc = self.d12G(r_pc[ij_t], r_pc[ik_t], ti_t, tij_t, tik_t)
-        d22G_tcc = self.d22G(r_pc[ij_t], r_pc[ik_t], ti_t, tij_t, tik_t)
 
-        xi_p = np.bincount(ij_t, weights=G_t, minlength=nb_pairs)
+        # Triplets are evaluated in blocks of consecutive atoms. Every triplet
+        # (il, im) forms quadruplets with the triplets (il, ij), ij != im,
+        # which also belong to the block of atom i.
+        nb_quadruplets_t = first_p[ij_t + 1] - first_p[ij_t] - 1
+        blocks = list(self._blocks(first_n, ij_t, _bytes_per_triplet_hessian, nb_quadruplets_t))
+
+        xi_p = np.zeros(nb_pairs)
+        d1G_pc = np.zeros((nb_pairs, 3))
+        d2G_pc = np.zeros((nb_pairs, 3))
+        for p, t in blocks:
+            ij, ik = ij_t[t], ik_t[t]
+            ti = ti_p[ij]
+            nb_pairs_blk = p.stop - p.start
+            G_t = self.G(r_pc[ij], r_pc[ik], ti, tij_p[ij], tij_p[ik])
+            d1G_tc = self.d1G(r_pc[ij], r_pc[ik], ti, tij_p[ij], tij_p[ik])
+            d2G_tc = self.d2G(r_pc[ij], r_pc[ik], ti, tij_p[ij], tij_p[ik])
+            xi_p[p] += np.bincount(ij - p.start, weights=G_t, minlength=nb_pairs_blk)
+            d1G_pc[p] += mabincount(ij - p.start, d1G_tc, nb_pairs_blk)
+            d2G_pc[p] += mabincount(ij - p.start, d2G_tc, nb_pairs_blk)
 
         d1F_p = self.d1F(r_p, xi_p, ti_p, tij_p)
         d1F_p[mask_p] = 0.0  # we need to explicitly exclude everything with r > cutoff
@@ -252,61 +341,88 @@ class Manybody(Calculator):
         # Hessian term #1
         H_pcc -= (d11F_p * nn_pcc.T).T
 
-        # Hessian term #2
-        H_temp3_t = (d12F_p[ij_t] * _o(d2G_tc, n_pc[ij_t]).T).T
-        H_temp4_t = (d12F_p[ij_t] * _o(d1G_tc, n_pc[ij_t]).T).T
-
-        # Hessian term #5
-        H_temp2_t = (d2F_p[ij_t] * d22G_tcc.T).T
-        H_temp_t = (d2F_p[ij_t] * d11G_tcc.T).T
-        H_temp1_t = (d2F_p[ij_t] * d12G_tcc.T).T
-
         # Hessian term #3
 
         ## Terms involving D_1 * D_1
-        d1G_pc = mabincount(ij_t, d1G_tc, nb_pairs)
         H_pcc -= (d22F_p * _o(d1G_pc, d1G_pc).T).T
 
-        ## Terms involving D_2 * D_2
-        d2G_pc = mabincount(ij_t, d2G_tc, nb_pairs)
-        Q1 = _o((d22F_p * d2G_pc.T).T[ij_t], d2G_tc)
-
         ## Terms involving D_1 * D_2
-        Q2 = _o((d22F_p * d1G_pc.T).T[ij_t], d2G_tc)
-
         H_pcc -= (d22F_p * _o(d2G_pc, d1G_pc).T).T
 
-        H_pcc += \
-            - mabincount(ij_t, weights=H_temp_t, minlength=nb_pairs) \
-            + mabincount(jk_t, weights=H_temp1_t, minlength=nb_pairs) \
-            - mabincount(tr_p[ij_t], weights=H_temp1_t, minlength=nb_pairs) \
-            - mabincount(ik_t, weights=H_temp1_t, minlength=nb_pairs) \
-            - mabincount(ik_t, weights=H_temp2_t, minlength=nb_pairs) \
-            + mabincount(tr_p[jk_t], weights=H_temp3_t, minlength=nb_pairs) \
-            - mabincount(ij_t, weights=H_temp3_t, minlength=nb_pairs) \
-            - mabincount(tr_p[ik_t], weights=H_temp3_t, minlength=nb_pairs) \
-            - mabincount(ij_t, weights=H_temp4_t, minlength=nb_pairs) \
-            - mabincount(tr_p[ij_t], weights=H_temp4_t, minlength=nb_pairs) \
-            - mabincount(ik_t, weights=Q1, minlength=nb_pairs) \
-            + mabincount(jk_t, weights=Q2, minlength=nb_pairs) \
-            - mabincount(ik_t, weights=Q2, minlength=nb_pairs)
-
-        for il_im in range(nb_triplets):
-            il = ij_t[il_im]
-            im = ik_t[il_im]
-            lm = jk_t[il_im]
-            ti = ti_t[il_im]
-            tij = tij_t[il_im]
-            tim = tik_t[il_im]
-            til = tij_t[il_im]
-            for t in range(first_p[il], first_p[il + 1]):
-                ij = ik_t[t]
-                if ij != il and ij != im:
-                    r_p_ij = np.array([r_pc[ij]])
-                    r_p_il = np.array([r_pc[il]])
-                    r_p_im = np.array([r_pc[im]])
-                    H_pcc[lm, :, :] += (0.5 * d22F_p[ij] * (_o(self.d2G(r_p_ij, r_p_il, ti, tij, til),
-                                                               self.d2G(r_p_ij, r_p_im, ti, tij, tim))).T).T.squeeze()
+        d22F_d2G_pc = (d22F_p * d2G_pc.T).T
+        d22F_d1G_pc = (d22F_p * d1G_pc.T).T
+
+        # Contributions of each block are accumulated into the pairs touched
+        # by the block only, such that temporary arrays scale with the size
+        # of the block
+        for p, t in blocks:
+            ij, ik, jk = ij_t[t], ik_t[t], jk_t[t]
+            ti = ti_p[ij]
+            args = (r_pc[ij], r_pc[ik], ti, tij_p[ij], tij_p[ik])
+            d1G_tc = self.d1G(*args)
+            d2G_tc = self.d2G(*args)
+
+            pairs_u, inv_u = np.unique(np.concatenate([ij, ik, jk, tr_p[ij], tr_p[jk], tr_p[ik]]),
+                                       return_inverse=True)
+            ij_u, ik_u, jk_u, ji_u, kj_u, ki_u = inv_u.reshape(6, -1)
+            nb_pairs_u = len(pairs_u)
+            H_ucc = np.zeros((nb_pairs_u, 3, 3))
+
+            # Hessian term #2
+            H_temp_t = (d12F_p[ij] * _o(d2G_tc, n_pc[ij]).T).T
+            H_ucc += mabincount(kj_u, weights=H_temp_t, minlength=nb_pairs_u) \
+                - mabincount(ij_u, weights=H_temp_t, minlength=nb_pairs_u) \
+                - mabincount(ki_u, weights=H_temp_t, minlength=nb_pairs_u)
+            H_temp_t = (d12F_p[ij] * _o(d1G_tc, n_pc[ij]).T).T
+            H_ucc -= mabincount(ij_u, weights=H_temp_t, minlength=nb_pairs_u) \
+                + mabincount(ji_u, weights=H_temp_t, minlength=nb_pairs_u)
+
+            # Hessian term #5
+            H_temp_t = (d2F_p[ij] * self.d22G(*args).T).T
+            H_ucc -= mabincount(ik_u, weights=H_temp_t, minlength=nb_pairs_u)
+            H_temp_t = (d2F_p[ij] * self.d11G(*args).T).T
+            H_ucc -= mabincount(ij_u, weights=H_temp_t, minlength=nb_pairs_u)
+            H_temp_t = (d2F_p[ij] * self.d12G(*args).T).T
+            H_ucc += mabincount(jk_u, weights=H_temp_t, minlength=nb_pairs_u) \
+                - mabincount(ji_u, weights=H_temp_t, minlength=nb_pairs_u) \
+                - mabincount(ik_u, weights=H_temp_t, minlength=nb_pairs_u)
+
+            # Hessian term #3
+
+            ## Terms involving D_2 * D_2
+            H_temp_t = _o(d22F_d2G_pc[ij], d2G_tc)
+            H_ucc -= mabincount(ik_u, weights=H_temp_t, minlength=nb_pairs_u)
+
+            ## Terms involving D_1 * D_2
+            H_temp_t = _o(d22F_d1G_pc[ij], d2G_tc)
+            H_ucc += mabincount(jk_u, weights=H_temp_t, minlength=nb_pairs_u) \
+                - mabincount(ik_u, weights=H_temp_t, minlength=nb_pairs_u)
+            del H_temp_t
+
+            H_pcc[pairs_u] += H_ucc
+            del H_ucc
+
+            # Hessian term #3, contribution of D_2 * D_2 with distinct
+            # triplets (ij, il) and (ij, im) to the block of pair lm.
+            # Quadruplets are constructed from all triplets (il, im) and all
+            # triplets (il, ij) with ij != im.
+            nb_ij_t = nb_quadruplets_t[t] + 1
+            il_im_q = np.repeat(np.arange(t.start, t.stop), nb_ij_t)
+            il_ij_q = np.arange(len(il_im_q)) \
+                - np.repeat(np.cumsum(nb_ij_t) - nb_ij_t, nb_ij_t) \
+                + np.repeat(first_p[ij], nb_ij_t)
+            ij_q = ik_t[il_ij_q]
+            mask_q = ij_q != ik_t[il_im_q]
+            il_im_q = il_im_q[mask_q]
+            ij_q = ij_q[mask_q]
+            il_q = ij_t[il_im_q]
+            im_q = ik_t[il_im_q]
+            ti_q = ti_p[il_q]
+            Q3 = (0.5 * d22F_p[ij_q]
+                  * _o(self.d2G(r_pc[ij_q], r_pc[il_q], ti_q, tij_p[ij_q], tij_p[il_q]),
+                       self.d2G(r_pc[ij_q], r_pc[im_q], ti_q, tij_p[ij_q], tij_p[im_q])).T).T
+            pairs_u, lm_u = np.unique(jk_t[il_im_q], return_inverse=True)
+            H_pcc[pairs_u] += mabincount(lm_u, weights=Q3, minlength=len(pairs_u))
 
         # Add the conjugate terms (symmetrize Hessian)
         H_pcc += H_pcc.transpose(0, 2, 1)[tr_p]
@@ -335,6 +451,35 @@ class Manybody(Calculator):
         elif format == "neighbour-list":
             return H_pcc / 2, i_p, j_p, r_pc, r_p
 
+    def get_hessian_operator(self, atoms, divide_by_masses=False):
+        """
+        Return the Hessian matrix as a linear operator that computes
+        Hessian-vector products from the Hessian blocks per atom pair,
+        without assembling the sparse matrix.
+
+        Parameters
+        ----------
+        atoms: ase.Atoms
+            Atomic configuration in a local or global minima.
+
+        divide_by_masses: bool
+            if true return the dynamic matrix else hessian matrix
+
+        Returns
+        -------
+        scipy.sparse.linalg.LinearOperator
+            either hessian or dynamic matrix
+        """
+        nb_atoms = len(atoms)
+        H_pcc, i_p, j_p, r_pc, r_p = self.get_hessian(atoms, 'neighbour-list')
+
+        def matvec(v):
+            v_nc = v.reshape(nb_atoms, 3)
+            Hv_pc = np.einsum('pab,pb->pa', H_pcc, v_nc[j_p] - v_nc[i_p])
+            return mabincount(i_p, Hv_pc, nb_atoms).reshape(v.shape)
+
+        return _hessian_operator(matvec, atoms, divide_by_masses)
+
     def get_second_derivative(self, atoms, drda_pc, drdb_pc, i_p=None, j_p=None, r_p=None, r_pc=None):
         """
         Calculate the second derivative of the energy with respect to arbitrary variables a and b.
@@ -599,7 +744,8 @@ class Manybody(Calculator):
     def get_non_affine_contribution_to_elastic_constants(self, atoms, eigenvalues=None, eigenvectors=None, tol=1e-5):
         """
         Compute the correction of non-affine displacements to the elasticity tensor.
-        The computation of the occuring inverse of the Hessian matrix is bypassed by using a cg solver.
+        The computation of the occuring inverse of the Hessian matrix is bypassed by using a block cg solver
+        for the six symmetric strain components.
 
         If eigenvalues and and eigenvectors are given the inverse of the Hessian can be easily computed.
 
@@ -636,17 +782,7 @@ class Manybody(Calculator):
         else:
             H_nn = calc.get_hessian(atoms, "sparse")
             naforces_icab = calc.get_non_affine_forces(atoms)
-
-            D_iab = np.zeros((3 * nat, 3, 3))
-            for i in range(3):
-                for j in range(3):
-                    x, info = cg(H_nn, naforces_icab[:, :, i, j].flatten(), atol=tol)
-                    if info != 0:
-                        raise RuntimeError(
-                            " info > 0: CG tolerance not achieved, info < 0: Exceeded number of iterations.")
-                    D_iab[:, i, j] = x
-
-            C_abab = np.sum(naforces_icab.reshape(3 * nat, 3, 3, 1, 1) * D_iab.reshape(3 * nat, 1, 1, 3, 3), axis=0)
+            C_abab = _non_affine_elastic_constants(H_nn, naforces_icab, atol=tol)
 
         # Symmetrize 
         C_abab = (C_abab + C_abab.swapaxes(0, 1) + C_abab.swapaxes(2, 3) + C_abab.swapaxes(0, 1).swapaxes(2, 3)) / 4
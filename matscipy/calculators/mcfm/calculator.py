@@ -45,7 +45,8 @@ class MultiClusterForceMixingPotential(Calculator):
     def __init__(self, atoms=None, classical_calculator=None, qm_calculator=None,
                  qm_cluster=None, forced_qm_list=None, change_bonds=True,
                  calculate_errors=False, calculation_always_required=False,
-                 buffer_hops=10, verbose=0, enable_check_state=True):
+                 buffer_hops=10, verbose=0, enable_check_state=True,
+                 persistent_workers=False):
         """Initialize a generic ASE potential without any calculating power,
         This is only to have access to the necessary functions, all the
         evaluations will be performes in self.mm_pot and self.qm_calculator
@@ -79,6 +80,15 @@ class MultiClusterForceMixingPotential(Calculator):
             (the default is 0)
         enable_check_state : bool
             Save the atoms after each evaluation to enable meth::check_state
+        persistent_workers : bool
+            Evaluate QM clusters in parallel on a pool of worker processes
+            that persists across calls. Every worker keeps its copy of the
+            QM calculator, hence the QM calculator must not be changed after
+            the first evaluation. Clusters are preferably evaluated by the
+            same worker as in the previous step, but a calculator that
+            restarts from previous results must not assume that these belong
+            to the same cluster. Stop the workers with meth::shutdown_workers
+            (the default is False)
         """
 
         # Set the verbose status
@@ -111,6 +121,8 @@ class MultiClusterForceMixingPotential(Calculator):
         self.conserve_momentum = False
         self.long_range_weight = 0.0
         self.doParallel = True
+        self.persistent_workers = persistent_workers
+        self.worker_pool = None
 
         # Flag for QM debugging
         self.debug_qm_calculator = False
@@ -252,6 +264,12 @@ class MultiClusterForceMixingPotential(Calculator):
         if (self.calculate_errors):
             self.evaluate_errors(atoms=atoms)
 
+    def shutdown_workers(self):
+        """Stop the worker processes used for parallel QM evaluations"""
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+            self.worker_pool = None
+
     def produce_classical_results(self, atoms=None):
         """Call the classical potential ot obtain forces, potential energy
         and potential energies per atom
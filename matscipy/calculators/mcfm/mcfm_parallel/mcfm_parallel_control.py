@@ -21,11 +21,255 @@
 import numpy as np
 
 import os
+import queue
 import time
 import multiprocessing as mp
 from . import mcfm_parallel_worker as mpw
 
 
+def get_number_of_processors():
+    """Number of processors available for the QM calculations, taken from
+    OMP_NUM_THREADS or half the number of CPUs"""
+    try:
+        nProc = int(os.environ["OMP_NUM_THREADS"])
+    except KeyError:
+        nProc = mp.cpu_count() // 2
+    return max(nProc, 1)
+
+
+def distribute_processors(workload, nProc):
+    """Distribute processors among clusters proportionally to their workload
+
+    Parameters
+    ----------
+    workload : list
+        Estimated workload of each cluster
+    nProc : int
+        number of processors
+
+    Returns
+    -------
+    fractionWorkloadPerCluster : list
+        Fraction of the total workload of each cluster
+    nProcPerCluster : list
+        Number of processors of each cluster (at least one)
+    """
+    numThreads = len(workload)
+
+    # In case there are not enough cpu's,
+    # have the number of processes artificially increased
+    if (numThreads > nProc):
+        nProc = numThreads
+
+    totalWorkload = sum(workload)
+    fractionWorkloadPerCluster = [item / totalWorkload for item in workload]
+
+    nProcPerCluster = [1 for item in workload]
+    leftoverProcs = nProc - sum(nProcPerCluster)
+    # Distribute leftoverProcs
+    for i in range(numThreads):
+        nProcPerCluster[i] += int(fractionWorkloadPerCluster[i] * leftoverProcs)
+
+    # Disribute leftover procs (if any)
+    leftoverProcs = nProc - sum(nProcPerCluster)
+    running = True
+    while running:
+        for i in np.argsort(fractionWorkloadPerCluster)[::-1]:
+            if (leftoverProcs <= 0):
+                running = False
+                break
+            nProcPerCluster[i] += 1
+            leftoverProcs -= 1
+
+    return fractionWorkloadPerCluster, nProcPerCluster
+
+
+def estimate_workload(atomicClustersList):
+    """Estimate the workload of each cluster from its number of valence
+    electrons"""
+    valenceElectrons = [np.sum(np.abs(item.numbers - 2)) for item in atomicClustersList]
+    return [(item ** 2) for item in valenceElectrons]
+
+
+class ClusterWorkerPool(object):
+    """Pool of persistent worker processes for the evaluation of QM clusters.
+
+    Every worker holds its own copy of the QM calculator for the lifetime of
+    the pool, such that calculators remain initialised between steps. Each
+    worker has its own task queue. A cluster is queued for the worker that
+    evaluated it in the previous step, so the calculator can restart from the
+    results of the same cluster; new clusters are queued for the worker with
+    the smallest expected load. Idle workers steal tasks from other queues.
+    The expected runtime is the runtime measured for the same cluster in the
+    previous evaluation, or is estimated from the number of valence electrons
+    for new clusters.
+
+    Parameters
+    ----------
+    qm_calculator : ASE.calculator
+        calculator to be used for the evaluations
+    nb_workers : int
+        number of worker processes
+    debug_qm_calculator : bool
+        run the simulation in debug mode
+    poll_interval : float
+        time (in seconds) between checks whether the workers are alive while
+        waiting for results
+    """
+
+    def __init__(self, qm_calculator, nb_workers, debug_qm_calculator=False,
+                 poll_interval=1.0):
+        self.task_queues = [mp.Queue() for rank in range(nb_workers)]
+        self.result_queue = mp.Queue()
+        self.stop_event = mp.Event()
+        self.poll_interval = poll_interval
+        self.runtimes = {}
+        self.ranks = {}
+        self.workers = []
+        for rank in range(nb_workers):
+            p = mp.Process(target=mpw.worker_loop,
+                           args=(rank, qm_calculator, self.task_queues, self.result_queue,
+                                 self.stop_event),
+                           kwargs=dict(debug_qm_calculator=debug_qm_calculator),
+                           daemon=True)
+            p.start()
+            self.workers.append(p)
+
+    def expected_runtimes(self, cluster_list, workload):
+        """Expected runtime of each cluster
+
+        Parameters
+        ----------
+        cluster_list : list
+            list with indexes of the atoms of each cluster
+        workload : list
+            Estimated workload of each cluster, used for clusters without
+            measured runtime
+
+        Returns
+        -------
+        np.array
+            Expected runtime of each cluster
+        """
+        keys = [tuple(sorted(cluster)) for cluster in cluster_list]
+        workload = np.asarray(workload, dtype=float)
+        measured = np.array([key in self.runtimes for key in keys], dtype=bool)
+        # Convert workload estimates into runtimes using the measured clusters
+        scale = 1.0
+        if measured.any() and workload[measured].sum() > 0:
+            scale = sum(self.runtimes[key] for key, m in zip(keys, measured) if m) / \
+                workload[measured].sum()
+        return np.array([self.runtimes[key] if m else scale * w
+                         for key, m, w in zip(keys, measured, workload)])
+
+    def preferred_workers(self, cluster_list, expected_runtimes):
+        """Worker of each cluster. Clusters stay with the worker that
+        evaluated them before, new clusters are assigned in the order of
+        decreasing expected runtime to the worker with the smallest load.
+
+        Parameters
+        ----------
+        cluster_list : list
+            list with indexes of the atoms of each cluster
+        expected_runtimes : list
+            Expected runtime of each cluster
+
+        Returns
+        -------
+        list
+            Rank of the worker of each cluster
+        """
+        nb_workers = len(self.task_queues)
+        keys = [tuple(sorted(cluster)) for cluster in cluster_list]
+        ranks = [self.ranks.get(key) for key in keys]
+        load = np.zeros(nb_workers)
+        for rank, runtime in zip(ranks, expected_runtimes):
+            if rank is not None:
+                load[rank] += runtime
+        for index in np.argsort(expected_runtimes)[::-1]:
+            if ranks[index] is None:
+                ranks[index] = int(np.argmin(load))
+                load[ranks[index]] += expected_runtimes[index]
+        return ranks
+
+    def evaluate(self, atomicClustersList, cluster_list, nAtoms, nProcPerCluster, expected_runtimes):
+        """Evaluate QM clusters on the workers
+
+        Parameters
+        ----------
+        atomicClustersList : list
+            Carved clusters
+        cluster_list : list
+            list with indexes of the atoms of each cluster
+        nAtoms : int
+            number of atoms in the full structure
+        nProcPerCluster : list
+            Number of processors of each cluster
+        expected_runtimes : list
+            Expected runtime of each cluster, used for scheduling
+
+        Returns
+        -------
+        list
+            Cluster data of each cluster
+
+        Raises
+        ------
+        RuntimeError
+            if a worker process died, the pool is terminated in this case
+        """
+        ranks = self.preferred_workers(cluster_list, expected_runtimes)
+        for index in np.argsort(expected_runtimes)[::-1]:
+            self.task_queues[ranks[index]].put((index, nProcPerCluster[index], atomicClustersList[index],
+                                                cluster_list[index], nAtoms))
+
+        clusterData = [None] * len(atomicClustersList)
+        runtimes = {}
+        error = None
+        nb_results = 0
+        while nb_results < len(atomicClustersList):
+            try:
+                index, rank, cluster_data, runtime = self.result_queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                dead = [rank for rank, p in enumerate(self.workers) if not p.is_alive()]
+                if dead:
+                    exitcodes = [self.workers[rank].exitcode for rank in dead]
+                    self.terminate()
+                    raise RuntimeError("QM worker processes {} died with exit codes {}."
+                                       .format(dead, exitcodes))
+                continue
+            nb_results += 1
+            if runtime is None:
+                error = cluster_data
+                continue
+            clusterData[index] = cluster_data
+            key = tuple(sorted(cluster_list[index]))
+            runtimes[key] = runtime
+            self.ranks[key] = rank
+        if error is not None:
+            raise error
+
+        # Only keep runtimes and workers of the current clusters
+        self.runtimes = runtimes
+        self.ranks = {key: self.ranks[key] for key in runtimes}
+        return clusterData
+
+    def close(self):
+        """Stop all worker processes"""
+        self.stop_event.set()
+        for p in self.workers:
+            p.join()
+        self.workers = []
+
+    def terminate(self):
+        """Kill all worker processes"""
+        for p in self.workers:
+            p.terminate()
+        for p in self.workers:
+            p.join()
+        self.workers = []
+
+
 def get_cluster_data(atoms=None,
                      clusterData=None,
                      mcfm_pot=None):
@@ -41,19 +285,11 @@ def get_cluster_data(atoms=None,
         qmmm potential
     """
     # number of porcessors
-    try:
-        nProc = int(os.environ["OMP_NUM_THREADS"])
-    except KeyError:
-        nProc = mp.cpu_count() / 2
+    nProc = get_number_of_processors()
 
     # number of threads - number of clusters
     numThreads = len(mcfm_pot.cluster_list)
 
-    # In case there are not enough cpu's,
-    # have the number of processes artificially increased
-    if (numThreads > nProc):
-        nProc = numThreads
-
     # Create atomic clusters and evaluate their sizes
     atomicClustersList = []
 
@@ -64,31 +300,24 @@ def get_cluster_data(atoms=None,
         atomicClustersList.append(atomicCluster)
 
     # ------ Evaluate work balancing
-    valenceElectrons = [np.sum(np.abs(item.numbers - 2)) for item in atomicClustersList]
-    fractionWorkloadPerCluster = [(item ** 2) for item in valenceElectrons]
-    totalWorkload = sum(fractionWorkloadPerCluster)
-    fractionWorkloadPerCluster = [item / totalWorkload for item in fractionWorkloadPerCluster]
-
-    nProcPerCluster = [1 for item in atomicClustersList]
-    leftoverProcs = nProc - sum(nProcPerCluster)
-    # Distribute leftoverProcs
-    for i in range(numThreads):
-        nProcPerCluster[i] += int(fractionWorkloadPerCluster[i] * leftoverProcs)
-
-    # Disribute leftover procs (if any)
-    leftoverProcs = nProc - sum(nProcPerCluster)
-    running = True
-    while running:
-        for i in np.argsort(fractionWorkloadPerCluster)[::-1]:
-            if (leftoverProcs <= 0):
-                running = False
-                break
-            nProcPerCluster[i] += 1
-            leftoverProcs -= 1
+    workload = estimate_workload(atomicClustersList)
+    if mcfm_pot.persistent_workers:
+        if mcfm_pot.worker_pool is None or not mcfm_pot.worker_pool.workers:
+            mcfm_pot.worker_pool = ClusterWorkerPool(mcfm_pot.qm_calculator, nProc,
+                                                     debug_qm_calculator=mcfm_pot.debug_qm_calculator)
+        workload = mcfm_pot.worker_pool.expected_runtimes(mcfm_pot.cluster_list, workload)
+    fractionWorkloadPerCluster, nProcPerCluster = distribute_processors(workload, nProc)
 
     if (mcfm_pot.debug_qm_calculator):
         print(fractionWorkloadPerCluster, nProcPerCluster, ":parallelTime")
 
+    if mcfm_pot.persistent_workers:
+        results = mcfm_pot.worker_pool.evaluate(atomicClustersList, mcfm_pot.cluster_list,
+                                                len(atoms), nProcPerCluster, workload)
+        for index in range(len(clusterData)):
+            clusterData[index] = results[index]
+        return
+
     # Set up the Manager
     mpManager = mp.Manager()
     sharedList = mpManager.list(list(range(numThreads)))
@@ -20,6 +20,7 @@
 #
 import numpy as np
 
+import queue
 import random
 import timeit
 import os
@@ -30,24 +31,18 @@ from ..cluster_data import ClusterData
 random.seed(123)
 
 
-def worker_populate_cluster_data(rank, size,
-                                 nProcLocal=None,
-                                 atomic_cluster=None,
-                                 clusterIndexes=None,
-                                 nAtoms=None,
-                                 qmCalculator=None,
-                                 sharedList=None,
-                                 debug_qm_calculator=False):
-    """Function to calcuate total energy with TB
+def evaluate_cluster_data(rank,
+                          atomic_cluster=None,
+                          clusterIndexes=None,
+                          nAtoms=None,
+                          qmCalculator=None,
+                          debug_qm_calculator=False):
+    """Evaluate the QM forces of a cluster
 
     Parameters
     ----------
     rank : int
         process number
-    size : int
-        total number of processes
-    nProcLocal : int
-        number of CPUS to be used for this calculation
     atomic_cluster : ASE.atoms
         Stucture on which ot perform the evaluation
     clusterIndexes : np.array
@@ -56,24 +51,16 @@ def worker_populate_cluster_data(rank, size,
         number of atoms in the cluster
     qmCalculator : ASE.calculator
         calculator to be used for the evaluation
-    sharedList : list
-        mp shared list used ot store output data
     debug_qm_calculator : bool
         run the simulation in debug mode
-    """
 
-    # ------ MultiProcessing library pickes all objects and
-    # ------ each workr thread recieves a copy
-
-    # If a caluclator has the options, set parallel parameters
-    try:
-        # Create a new calculation seed
-        qmCalculator.calculationSeed = str(int(random.random() * 1e7)) + str(rank)
-        # Set OMP values for the potential
-        qmCalculator.omp_set_threads = True
-        qmCalculator.omp_num_threads = nProcLocal
-    except AttributeError:
-        pass
+    Returns
+    -------
+    cluster_data : matscipy.calculators.mcfm.ClusterData
+        cluster data with the QM forces
+    runtime : float
+        wall time of the QM calculation
+    """
 
     # Create a cluster data object with relevan values
     mark = np.zeros(nAtoms, dtype=int)
@@ -109,7 +96,6 @@ def worker_populate_cluster_data(rank, size,
     except KeyError:
         pass
     cluster_data.qm_charges = qm_charges
-    sharedList[rank] = cluster_data
 
     if (debug_qm_calculator):
         try:
@@ -118,3 +104,145 @@ def worker_populate_cluster_data(rank, size,
         except KeyError:
             pass
         ase.io.write("cluster_ext_" + str(rank) + ".xyz", atomic_cluster, format="extxyz")
+
+    return cluster_data, t1 - t0
+
+
+def set_calculation_seed(qmCalculator, rank):
+    """Set a new calculation seed of the calculator, if the calculator has
+    this option"""
+    try:
+        qmCalculator.calculationSeed = str(int(random.random() * 1e7)) + str(rank)
+    except AttributeError:
+        pass
+
+
+def set_number_of_threads(qmCalculator, nProcLocal):
+    """Set the number of OpenMP threads of the calculator, if the calculator
+    has this option"""
+    try:
+        qmCalculator.omp_set_threads = True
+        qmCalculator.omp_num_threads = nProcLocal
+    except AttributeError:
+        pass
+
+
+def set_parallel_parameters(qmCalculator, rank, nProcLocal):
+    """Set calculation seed and number of OpenMP threads of the calculator,
+    if the calculator has these options"""
+    set_calculation_seed(qmCalculator, rank)
+    set_number_of_threads(qmCalculator, nProcLocal)
+
+
+def worker_populate_cluster_data(rank, size,
+                                 nProcLocal=None,
+                                 atomic_cluster=None,
+                                 clusterIndexes=None,
+                                 nAtoms=None,
+                                 qmCalculator=None,
+                                 sharedList=None,
+                                 debug_qm_calculator=False):
+    """Function to calcuate total energy with TB
+
+    Parameters
+    ----------
+    rank : int
+        process number
+    size : int
+        total number of processes
+    nProcLocal : int
+        number of CPUS to be used for this calculation
+    atomic_cluster : ASE.atoms
+        Stucture on which ot perform the evaluation
+    clusterIndexes : np.array
+        list with indexes of different cluster atoms
+    nAtoms : int
+        number of atoms in the cluster
+    qmCalculator : ASE.calculator
+        calculator to be used for the evaluation
+    sharedList : list
+        mp shared list used ot store output data
+    debug_qm_calculator : bool
+        run the simulation in debug mode
+    """
+
+    # ------ MultiProcessing library pickes all objects and
+    # ------ each workr thread recieves a copy
+
+    # If a caluclator has the options, set parallel parameters
+    set_parallel_parameters(qmCalculator, rank, nProcLocal)
+
+    cluster_data, runtime = evaluate_cluster_data(rank,
+                                                  atomic_cluster=atomic_cluster,
+                                                  clusterIndexes=clusterIndexes,
+                                                  nAtoms=nAtoms,
+                                                  qmCalculator=qmCalculator,
+                                                  debug_qm_calculator=debug_qm_calculator)
+    sharedList[rank] = cluster_data
+
+
+def get_task(rank, task_queues, timeout):
+    """Take the next task from the own queue of the worker or, if it is
+    empty, steal one from the queue of another worker. Returns None if no
+    task arrived within timeout."""
+    nb_workers = len(task_queues)
+    for offset in range(nb_workers):
+        try:
+            return task_queues[(rank + offset) % nb_workers].get_nowait()
+        except queue.Empty:
+            pass
+    try:
+        return task_queues[rank].get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+
+def worker_loop(rank, qmCalculator, task_queues, result_queue, stop_event,
+                debug_qm_calculator=False, poll_interval=0.1):
+    """Main loop of a persistent worker process. The worker keeps its copy
+    of the QM calculator across tasks. Every cluster is queued for the worker
+    that evaluated it before, such that the calculator can restart from the
+    results (e.g. wavefunctions) of the same cluster. Idle workers steal
+    tasks from the queues of other workers, hence a calculator that restarts
+    from previous results must check that these belong to the cluster at
+    hand and must not restart across different clusters.
+
+    Parameters
+    ----------
+    rank : int
+        process number
+    qmCalculator : ASE.calculator
+        calculator to be used for the evaluations
+    task_queues : list of multiprocessing.Queue
+        queues of tasks (index, nProcLocal, atomic_cluster, clusterIndexes,
+        nAtoms) of all workers, the queue of this worker is at index rank
+    result_queue : multiprocessing.Queue
+        queue of results (index, rank, cluster_data, runtime), or (index,
+        rank, exception, None) if the evaluation failed
+    stop_event : multiprocessing.Event
+        the worker exits when this event is set
+    debug_qm_calculator : bool
+        run the simulation in debug mode
+    poll_interval : float
+        time (in seconds) to wait for a task before checking for stolen work
+        and for the stop event
+    """
+    # The seed is kept for the lifetime of the worker, such that calculators
+    # that name scratch or restart files after it can restart
+    set_calculation_seed(qmCalculator, rank)
+    while not stop_event.is_set():
+        task = get_task(rank, task_queues, poll_interval)
+        if task is None:
+            continue
+        index, nProcLocal, atomic_cluster, clusterIndexes, nAtoms = task
+        try:
+            set_number_of_threads(qmCalculator, nProcLocal)
+            cluster_data, runtime = evaluate_cluster_data(rank,
+                                                          atomic_cluster=atomic_cluster,
+                                                          clusterIndexes=clusterIndexes,
+                                                          nAtoms=nAtoms,
+                                                          qmCalculator=qmCalculator,
+                                                          debug_qm_calculator=debug_qm_calculator)
+            result_queue.put((index, rank, cluster_data, runtime))
+        except Exception as e:
+            result_queue.put((index, rank, e, None))
@@ -62,3 +62,20 @@ class NeighbourListBase(object):
 
         """
         raise NotImplementedError("Must implement this function!")
+
+    def get_neighbours_of_list(self, indices):
+        """Return the neighbours of all atoms in a list.
+
+        Parameters
+        ----------
+        indices : array_like
+            atomic indices
+
+        Returns
+        -------
+        np.array
+            concatenated arrays of neighbouring indices
+
+        """
+        return np.concatenate([np.zeros(0, dtype=int)] +
+                              [np.asarray(self.get_neighbours(a), dtype=int) for a in indices])
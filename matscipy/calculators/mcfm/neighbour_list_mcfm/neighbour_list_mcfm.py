@@ -46,6 +46,8 @@ class NeighbourListMCFM(NeighbourListBase):
         If atoms are connected, the link will break only of they move apart
         further than cutoff * hysteretic_break_factor
 
+    The list is stored in compressed sparse row format: the neighbours of
+    atom i are ``j_p[first_i[i]:first_i[i+1]]``.
     """
 
     def __init__(self, atoms, cutoffs, skin=0.3, hysteretic_break_factor=1):
@@ -63,8 +65,11 @@ class NeighbourListMCFM(NeighbourListBase):
         self.nupdates = 0
 
         # Additional data
-        self.neighbours = [np.zeros(0) for idx in range(len(atoms))]
-        self.old_neighbours = [[] for idx in range(len(atoms))]
+        self.first_i = np.zeros(len(atoms) + 1, dtype=int)
+        self.j_p = np.zeros(0, dtype=int)
+        self.neighbours = [np.zeros(0, dtype=int) for idx in range(len(atoms))]
+        # Connected pairs of the previous update, encoded as i * nb_atoms + j
+        self.old_pairs = np.zeros(0, dtype=int)
 
     def update(self, atoms):
         """Make sure the list is up to date. If clled for the first
@@ -109,26 +114,35 @@ class NeighbourListMCFM(NeighbourListBase):
         self.pbc = atoms.get_pbc()
         self.cell = atoms.get_cell()
 
+        nb_atoms = len(atoms)
         shorti, shortj = mspy_nl(str("ij"), atoms, self.cutoffs)
-
-        new_neighbours = [[] for idx in range(len(atoms))]
-        for idx in range(len(shorti)):
-            new_neighbours[shorti[idx]].append(shortj[idx])
+        i_p = shorti.astype(int)
+        j_p = shortj.astype(int)
 
         if self.do_hysteretic:
             longi, longj = mspy_nl(str("ij"), atoms, self.cutoffs_hysteretic)
+            long_pairs = longi.astype(int) * nb_atoms + longj
+
+            # Keep pairs that were previously connected and are not within
+            # the short cutoff
+            previously_connected = np.isin(long_pairs, self.old_pairs)
+            not_added = np.logical_not(np.isin(long_pairs, i_p * nb_atoms + j_p))
+            added_pairs = long_pairs[np.logical_and(previously_connected, not_added)]
+            # Every pair only once, in the order of the long neighbour list
+            _, first = np.unique(added_pairs, return_index=True)
+            added_pairs = added_pairs[np.sort(first)]
 
-            for idx in range(len(longi)):
-                # Split for profiling
-                previously_connected = longj[idx] in self.old_neighbours[longi[idx]]
-                not_added = longj[idx] not in new_neighbours[longi[idx]]
-                if previously_connected and not_added:
-                    new_neighbours[longi[idx]].append(longj[idx])
+            i_p = np.concatenate((i_p, added_pairs // nb_atoms))
+            j_p = np.concatenate((j_p, added_pairs % nb_atoms))
+            sorted_p = np.argsort(i_p, kind='stable')
+            i_p = i_p[sorted_p]
+            j_p = j_p[sorted_p]
 
-            self.old_neighbours = new_neighbours
+            self.old_pairs = np.unique(i_p * nb_atoms + j_p)
 
-        for idx in range(len(new_neighbours)):
-            self.neighbours[idx] = np.asarray(list(new_neighbours[idx]))
+        self.first_i = np.searchsorted(i_p, np.arange(nb_atoms + 1))
+        self.j_p = j_p
+        self.neighbours = np.split(j_p, self.first_i[1:-1])
 
         self.nupdates += 1
 
@@ -160,3 +174,32 @@ class NeighbourListMCFM(NeighbourListBase):
             raise RuntimeError("Must update the list at least once!")
 
         return self.neighbours[a]
+
+    def get_neighbours_of_list(self, indices):
+        """Return the neighbours of all atoms in a list.
+
+        Parameters
+        ----------
+        indices : array_like
+            atomic indices
+
+        Returns
+        -------
+        np.array
+            concatenated arrays of neighbouring indices
+
+        Raises
+        ------
+        RuntimeError
+            Must update the list at least once!
+        """
+        if self.nupdates == 0:
+            raise RuntimeError("Must update the list at least once!")
+
+        indices = np.asarray(indices, dtype=int)
+        start_i = self.first_i[indices]
+        nb_neighbours_i = self.first_i[indices + 1] - start_i
+        # Gather the CSR rows of all atoms at once
+        offsets_i = np.cumsum(nb_neighbours_i) - nb_neighbours_i
+        p = np.arange(nb_neighbours_i.sum()) + np.repeat(start_i - offsets_i, nb_neighbours_i)
+        return self.j_p[p]
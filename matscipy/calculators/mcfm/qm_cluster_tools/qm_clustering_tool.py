@@ -66,41 +66,40 @@ class QMClusteringTool(BaseQMClusterTool):
             cutoff_atoms_list: List of atoms that are not in the buffer but are bonded to the
             atoms in the buffer.
         """
-        innerQM_region_set = set(qm_atoms_list)
-        edge_neighbours = set(qm_atoms_list)
-        terminal_atoms = []
-
         if len(qm_atoms_list) == len(atoms):
             return [], [], []
 
+        neighbour_list = self.mediator.neighbour_list
+        heavy_atoms_mask = atoms.numbers != 1
+
+        # Breadth-first search from all QM atoms simultaneously
+        innerQM_region_mask = np.zeros(len(atoms), dtype=bool)
+        innerQM_region_mask[qm_atoms_list] = True
+        edge_neighbours = np.unique(np.asarray(qm_atoms_list, dtype=int))
+        terminal_atoms = edge_neighbours[:0]
+
         for i in range(buffer_hops):
-            new_neighbours = set()
-            # For each atom in edge neighbours list, expand the list
-            for index in edge_neighbours:
-                new_neighbours |= set(self.find_neighbours(atoms, index)[0])
-            # Remove atoms already in the qm list
-            edge_neighbours = new_neighbours - innerQM_region_set
-
-            # If the cluster is still growing, update the list of atoms at the edge
-            if len(edge_neighbours) > 0:
-                terminal_atoms = edge_neighbours
-            # Make a union of the sets
-            innerQM_region_set |= edge_neighbours
+            # Expand the edge by its heavy neighbours not yet in the region
+            new_neighbours = neighbour_list.get_neighbours_of_list(edge_neighbours)
+            new_neighbours = new_neighbours[heavy_atoms_mask[new_neighbours]]
+            edge_neighbours = np.unique(new_neighbours[np.logical_not(innerQM_region_mask[new_neighbours])])
+
+            # If the cluster is not growing anymore, the remaining hops
+            # do not change the region
+            if len(edge_neighbours) == 0:
+                break
+            terminal_atoms = edge_neighbours
+            innerQM_region_mask[edge_neighbours] = True
 
         # GO throught the loop one more time to find the last atoms not in the cluster
-        new_neighbours = set()
-        # For each atom in edge neighbours list, expand the list
-        for index in edge_neighbours:
-            new_neighbours |= set(self.find_neighbours(atoms, index)[0])
-        # Remove atoms already in the qm list
-        cutoff_atoms_set = new_neighbours - innerQM_region_set
-        cutoff_atoms_list = list(cutoff_atoms_set)
+        new_neighbours = neighbour_list.get_neighbours_of_list(edge_neighbours)
+        new_neighbours = new_neighbours[heavy_atoms_mask[new_neighbours]]
+        cutoff_atoms_list = np.unique(new_neighbours[np.logical_not(innerQM_region_mask[new_neighbours])])
 
         # Create buffer list
-        innerQM_region_set -= set(qm_atoms_list)
-        buffer_list = list(innerQM_region_set)
-        terminal_atoms = list(terminal_atoms)
-        return buffer_list, terminal_atoms, cutoff_atoms_list
+        innerQM_region_mask[qm_atoms_list] = False
+        buffer_list = np.nonzero(innerQM_region_mask)[0]
+        return buffer_list.tolist(), terminal_atoms.tolist(), cutoff_atoms_list.tolist()
 
     def carve_cluster(self, atoms, core_qm_list, buffer_hops=10):
         """Create a cluster with the list as core atoms, returns an ase.Atoms object
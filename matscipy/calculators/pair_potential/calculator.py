@@ -30,6 +30,8 @@ Simple pair potential.
 #   - n: Atomic index, i.e. array dimension of length nb_atoms
 #   - p: Pair index, i.e. array dimension of length nb_pairs
 #   - c: Cartesian index, array dimension of length 3
+#   - k: Index of the pair function
+#   - g: Grid point of a tabulated pair function
 #
 
 import numpy as np
@@ -39,7 +41,7 @@ from scipy.sparse import bsr_matrix, vstack, hstack
 import ase
 
 from ...neighbours import neighbour_list, first_neighbours
-from ..calculator import MatscipyCalculator
+from ..calculator import MatscipyCalculator, _hessian_operator
 from ...numpy_tricks import mabincount
 
 
@@ -270,12 +272,51 @@ class LennardJones84():
 ###
 
 
+def _quintic_hermite_coefficients(e_g, de_g, dde_g, dr):
+    """
+    Coefficients of the piecewise quintic polynomials that interpolate
+    function values, first and second derivatives given on a uniform grid
+    with spacing dr. On each interval, the polynomial is expressed in the
+    reduced coordinate t = (r-r_g)/dr with 0 <= t <= 1. Returns an array of
+    shape (nb_grid_points-1, 6) with coefficients of t^0 to t^5.
+    """
+    p0, p1 = e_g[:-1], e_g[1:]
+    m0, m1 = dr*de_g[:-1], dr*de_g[1:]
+    a0, a1 = dr**2*dde_g[:-1], dr**2*dde_g[1:]
+    return np.transpose([
+        p0,
+        m0,
+        a0/2,
+        -10*p0 - 6*m0 - 1.5*a0 + 10*p1 - 4*m1 + 0.5*a1,
+        15*p0 + 8*m0 + 1.5*a0 - 15*p1 + 7*m1 - a1,
+        -6*p0 - 3*m0 - 0.5*a0 + 6*p1 - 3*m1 + 0.5*a1])
+
+
 class PairPotential(MatscipyCalculator):
-    implemented_properties = ['energy', 'free_energy', 'stress', 'forces', 'hessian']
+    """
+    Pair potential with a different pair function for each pair of elements.
+
+    Parameters
+    ----------
+    f : dict
+        Pair functions (e.g. LennardJonesQuadratic) with pairs of atomic
+        numbers as keys.
+    r_min : float, optional
+        If given, pair functions are tabulated between `r_min` and their
+        cutoff and evaluated by quintic Hermite interpolation of energy,
+        first and second derivative. All pairs are then evaluated in a
+        single vectorized pass. Pairs closer than `r_min` are evaluated
+        analytically. (Default: None, i.e. analytic evaluation)
+    nb_grid_points : int, optional
+        Number of grid points of each tabulated pair function.
+        (Default: 1000)
+    """
+
+    implemented_properties = ['energy', 'free_energy', 'energies', 'stress', 'stresses', 'forces', 'hessian']
     default_parameters = {}
     name = 'PairPotential'
 
-    def __init__(self, f, cutoff=None):
+    def __init__(self, f, cutoff=None, r_min=None, nb_grid_points=1000):
         MatscipyCalculator.__init__(self)
         self.f = f
 
@@ -283,59 +324,160 @@ class PairPotential(MatscipyCalculator):
         self.df = {x: obj.derivative(1) for x, obj in f.items()}
         self.df2 = {x: obj.derivative(2) for x, obj in f.items()}
 
-    def calculate(self, atoms, properties, system_changes):
-        MatscipyCalculator.calculate(self, atoms, properties, system_changes)
+        # Pair functions are enumerated by a pair index k
+        self._pairs = list(f.keys())
 
-        nb_atoms = len(self.atoms)
-        atnums = self.atoms.numbers
-        atnums_in_system = set(atnums)
+        self.r_min = r_min
+        if r_min is not None:
+            self._tabulate(r_min, nb_grid_points)
 
-        i_p, j_p, r_p, r_pc = neighbour_list('ijdD', self.atoms, self.dict)
+    def _tabulate(self, r_min, nb_grid_points):
+        """
+        Tabulate all pair functions on uniform grids.
+        """
+        nb_pairs = len(self._pairs)
+        self._table_r0_k = np.full(nb_pairs, r_min, dtype=float)
+        self._table_inv_dr_k = np.empty(nb_pairs)
+        self._table_kgx = np.empty((nb_pairs, nb_grid_points-1, 6))
+        for k, pair in enumerate(self._pairs):
+            cutoff = self.dict[pair]
+            if cutoff <= r_min:
+                raise ValueError('Cutoff of pair {} must be larger than '
+                                 'r_min.'.format(pair))
+            r_g = np.linspace(r_min, cutoff, nb_grid_points)
+            dr = r_g[1] - r_g[0]
+            self._table_inv_dr_k[k] = 1/dr
+            self._table_kgx[k] = _quintic_hermite_coefficients(
+                self.f[pair](r_g), self.df[pair](r_g), self.df2[pair](r_g),
+                dr)
+
+    def _pair_index(self, atnums, i_p, j_p):
+        """
+        Return the index of the pair function for each pair. The lookup
+        table is built over the elements present, such that every pair
+        requires a single table lookup.
+        """
+        elements, t_n = np.unique(atnums, return_inverse=True)
+        nb_elements = len(elements)
+        k_tt = np.full((nb_elements, nb_elements), -1, dtype=np.int16)
+        for k, (el1, el2) in enumerate(self._pairs):
+            t1 = np.searchsorted(elements, el1)
+            t2 = np.searchsorted(elements, el2)
+            if t1 < nb_elements and elements[t1] == el1 and \
+                    t2 < nb_elements and elements[t2] == el2:
+                k_tt[t1, t2] = k
+                k_tt[t2, t1] = k
+        return k_tt[t_n[i_p], t_n[j_p]]
+
+    def _evaluate(self, k_p, r_p, second_derivative=False):
+        """
+        Evaluate pair functions and their derivatives for all pairs.
 
+        Parameters
+        ----------
+        k_p : array_like
+            Index of the pair function for each pair.
+        r_p : array_like
+            Pair distances.
+        second_derivative : bool
+            Also compute the second derivative. (Default: False)
+
+        Returns
+        -------
+        e_p, de_p[, dde_p] : array
+            Energy, first and second derivative for each pair.
+        """
         e_p = np.zeros_like(r_p)
         de_p = np.zeros_like(r_p)
-        for params, pair in enumerate(self.dict):
-            if pair[0] == pair[1]:
-                mask1 = atnums[i_p] == pair[0]
-                mask2 = atnums[j_p] == pair[0]
-                mask = np.logical_and(mask1, mask2)
+        dde_p = np.zeros_like(r_p) if second_derivative else None
+
+        # Pairs that are evaluated analytically
+        analytic_p = slice(None)
+        if self.r_min is not None:
+            # Interpolation; the reduced coordinate x_p splits into interval
+            # index g_p and position t_p within the interval
+            inv_dr_p = self._table_inv_dr_k[k_p]
+            x_p = (r_p - self._table_r0_k[k_p]) * inv_dr_p
+            g_p = np.clip(x_p.astype(int), 0, self._table_kgx.shape[1]-1)
+            t_p = x_p - g_p
+            c_xp = self._table_kgx[k_p, g_p].T
+            e_p = c_xp[0] + t_p*(c_xp[1] + t_p*(c_xp[2] + t_p*(
+                c_xp[3] + t_p*(c_xp[4] + t_p*c_xp[5]))))
+            de_p = inv_dr_p*(c_xp[1] + t_p*(2*c_xp[2] + t_p*(
+                3*c_xp[3] + t_p*(4*c_xp[4] + t_p*5*c_xp[5]))))
+            if second_derivative:
+                dde_p = inv_dr_p**2*(2*c_xp[2] + t_p*(6*c_xp[3] + t_p*(
+                    12*c_xp[4] + t_p*20*c_xp[5])))
+            analytic_p = np.nonzero(x_p < 0)[0]
+
+        # Sort pairs by pair index (radix sort for small integers), such
+        # that every pair function is evaluated on a contiguous slice
+        k_s = k_p[analytic_p]
+        r_s = r_p[analytic_p]
+        sorted_s = np.argsort(k_s, kind='stable')
+        offsets = np.searchsorted(k_s[sorted_s],
+                                  np.arange(len(self._pairs)+1))
+        if self.r_min is not None:
+            sorted_s = analytic_p[sorted_s]
+        for k, pair in enumerate(self._pairs):
+            if offsets[k] == offsets[k+1]:
+                continue
+            p = sorted_s[offsets[k]:offsets[k+1]]
+            r = r_p[p]
+            e_p[p] = self.f[pair](r)
+            de_p[p] = self.df[pair](r)
+            if second_derivative:
+                dde_p[p] = self.df2[pair](r)
+
+        if second_derivative:
+            return e_p, de_p, dde_p
+        return e_p, de_p
+
+    def calculate(self, atoms, properties, system_changes):
+        MatscipyCalculator.calculate(self, atoms, properties, system_changes)
 
-                e_p[mask] = self.f[pair](r_p[mask])
-                de_p[mask] = self.df[pair](r_p[mask])
+        nb_atoms = len(self.atoms)
+        atnums = self.atoms.numbers
 
-            if pair[0] != pair[1]:
-                mask1 = np.logical_and(
-                    atnums[i_p] == pair[0], atnums[j_p] == pair[1])
-                mask2 = np.logical_and(
-                    atnums[i_p] == pair[1], atnums[j_p] == pair[0])
-                mask = np.logical_or(mask1, mask2)
+        # Half neighbour list: every pair is evaluated once
+        i_p, j_p, r_p, r_pc = neighbour_list('ijdD', self.atoms, self.dict,
+                                             half=True)
 
-                e_p[mask] = self.f[pair](r_p[mask])
-                de_p[mask] = self.df[pair](r_p[mask])
+        e_p, de_p = self._evaluate(self._pair_index(atnums, i_p, j_p), r_p)
 
-        epot = 0.5*np.sum(e_p)
+        epot = np.sum(e_p)
 
         # Forces
-        df_pc = -0.5*de_p.reshape(-1, 1)*r_pc/r_p.reshape(-1, 1)
+        df_pc = -de_p.reshape(-1, 1)*r_pc/r_p.reshape(-1, 1)
 
         f_nc = mabincount(j_p, df_pc, nb_atoms) - mabincount(i_p, df_pc, nb_atoms)
 
         # Virial
-        virial_v = -np.array([r_pc[:, 0] * df_pc[:, 0],               # xx
-                              r_pc[:, 1] * df_pc[:, 1],               # yy
-                              r_pc[:, 2] * df_pc[:, 2],               # zz
-                              r_pc[:, 1] * df_pc[:, 2],               # yz
-                              r_pc[:, 0] * df_pc[:, 2],               # xz
-                              r_pc[:, 0] * df_pc[:, 1]]).sum(axis=1)  # xy
+        virial_pv = -np.transpose([r_pc[:, 0] * df_pc[:, 0],  # xx
+                                   r_pc[:, 1] * df_pc[:, 1],  # yy
+                                   r_pc[:, 2] * df_pc[:, 2],  # zz
+                                   r_pc[:, 1] * df_pc[:, 2],  # yz
+                                   r_pc[:, 0] * df_pc[:, 2],  # xz
+                                   r_pc[:, 0] * df_pc[:, 1]])  # xy
+        virial_v = virial_pv.sum(axis=0)
+
+        # Per-atom energies and virials, every pair contributes equally to
+        # both of its atoms
+        epot_n = 0.5*(np.bincount(i_p, weights=e_p, minlength=nb_atoms) +
+                      np.bincount(j_p, weights=e_p, minlength=nb_atoms))
+        virial_nv = 0.5*(mabincount(i_p, virial_pv, nb_atoms) +
+                         mabincount(j_p, virial_pv, nb_atoms))
 
         self.results = {'energy': epot,
                         'free_energy': epot,
+                        'energies': epot_n,
                         'stress': virial_v/self.atoms.get_volume(),
+                        'stresses': virial_nv/self.atoms.get_volume(),
                         'forces': f_nc}
 
     ###
 
-    def get_hessian(self, atoms, format='dense', divide_by_masses=False):
+    def get_hessian(self, atoms, format='sparse', divide_by_masses=False):
         """
         Calculate the Hessian matrix for a pair potential.
         For an atomic configuration with N atoms in d dimensions the hessian matrix is a symmetric, hermitian matrix
@@ -349,8 +491,9 @@ class PairPotential(MatscipyCalculator):
         atoms: ase.Atoms
             Atomic configuration in a local or global minima.
 
-        format: "sparse" or "neighbour-list"
-            Output format of the hessian matrix.
+        format: "sparse", "dense" or "neighbour-list"
+            Output format of the hessian matrix. The dense matrix is
+            obtained from the sparse one. (Default: "sparse")
 
         divide_by_masses: bool
             if true return the dynamic matrix else hessian matrix 
@@ -362,41 +505,15 @@ class PairPotential(MatscipyCalculator):
         if self.atoms is None:
             self.atoms = atoms
 
-        f = self.f
-        dict = self.dict
-        df = self.df
-        df2 = self.df2
-
         nb_atoms = len(atoms)
         atnums = atoms.numbers
 
-        i_p, j_p,  r_p, r_pc = neighbour_list('ijdD', atoms, dict)
+        i_p, j_p,  r_p, r_pc = neighbour_list('ijdD', atoms, self.dict)
         first_i = first_neighbours(nb_atoms, i_p)
 
-        e_p = np.zeros_like(r_p)
-        de_p = np.zeros_like(r_p)
-        dde_p = np.zeros_like(r_p)
-        for params, pair in enumerate(dict):
-            if pair[0] == pair[1]:
-                mask1 = atnums[i_p] == pair[0]
-                mask2 = atnums[j_p] == pair[0]
-                mask = np.logical_and(mask1, mask2)
-
-                e_p[mask] = f[pair](r_p[mask])
-                de_p[mask] = df[pair](r_p[mask])
-                dde_p[mask] = df2[pair](r_p[mask])
-
-            if pair[0] != pair[1]:
-                mask1 = np.logical_and(
-                    atnums[i_p] == pair[0], atnums[j_p] == pair[1])
-                mask2 = np.logical_and(
-                    atnums[i_p] == pair[1], atnums[j_p] == pair[0])
-                mask = np.logical_or(mask1, mask2)
-
-                e_p[mask] = f[pair](r_p[mask])
-                de_p[mask] = df[pair](r_p[mask])
-                dde_p[mask] = df2[pair](r_p[mask])
-        
+        e_p, de_p, dde_p = self._evaluate(
+            self._pair_index(atnums, i_p, j_p), r_p, second_derivative=True)
+
         n_pc = (r_pc.T/r_p).T
         H_pcc = -(dde_p * (n_pc.reshape(-1, 3, 1)
                            * n_pc.reshape(-1, 1, 3)).T).T
@@ -405,60 +522,70 @@ class PairPotential(MatscipyCalculator):
 
         # Sparse BSR-matrix
         if format == "sparse":
-            if divide_by_masses:
-                masses_n = atoms.get_masses()
-                geom_mean_mass_p = np.sqrt(masses_n[i_p]*masses_n[j_p])
+            # Diagonal blocks follow from the sum rule
+            Hdiag_icc = -mabincount(i_p, H_pcc, nb_atoms)
 
             if divide_by_masses:
-                H = bsr_matrix(((H_pcc.T/geom_mean_mass_p).T, j_p, first_i), shape=(3*nb_atoms, 3*nb_atoms))
-
-            else: 
-                H = bsr_matrix((H_pcc, j_p, first_i), shape=(3*nb_atoms, 3*nb_atoms))
-
-            Hdiag_icc = np.empty((nb_atoms, 3, 3))
-            for x in range(3):
-                for y in range(3):
-                    Hdiag_icc[:, x, y] = - \
-                        np.bincount(i_p, weights=H_pcc[:, x, y])
-
-            if divide_by_masses:
-                H += bsr_matrix(((Hdiag_icc.T/masses_n).T, np.arange(nb_atoms),
-                             np.arange(nb_atoms+1)), shape=(3*nb_atoms, 3*nb_atoms))
+                masses_n = atoms.get_masses()
+                H_pcc /= np.sqrt(masses_n[i_p]*masses_n[j_p]).reshape(-1, 1, 1)
+                Hdiag_icc /= masses_n.reshape(-1, 1, 1)
 
-            else:
-                H += bsr_matrix((Hdiag_icc, np.arange(nb_atoms),
+            H = bsr_matrix((H_pcc, j_p, first_i), shape=(3*nb_atoms, 3*nb_atoms))
+            H += bsr_matrix((Hdiag_icc, np.arange(nb_atoms),
                              np.arange(nb_atoms+1)), shape=(3*nb_atoms, 3*nb_atoms))
 
             return H
 
         # Dense matrix format
         elif format == "dense":
-            H = np.zeros((3*nb_atoms, 3*nb_atoms))
-            for atom in range(len(i_p)):
-                H[3*i_p[atom]:3*i_p[atom]+3,
-                  3*j_p[atom]:3*j_p[atom]+3] += H_pcc[atom]
+            return self.get_hessian(atoms, "sparse",
+                                    divide_by_masses=divide_by_masses).toarray()
 
-            Hdiag_icc = np.empty((nb_atoms, 3, 3))
-            for x in range(3):
-                for y in range(3):
-                    Hdiag_icc[:, x, y] = - \
-                        np.bincount(i_p, weights=H_pcc[:, x, y])
+        # Neighbour list format
+        elif format == "neighbour-list":
+            return H_pcc, i_p, j_p, r_pc, r_p
 
-            Hdiag_ncc = np.zeros((3*nb_atoms, 3*nb_atoms))
-            for atom in range(nb_atoms):
-                Hdiag_ncc[3*atom:3*atom+3,
-                          3*atom:3*atom+3] += Hdiag_icc[atom]
+    def get_hessian_operator(self, atoms, divide_by_masses=False):
+        """
+        Return the Hessian matrix as a linear operator. Hessian-vector
+        products are computed on the fly from the first and second
+        derivatives of the pair functions on a half neighbour list; the
+        Hessian blocks are never stored.
 
-            H += Hdiag_ncc
+        Parameters
+        ----------
+        atoms: ase.Atoms
+            Atomic configuration in a local or global minima.
 
-            if divide_by_masses:
-                masses_p = (atoms.get_masses()).repeat(3)
-                H /= np.sqrt(masses_p.reshape(-1,1)*masses_p.reshape(1,-1))
-                return H
+        divide_by_masses: bool
+            if true return the dynamic matrix else hessian matrix
 
-            else:
-                return H
+        Returns
+        -------
+        scipy.sparse.linalg.LinearOperator
+            either hessian or dynamic matrix
+        """
+        if self.atoms is None:
+            self.atoms = atoms
 
-        # Neighbour list format
-        elif format == "neighbour-list":
-            return H_pcc, i_p, j_p, r_pc, r_p
+        nb_atoms = len(atoms)
+        i_p, j_p, r_p, r_pc = neighbour_list('ijdD', atoms, self.dict,
+                                             half=True)
+        e_p, de_p, dde_p = self._evaluate(
+            self._pair_index(atoms.numbers, i_p, j_p), r_p,
+            second_derivative=True)
+
+        # H_pcc = -(dde_p - de_p/r_p) n_pc x n_pc - de_p/r_p 1
+        n_pc = (r_pc.T/r_p).T
+        a_p = (dde_p - de_p/r_p).reshape(-1, 1)
+        b_p = (de_p/r_p).reshape(-1, 1)
+
+        def matvec(v):
+            v_nc = v.reshape(nb_atoms, 3)
+            dv_pc = v_nc[j_p] - v_nc[i_p]
+            Hv_pc = -a_p*np.sum(n_pc*dv_pc, axis=1).reshape(-1, 1)*n_pc \
+                - b_p*dv_pc
+            return (mabincount(i_p, Hv_pc, nb_atoms) -
+                    mabincount(j_p, Hv_pc, nb_atoms)).reshape(v.shape)
+
+        return _hessian_operator(matvec, atoms, divide_by_masses)
@@ -155,7 +155,7 @@ class InversePowerLawPotential():
 
 
 class Polydisperse(MatscipyCalculator):
-    implemented_properties = ["energy", "free_energy", "stress", "forces", "hessian"]
+    implemented_properties = ["energy", "free_energy", "energies", "stress", "stresses", "forces", "hessian"]
     default_parameters = {}
     name = "Polydisperse"
 
@@ -174,7 +174,9 @@ class Polydisperse(MatscipyCalculator):
             raise AttributeError(
                 "Attribute error: Unable to load atom sizes from atoms object!")
 
-        i_p, j_p, r_pc, r_p = neighbour_list("ijDd", self.atoms, f.get_maxSize()*f.get_cutoff())
+        # Half neighbour list: every pair is evaluated once
+        i_p, j_p, r_pc, r_p = neighbour_list(
+            "ijDd", self.atoms, f.get_maxSize()*f.get_cutoff(), half=True)
         ijsize = f.mix_sizes(size[i_p], size[j_p])
 
         # Mask neighbour list to consider only true neighbors
@@ -188,24 +190,34 @@ class Polydisperse(MatscipyCalculator):
         de_p = f.first_derivative(r_p, ijsize)
 
         # Energy
-        epot = 0.5*np.sum(e_p)
+        epot = np.sum(e_p)
 
         # Forces
-        df_pc = -0.5*de_p.reshape(-1, 1)*r_pc/r_p.reshape(-1, 1)
+        df_pc = -de_p.reshape(-1, 1)*r_pc/r_p.reshape(-1, 1)
 
         f_nc = mabincount(j_p, df_pc, nb_atoms) - mabincount(i_p, df_pc, nb_atoms)
 
         # Virial
-        virial_v = -np.array([r_pc[:, 0] * df_pc[:, 0],               # xx
-                              r_pc[:, 1] * df_pc[:, 1],               # yy
-                              r_pc[:, 2] * df_pc[:, 2],               # zz
-                              r_pc[:, 1] * df_pc[:, 2],               # yz
-                              r_pc[:, 0] * df_pc[:, 2],               # xz
-                              r_pc[:, 0] * df_pc[:, 1]]).sum(axis=1)  # xy
+        virial_pv = -np.transpose([r_pc[:, 0] * df_pc[:, 0],  # xx
+                                   r_pc[:, 1] * df_pc[:, 1],  # yy
+                                   r_pc[:, 2] * df_pc[:, 2],  # zz
+                                   r_pc[:, 1] * df_pc[:, 2],  # yz
+                                   r_pc[:, 0] * df_pc[:, 2],  # xz
+                                   r_pc[:, 0] * df_pc[:, 1]])  # xy
+        virial_v = virial_pv.sum(axis=0)
+
+        # Per-atom energies and virials, every pair contributes equally to
+        # both of its atoms
+        epot_n = 0.5*(np.bincount(i_p, weights=e_p, minlength=nb_atoms) +
+                      np.bincount(j_p, weights=e_p, minlength=nb_atoms))
+        virial_nv = 0.5*(mabincount(i_p, virial_pv, nb_atoms) +
+                         mabincount(j_p, virial_pv, nb_atoms))
 
         self.results = {'energy': epot,
                         'free_energy': epot,
+                        'energies': epot_n,
                         'stress': virial_v/self.atoms.get_volume(),
+                        'stresses': virial_nv/self.atoms.get_volume(),
                         'forces': f_nc}
 
     ###
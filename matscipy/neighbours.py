@@ -64,12 +64,14 @@ def mic(dr, cell, pbc=None):
 
 
 def neighbour_list(quantities, atoms=None, cutoff=None, positions=None,
-                   cell=None, pbc=None, numbers=None, cell_origin=None):
+                   cell=None, pbc=None, numbers=None, cell_origin=None,
+                   num_threads=None, half=False, dtype=np.float64, out=None):
     """
     Compute a neighbor list for an atomic configuration. Atoms outside periodic
-    boundaries are mapped into the box. Atoms outside nonperiodic boundaries
-    are included in the neighbor list but the complexity of neighbor list search
-    for those can become n^2.
+    boundaries are mapped into the box. Along nonperiodic directions, the
+    search only covers the bounding box of the atoms, such that atoms outside
+    of nonperiodic boundaries and large vacuum regions do not slow down the
+    search. Shift vectors are zero along nonperiodic directions.
 
     The neighbor list is sorted by first atom index 'i', but not by second
     atom index 'j'.
@@ -91,6 +93,8 @@ def neighbour_list(quantities, atoms=None, cutoff=None, positions=None,
                   between atom i and j). With the shift vector S, the
                   distances D between atoms can be computed from:
                   D = a.positions[j]-a.positions[i]+S.dot(a.cell)
+            'R' : index of the reverse pair, i.e. the pair j-i with opposite
+                  distance vector (only for full neighbor lists)
     atoms : ase.Atoms
         Atomic configuration. (Default: None)
     cutoff : float or dict
@@ -111,6 +115,27 @@ def neighbour_list(quantities, atoms=None, cutoff=None, positions=None,
         directions. (Default: Nonperiodic box)
     numbers : array_like
         Array containing the atomic numbers.
+    num_threads : int
+        Number of OpenMP threads used for the neighbour search. The result
+        does not depend on the number of threads. (Default: OpenMP default,
+        i.e. OMP_NUM_THREADS if set)
+    half : bool
+        Return a half neighbor list, i.e. each pair only once with i <= j.
+        An atom that is a neighbor of its own periodic image (small periodic
+        cells) is reported once for each pair of images S and -S, with the
+        lexicographically positive shift vector. Pair sums over a half list
+        do not need the factor 1/2 of the full list. (Default: False)
+    dtype : numpy.dtype
+        Floating point type of absolute distances 'd' and distance vectors
+        'D', either np.float64 or np.float32. Distances are always computed
+        in double precision. (Default: np.float64)
+    out : dict
+        Preallocated output arrays, with the quantity character as key, that
+        are reused if they are large enough. The neighbor list is written to
+        the leading entries of the array and a view on these entries is
+        returned. If an array is too small, a new array is returned
+        instead. Arrays must be contiguous and have data type np.int32 for
+        'i', 'j', 'S' and 'R' and `dtype` for 'd' and 'D'. (Default: None)
 
     Returns
     -------
@@ -226,27 +251,351 @@ e_nc = (dr_nc.T/abs_dr_n).T
                              'separate atomic numbers at the same time.')
         numbers = atoms.numbers.astype(np.int32)
 
-    if isinstance(cutoff, dict):
-        maxel = np.max(numbers)
-        _cutoff = np.zeros([maxel+1, maxel+1], dtype=float)
-        for (el1, el2), c in cutoff.items():
-            try:
-                el1 = atomic_numbers[el1]
-            except:
-                pass
-            try:
-                el2 = atomic_numbers[el2]
-            except:
-                pass
-            if el1 < maxel+1 and el2 < maxel+1:
-                _cutoff[el1, el2] = c
-                _cutoff[el2, el1] = c
+    dtype = np.dtype(dtype)
+    if dtype == np.float64:
+        single = False
+    elif dtype == np.float32:
+        single = True
     else:
-        _cutoff = cutoff
+        raise ValueError('Distances can only be returned as np.float64 or '
+                         'np.float32.')
 
+    cutoff, types = _pair_cutoffs(cutoff, numbers)
     return _matscipy.neighbour_list(quantities, cell_origin, cell,
                                     np.linalg.inv(cell.T), pbc, positions,
-                                    _cutoff, numbers)
+                                    cutoff, types, num_threads, half, single,
+                                    out)
+
+
+def neighbour_list_batch(quantities, frames=None, cutoff=None, positions=None,
+                         cell=None, pbc=None, numbers=None, cell_origin=None,
+                         num_threads=None, half=False, dtype=np.float64):
+    """
+    Compute neighbor lists for a sequence of configurations of the same atoms,
+    e.g. the frames of a trajectory. The frames are processed in parallel
+    with OpenMP. The neighbor lists of all frames are concatenated; the
+    pairs of frame f are found at offsets[f]:offsets[f+1].
+
+    The configurations are given either as a sequence of ASE Atoms objects
+    or as a stacked array of positions. The number of atoms, the atomic
+    numbers and the periodicity must be identical for all frames, the cell
+    may differ.
+
+    Parameters
+    ----------
+    quantities : str
+        Quantities to compute, see `neighbour_list`. Indices 'i' and 'j' refer
+        to atoms within each frame, the reverse pair 'R' is an index into the
+        concatenated list.
+    frames : iterable of ase.Atoms
+        Atomic configurations, for example an ase.io.Trajectory.
+        (Default: None)
+    cutoff : float or dict or array_like
+        Cutoff for neighbor search, see `neighbour_list`.
+    positions : array_like
+        Atomic positions with shape (nframes, nat, 3). (Default: None)
+    cell : array_like
+        Cell vectors as a 3x3 matrix that is used for all frames, or as an
+        array of shape (nframes, 3, 3). (Default: Shrink wrapped cell of each
+        frame)
+    pbc : array_like
+        3-vector containing periodic boundary conditions in all three
+        directions. (Default: Nonperiodic box)
+    numbers : array_like
+        Array containing the atomic numbers.
+    cell_origin : array_like
+        Origin of the cell, either a single 3-vector or an array of shape
+        (nframes, 3). (Default: 0)
+    num_threads : int
+        Number of OpenMP threads, see `neighbour_list`.
+    half : bool
+        Return half neighbor lists, see `neighbour_list`. (Default: False)
+    dtype : numpy.dtype
+        Floating point type of distances, see `neighbour_list`.
+        (Default: np.float64)
+
+    Returns
+    -------
+    offsets : array
+        Position of the first pair of each frame in the concatenated arrays,
+        followed by the total number of pairs. Has length nframes+1.
+    i, j, ... : array
+        Concatenated arrays for each quantity specified above.
+
+    Examples
+    --------
+    Pair distribution function averaged over a trajectory:
+        traj = ase.io.Trajectory('md.traj')
+        offsets, d = neighbour_list_batch('d', traj, 5.0)
+        h, bin_edges = np.histogram(d, bins=100)
+    """
+
+    if cutoff is None:
+        raise ValueError('Please provide a value for the cutoff radius.')
+
+    if frames is None:
+        if positions is None:
+            raise ValueError('You provided neither ASE Atoms objects nor a '
+                             'positions array.')
+        positions = np.asarray(positions, dtype=float)
+        if positions.ndim != 3:
+            raise ValueError('Positions must have shape (nframes, nat, 3).')
+        if cell is None:
+            # Shrink wrapped cell of each frame
+            rmin = np.min(positions, axis=1)
+            rmax = np.max(positions, axis=1)
+            cell_origin = rmin
+            cell = np.array([np.diag(r) for r in rmax - rmin])
+        if cell_origin is None:
+            cell_origin = np.zeros(3)
+        if pbc is None:
+            pbc = np.zeros(3, dtype=bool)
+        if numbers is None:
+            numbers = np.ones(positions.shape[1], dtype=np.int32)
+    else:
+        if positions is not None or cell is not None or pbc is not None or \
+                numbers is not None or cell_origin is not None:
+            raise ValueError('You cannot provide ASE Atoms objects and '
+                             'individual positions, cells, periodicity or '
+                             'atomic numbers at the same time.')
+        positions = []
+        cell = []
+        for atoms in frames:
+            if numbers is None:
+                numbers = atoms.numbers.astype(np.int32)
+                pbc = atoms.pbc
+            elif len(atoms) != len(numbers) or \
+                    not np.array_equal(atoms.numbers, numbers) or \
+                    not np.array_equal(atoms.pbc, pbc):
+                raise ValueError('All frames must contain the same atoms '
+                                 'and have identical periodicity.')
+            positions += [atoms.positions]
+            cell += [atoms.cell.array]
+        if numbers is None:
+            raise ValueError('No frames given.')
+        positions = np.array(positions)
+        cell = np.array(cell)
+        cell_origin = np.zeros(3)
+
+    nframes = len(positions)
+    cell = np.broadcast_to(np.asarray(cell, dtype=float), (nframes, 3, 3))
+    cell_origin = np.broadcast_to(np.asarray(cell_origin, dtype=float),
+                                  (nframes, 3))
+    pbc = np.broadcast_to(np.asarray(pbc, dtype=bool), (3,))
+
+    dtype = np.dtype(dtype)
+    if dtype == np.float64:
+        single = False
+    elif dtype == np.float32:
+        single = True
+    else:
+        raise ValueError('Distances can only be returned as np.float64 or '
+                         'np.float32.')
+
+    inv_cell = np.linalg.inv(cell.transpose(0, 2, 1))
+    cutoff, types = _pair_cutoffs(cutoff, numbers)
+    return _matscipy.neighbour_list_batch(quantities, cell_origin, cell,
+                                          inv_cell, pbc, positions, cutoff,
+                                          types, num_threads, half, single)
+
+
+def _pair_cutoffs(cutoff, numbers):
+    """
+    Convert a dictionary of pair cutoffs into the matrix representation
+    expected by the C neighbour list. The matrix is indexed by a compact type
+    index that enumerates the elements present in `numbers`, which is
+    returned as the second argument. Other cutoff specifications are passed
+    through unchanged together with `numbers`.
+    """
+    if not isinstance(cutoff, dict):
+        return cutoff, numbers
+
+    elements, types = np.unique(numbers, return_inverse=True)
+    element_to_type = {el: t for t, el in enumerate(elements)}
+    _cutoff = np.zeros([len(elements), len(elements)], dtype=float)
+    for (el1, el2), c in cutoff.items():
+        try:
+            el1 = atomic_numbers[el1]
+        except:
+            pass
+        try:
+            el2 = atomic_numbers[el2]
+        except:
+            pass
+        if el1 in element_to_type and el2 in element_to_type:
+            t1 = element_to_type[el1]
+            t2 = element_to_type[el2]
+            _cutoff[t1, t2] = c
+            _cutoff[t2, t1] = c
+    return _cutoff, types.astype(np.int32)
+
+
+class NeighbourList(object):
+    """
+    Neighbour list with a Verlet skin for use in molecular dynamics loops.
+
+    The list of pairs, i.e. the quantities 'i', 'j' and 'S', is built by
+    `neighbour_list` with the cutoff enlarged by the skin distance. It is
+    only rebuilt if an atom has moved by more than half of the skin since the
+    last build or if the cell, the periodicity or the atomic numbers have
+    changed. Otherwise, distances 'd' and distance vectors 'D' are recomputed
+    from the cached shift vectors and pairs outside of the cutoff are
+    discarded. The result is hence identical to the one of `neighbour_list`
+    up to the order of the second atom index 'j'. The arrays holding the pair
+    list are reused across rebuilds as long as they are large enough.
+
+    Parameters
+    ----------
+    cutoff : float or dict or array_like
+        Cutoff for neighbor search. See `neighbour_list` for the possible
+        specifications.
+    skin : float
+        Skin distance that is added to the cutoff. (Default: 0.3)
+
+    Examples
+    --------
+    nl = NeighbourList(5.0, skin=0.5)
+    for step in range(nsteps):
+        i, j, d, D = nl.get('ijdD', atoms)
+        ...
+
+    nl.nupdates counts the number of times the list has been rebuilt.
+    """
+
+    def __init__(self, cutoff, skin=0.3):
+        if cutoff is None:
+            raise ValueError('Please provide a value for the cutoff radius.')
+        if skin < 0:
+            raise ValueError('Skin distance must not be negative.')
+        self.cutoff = cutoff
+        self.skin = skin
+        self.nupdates = 0
+        self.reset()
+
+    def reset(self):
+        """
+        Discard the cached pair list. It will be rebuilt on next access.
+        """
+        self._positions = None
+        self._cell = None
+        self._pbc = None
+        self._numbers = None
+        self._i_p = None
+        self._j_p = None
+        self._S_pc = None
+        self._cutoff_p = None
+        self._out = {}
+
+    def _padded_cutoff(self):
+        if isinstance(self.cutoff, dict):
+            return {pair: c + self.skin for pair, c in self.cutoff.items()}
+        elif np.isscalar(self.cutoff):
+            return self.cutoff + self.skin
+        else:
+            # Per-atom radii: Two spheres contribute to every pair
+            return np.asarray(self.cutoff, dtype=float) + self.skin / 2
+
+    def _needs_update(self, atoms):
+        if self._positions is None or len(atoms) != len(self._positions):
+            return True
+        if not np.array_equal(atoms.pbc, self._pbc) or \
+                not np.array_equal(atoms.numbers, self._numbers) or \
+                not np.allclose(atoms.cell, self._cell, rtol=0, atol=1e-12):
+            return True
+        dr_nc = atoms.positions - self._positions
+        return np.max(np.sum(dr_nc * dr_nc, axis=1)) > (self.skin / 2) ** 2
+
+    def update(self, atoms):
+        """
+        Make sure the pair list is up to date for the given configuration.
+
+        Parameters
+        ----------
+        atoms : ase.Atoms
+            Atomic configuration.
+
+        Returns
+        -------
+        updated : bool
+            True if the pair list was rebuilt.
+        """
+        if not self._needs_update(atoms):
+            return False
+
+        i_p, j_p, S_pc = neighbour_list('ijS', atoms, self._padded_cutoff(),
+                                        out=self._out)
+
+        # Keep the larger arrays for the next rebuild
+        for quantity, array in zip('ijS', [i_p, j_p, S_pc]):
+            if quantity not in self._out or \
+                    len(array) > len(self._out[quantity]):
+                self._out[quantity] = array
+
+        # Cutoff for each pair, needed to discard pairs within the skin
+        if isinstance(self.cutoff, dict):
+            numbers = atoms.numbers
+            cutoff_tt, t_n = _pair_cutoffs(self.cutoff, numbers)
+            self._cutoff_p = cutoff_tt[t_n[i_p], t_n[j_p]]
+        elif np.isscalar(self.cutoff):
+            self._cutoff_p = self.cutoff
+        else:
+            cutoff_n = np.asarray(self.cutoff, dtype=float)
+            self._cutoff_p = cutoff_n[i_p] + cutoff_n[j_p]
+
+        self._i_p = i_p
+        self._j_p = j_p
+        self._S_pc = S_pc
+        self._positions = atoms.positions.copy()
+        self._cell = atoms.cell.array.copy()
+        self._pbc = atoms.pbc.copy()
+        self._numbers = atoms.numbers.copy()
+        self.nupdates += 1
+        return True
+
+    def get(self, quantities, atoms):
+        """
+        Return neighbour list quantities for the given configuration, updating
+        the pair list if necessary.
+
+        Parameters
+        ----------
+        quantities : str
+            Quantities to compute, see `neighbour_list`.
+        atoms : ase.Atoms
+            Atomic configuration.
+
+        Returns
+        -------
+        i, j, ... : array
+            Tuple with arrays for each quantity specified, or a single array
+            if only one quantity was requested.
+        """
+        self.update(atoms)
+
+        r_nc = atoms.positions
+        D_pc = r_nc[self._j_p] - r_nc[self._i_p] + \
+            self._S_pc.dot(atoms.cell.array)
+        d_p = np.sqrt(np.sum(D_pc * D_pc, axis=1))
+        mask_p = d_p < self._cutoff_p
+
+        ret = []
+        for quantity in quantities:
+            if quantity == 'i':
+                ret += [self._i_p[mask_p]]
+            elif quantity == 'j':
+                ret += [self._j_p[mask_p]]
+            elif quantity == 'd':
+                ret += [d_p[mask_p]]
+            elif quantity == 'D':
+                ret += [D_pc[mask_p]]
+            elif quantity == 'S':
+                ret += [self._S_pc[mask_p]]
+            else:
+                raise ValueError('Unsupported quantity specified.')
+
+        if len(ret) == 1:
+            return ret[0]
+        return tuple(ret)
 
 
 def triplet_list(first_neighbours, abs_dr_p=None, cutoff=None, i_p=None, j_p=None):
@@ -261,6 +610,13 @@ def triplet_list(first_neighbours, abs_dr_p=None, cutoff=None, i_p=None, j_p=Non
     ----------
     first_neighbours : array
         adresses of the first time an atom occours in the neighour list
+    abs_dr_p : array, optional
+        pair distances, only pairs shorter than `cutoff` form triplets
+    cutoff : float, optional
+        cutoff for the triplet search
+    i_p, j_p : array, optional
+        pair list sorted by first atom index `i_p` as returned by
+        neighbour_list; needed to compute `jk_t`
 
     Returns
     -------
@@ -268,7 +624,9 @@ def triplet_list(first_neighbours, abs_dr_p=None, cutoff=None, i_p=None, j_p=Non
         lists of adresses that form triples in the pair lists
     jk_t : array (if and only if i_p, j_p, first_i != None)
         list of pairs jk that connect each triplet ij, ik
-        between atom j and k
+        between atom j and k, -1 if the pair does not exist. If the pair
+        occurs multiple times (small periodic cells), the first occurence is
+        returned.
 
     Example
     -------
@@ -284,25 +642,11 @@ def triplet_list(first_neighbours, abs_dr_p=None, cutoff=None, i_p=None, j_p=Non
     first_ij = get_jump_indicies(ij_t)
 
     """
-    if not (abs_dr_p is None or cutoff is None):
-        res = _matscipy.triplet_list(first_neighbours, abs_dr_p, cutoff)
-    else:
-        res = _matscipy.triplet_list(first_neighbours)
-    # TODO: should be wrapped in c and be independet of i_n
-    # and j_n as of j_n is sorted; related issue #50
-    # add some tests!!!
-    if not (i_p is None or j_p is None or first_neighbours is None):
-        ij_t, ik_t = res
-        jk_t = -np.ones(len(ij_t), dtype='int32')
-        for t, (ij, ik) in enumerate(zip(ij_t, ik_t)):
-            for i in np.arange(first_neighbours[j_p[ij]],
-                               first_neighbours[j_p[ij]+1]):
-                if i_p[i] == j_p[ij] and j_p[i] == j_p[ik]:
-                    jk_t[t] = i
-                    break
-        return ij_t, ik_t, jk_t
-    else:
-        return res
+    if abs_dr_p is None or cutoff is None:
+        abs_dr_p = cutoff = None
+    if i_p is None or j_p is None:
+        j_p = None
+    return _matscipy.triplet_list(first_neighbours, abs_dr_p, cutoff, j_p)
 
 
 def find_indices_of_reversed_pairs(i_n, j_n, abs_dr_n):
@@ -409,6 +753,67 @@ def find_common_neighbours(i_n, j_n,  nat):
     >>> print(my_sum.shape)
     (65536,)
 
+    """
+    j_order, first_j = _sort_by_second_index(j_n, nat)
+    return _matscipy.find_common_neighbours(i_n, j_n, j_order, first_j,
+                                            0, len(i_n))
+
+
+def find_common_neighbours_chunked(i_n, j_n, nat, max_rows=2**22):
+    """Find common neighbors of pairs of atoms in chunks
+
+    Generator version of :func:`find_common_neighbours` that yields the
+    common neighbor rows in blocks of at most `max_rows` rows (unless a
+    single atom `i1` has more rows than that). Each block contains complete
+    blocks of rows for a contiguous range of pairs in the neighbor list. If
+    `i_n` is sorted, as returned by :func:`neighbour_list`, all rows
+    belonging to a given atom `i1` are contained in the same block, i.e.
+    sums over rows with the same pair `(i1, i2)` can be carried out
+    independently for each block.
+
+    Parameters
+    ----------
+    i_n : array_like
+       array of atom identifiers
+    j_n : array_like
+       array of atom identifiers
+    nat: int
+        number of atoms
+    max_rows : int
+        maximum number of rows per block (Default: 2**22)
+
+    Yields
+    ------
+    cnl_i1_i2, cnl_j1, nl_index_i1_j1, nl_index_i2_j1 : array
+        see :func:`find_common_neighbours`
+    """
+    j_order, first_j = _sort_by_second_index(j_n, nat)
+
+    # Row at which the block of each pair starts
+    num_rows_per_j = first_j[1:] - first_j[:-1]
+    block_start = np.r_[0, np.cumsum(num_rows_per_j[j_n])]
+
+    # Pairs at which a new atom i1 starts; blocks are only split there
+    boundaries = np.r_[0, np.nonzero(np.diff(i_n))[0]+1, len(i_n)]
+
+    n0 = 0
+    while n0 < len(i_n):
+        # Last boundary such that the block has at most max_rows rows
+        k = np.searchsorted(block_start[boundaries],
+                            block_start[n0]+max_rows, side='right')-1
+        n1 = boundaries[k]
+        if n1 <= n0:
+            # A single atom exceeds max_rows, use next boundary
+            n1 = boundaries[np.searchsorted(boundaries, n0, side='right')]
+        yield _matscipy.find_common_neighbours(i_n, j_n, j_order, first_j,
+                                               n0, n1)
+        n0 = n1
+
+
+def _sort_by_second_index(j_n, nat):
+    """
+    Order that sorts the neighbor list by second atom index `j_n` and the
+    index of the first occurence of each atom in the sorted list.
     """
     # Create a copy of the neighbor list which is sorted by j_n, e.g.
     # +---------------+    +---------------+
@@ -430,32 +835,10 @@ def find_common_neighbours(i_n, j_n,  nat):
     # +-------+-------+    +-------+-------+
     # | ...   | ...   |    | ...   | ...   |
     # +-------+-------+    +-------+-------+
-    j_order = np.argsort(j_n)
-    i_n_2 = i_n[j_order]
-    j_n_2 = j_n[j_order]
-    # Find indices in the copy where contiguous blocks with same j_n_2 start
-    first_j = first_neighbours(nat, j_n_2) 
-    num_rows_per_j = first_j[j_n+1] - first_j[j_n] 
-    num_rows_cnl = np.sum(num_rows_per_j)
-
-    # The common neighbor information could be stored as
-    # a 2D array. However, multiple 1D arrays are likely
-    # better for performance (fewer cache misses later).
-    nl_index_i1_j1 = np.empty(num_rows_cnl, dtype=i_n.dtype)
-    cnl_j1 = np.empty(num_rows_cnl, dtype=i_n.dtype)
-    nl_index_i2_j1 = np.empty(num_rows_cnl, dtype=i_n.dtype)
-    cnl_i1_i2 = np.empty((num_rows_cnl, 2), dtype=i_n.dtype)
-
-    block_start = np.r_[0, np.cumsum(num_rows_per_j)]
-    slice_for_j1 = {j1: slice(first_j[j1], first_j[j1+1]) for j1 in np.arange(nat)}
-    for block_number, (i1, j1) in enumerate(zip(i_n, j_n)):
-        slice1 = slice(block_start[block_number], block_start[block_number+1])
-        slice2 = slice_for_j1[j1] 
-        nl_index_i1_j1[slice1] = block_number
-        cnl_j1[slice1] = j1 
-        nl_index_i2_j1[slice1] = j_order[slice2]
-        cnl_i1_i2[slice1, 0] = i1
-        cnl_i1_i2[slice1, 1] = i_n_2[slice2]
-    return cnl_i1_i2, cnl_j1, nl_index_i1_j1, nl_index_i2_j1
+    j_n = np.asarray(j_n)
+    j_order = np.argsort(j_n, kind='stable').astype(np.int32)
+    # Indices in the copy where contiguous blocks with same j_n start
+    first_j = np.r_[0, np.cumsum(np.bincount(j_n, minlength=nat))]
+    return j_order, first_j.astype(np.int32)
 
 
@@ -28,11 +28,15 @@ import _matscipy
 
 ###
 
-def ring_statistics(a, cutoff, maxlength=-1):
+def ring_statistics(a, cutoff, maxlength=-1, num_threads=None):
     """
     Compute number of shortest path rings in sample.
     See: D.S. Franzblau, Phys. Rev. B 44, 4925 (1991)
 
+    Distances on the graph are obtained by breadth-first searches truncated
+    at half the maximum ring length, such that memory is linear in the
+    number of atoms.
+
     Parameters
     ----------
     a : ase.Atoms
@@ -42,6 +46,9 @@ def ring_statistics(a, cutoff, maxlength=-1):
     maxlength : float, optional
         Maximum ring length. Search for rings will stop at this length. This
         is useful to speed up calculations for large systems.
+    num_threads : int, optional
+        Number of OpenMP threads used for the search. Default is the OpenMP
+        default.
 
     Returns
     -------
@@ -49,15 +56,17 @@ def ring_statistics(a, cutoff, maxlength=-1):
         Array with number of shortest path rings.
     """
     i, j, r = neighbour_list('ijD', a, cutoff)
-    #print(i, j, r)
-    d = _matscipy.distances_on_graph(i, j)
-    return _matscipy.find_sp_rings(i, j, r, d, maxlength)
+    return _matscipy.find_sp_rings(i, j, r, None, maxlength, num_threads)
 
-def ring_enum(a, cutoff, maxlength=-1):
+def ring_enum(a, cutoff, maxlength=-1, num_threads=None):
     """
     Compute number of shortest path rings in sample.
     See: D.S. Franzblau, Phys. Rev. B 44, 4925 (1991)
 
+    Distances on the graph are obtained by breadth-first searches truncated
+    at half the maximum ring length, such that memory is linear in the
+    number of atoms.
+
     Parameters
     ----------
     a : ase.Atoms
@@ -67,6 +76,9 @@ def ring_enum(a, cutoff, maxlength=-1):
     maxlength : float, optional
         Maximum ring length. Search for rings will stop at this length. This
         is useful to speed up calculations for large systems.
+    num_threads : int, optional
+        Number of OpenMP threads used for the search. Default is the OpenMP
+        default.
 
     Returns
     -------
@@ -74,6 +86,4 @@ def ring_enum(a, cutoff, maxlength=-1):
         Array with number of shortest path rings.
     """
     i, j, r = neighbour_list('ijD', a, cutoff)
-    #print(i, j, r)
-    d = _matscipy.distances_on_graph(i, j)
-    return _matscipy.enum_sp_rings(i, j, r, d, maxlength)
+    return _matscipy.enum_sp_rings(i, j, r, None, maxlength, num_threads)
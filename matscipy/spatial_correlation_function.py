@@ -33,13 +33,14 @@ options:
 #2)mode to assign the atomic values to the FFT grid points [delta=]
     a: assign value to the nearest grid point: simple (default)
     b: assign value to the 8 nearest grid points, distributed
-        proportional to their distance: else
+        by trilinear interpolation (cloud-in-cell): else
 #3)nomalisation by variance of values [norm=]
     a: off: False (default)
     b: on: True
 '''
 
 import numpy as np
+from functools import lru_cache
 from math import floor, ceil
 from matscipy.neighbours import neighbour_list
 from ase import Atoms
@@ -64,6 +65,93 @@ def max_rad(cell_vectors):
     return r.min()
 
 
+def assign_to_grid(abc, values, n_lattice_points, delta='simple'):
+    """
+    Assign atomic values to the points of a periodic grid.
+
+    Parameters
+    ----------
+    abc : array_like
+        Scaled positions in [0, 1), shape (n_atoms, 3)
+    values : array_like
+        Value of each atom
+    n_lattice_points : array_like
+        Number of grid points along each cell vector
+    delta : str
+        'simple' adds each value to the grid point below the atom
+        (nearest-grid-point assignment), everything else distributes it on
+        the 8 surrounding grid points by trilinear weights (cloud-in-cell)
+
+    Returns
+    -------
+    Q : np.ndarray
+        Values on the grid, shape n_lattice_points
+    """
+    n_lattice_points = np.asarray(n_lattice_points)
+    x_nc = np.asarray(abc)*n_lattice_points
+    if delta == 'simple':
+        ijk_nc = np.array(x_nc, dtype=int) % n_lattice_points
+        Q = np.bincount(np.ravel_multi_index(ijk_nc.T, n_lattice_points),
+                        weights=values, minlength=n_lattice_points.prod())
+    else:
+        ijk_nc = np.floor(x_nc)
+        f_nc = x_nc - ijk_nc
+        ijk_nc = ijk_nc.astype(int)
+        Q = np.zeros(n_lattice_points.prod())
+        for corner_c in np.ndindex(2, 2, 2):
+            corner_c = np.array(corner_c)
+            w_n = np.prod(np.where(corner_c, f_nc, 1 - f_nc), axis=1)
+            index_n = np.ravel_multi_index(
+                ((ijk_nc + corner_c) % n_lattice_points).T, n_lattice_points)
+            Q += np.bincount(index_n, weights=w_n*values,
+                             minlength=n_lattice_points.prod())
+    return Q.reshape(n_lattice_points)
+
+
+@lru_cache(maxsize=16)
+def _distance_shells(cell_vectors, n_lattice_points, dim, length_cutoff, nbins):
+    """
+    Histogram bin of the distance of each point of the (unshifted) FFT grid,
+    cached per cell, grid and binning. Points beyond the last bin are assigned
+    to the additional bin nbins.
+    """
+    cell_vectors = np.array(cell_vectors).reshape(3, 3)
+
+    # distance mapping (for floor/ceil convention see *i*fftshift definition)
+    a = np.reshape(np.arange(-floor(n_lattice_points[0]/2.),
+                   ceil(n_lattice_points[0]/2.),1)
+                   /n_lattice_points[0],(-1, 1, 1))
+    b = np.reshape(np.arange(-floor(n_lattice_points[1]/2.),
+                   ceil(n_lattice_points[1]/2.),1)
+                   /n_lattice_points[1],( 1,-1, 1))
+    c = np.reshape(np.arange(-floor(n_lattice_points[2]/2.),
+                   ceil(n_lattice_points[2]/2.),1)
+                   /n_lattice_points[2],( 1, 1,-1))
+    a1, a2, a3 = cell_vectors.T
+
+    if dim is None:
+        dist = np.zeros(n_lattice_points)
+        for x in range(3):
+            dist += (a*a1[x] + b*a2[x] + c*a3[x])**2
+        dist = np.sqrt(dist)
+    else:
+        # directional SCFs, use indices to access directions
+        dist = np.abs(a*a1[dim] + b*a2[dim] + c*a3[dim])
+
+    # Back to the ordering of the FFT grid
+    dist = np.fft.fftshift(dist)
+
+    # Same binning as np.histogram
+    bins = np.arange(0, length_cutoff+length_cutoff/nbins,
+                     length_cutoff/nbins)
+    index = np.searchsorted(bins, np.ravel(dist), side='right') - 1
+    index[np.ravel(dist) == bins[-1]] = len(bins) - 2
+    index[index >= len(bins) - 1] = len(bins) - 1
+    n = np.bincount(index, minlength=len(bins))[:-1]
+    n[n==0] = 1
+    return index, n, bins
+
+
 def spatial_correlation_function(atoms, values, length_cutoff=None,
                                  output_gridsize=None, FFT_cutoff=None,
                                  approx_FFT_gridsize=None, dim=None,
@@ -88,89 +176,28 @@ def spatial_correlation_function(atoms, values, length_cutoff=None,
     if approx_FFT_gridsize is None:
         approx_FFT_gridsize = 1.0
 
+    if dim is not None and not 0 <= dim < 3:
+        raise ValueError('invalid correlation direction: '+str(dim))
+
     n_lattice_points = np.array(np.ceil(cell_vectors.diagonal()
                                         /approx_FFT_gridsize),
                                 dtype=int)
     FFT_gridsize = cell_vectors.diagonal()/n_lattice_points
 
-    if delta == 'simple':
-        # calc lattice values (add to nearest lattice point)
-        Q = np.zeros(shape=(n_lattice_points))
-        for _abc, _q in zip(abc, values):
-            x,y,z = np.array(_abc*n_lattice_points, dtype=int) \
-                             %n_lattice_points
-            Q[x,y,z] += _q
-    else:
-        # proportional distribution on 8 neightbor points
-        Q = np.zeros(shape=(n_lattice_points))
-        a1, a2, a3 = cell_vectors.T
-        for _abc, _q in zip(abc, q):
-            x,y,z = _abc*(n_lattice_points-1)
-            aes = np.array([np.floor(x),np.ceil(x)] \
-                          ).reshape(-1, 1, 1, 1)/(n_lattice_points[0]-1)
-            bes = np.array([np.floor(y),np.ceil(y)] \
-                          ).reshape( 1,-1, 1, 1)/(n_lattice_points[1]-1)
-            ces = np.array([np.floor(z),np.ceil(z)] \
-                          ).reshape( 1, 1,-1, 1)/(n_lattice_points[2]-1)
-            octo = (aes*a1.reshape(1,1,1,-1) \
-                    +bes*a2.reshape(1,1,1,-1) \
-                    +ces*a3.reshape(1,1,1,-1)) \
-                    -cartesianN(_abc,cell_vectors).reshape(1,1,1,-1)
-            octo = 1./(np.sqrt((octo**2).sum(axis=3)))
-            Q[np.floor(x):np.ceil(x)+1,np.floor(y):np.ceil(y)+1,
-              np.floor(z):np.ceil(z)+1] += octo/octo.sum()*_q
-
-    # FFT
-    Q_schlange = np.fft.fftn(Q)
-    C_schlange = Q_schlange*Q_schlange.conjugate()
-    C = np.fft.ifftn(C_schlange)*n_lattice_points.prod() \
-        /n_atoms/n_atoms
-    C = np.fft.ifftshift(C)
+    # calc lattice values
+    Q = assign_to_grid(abc, values, n_lattice_points, delta=delta)
 
-    if dim is None:
-        # distance mapping (for floor/ceil convention see *i*fftshift
-        # definition)
-        a = np.reshape(np.arange(-floor(n_lattice_points[0]/2.),
-                       ceil(n_lattice_points[0]/2.),1)
-                       /n_lattice_points[0],(-1, 1, 1, 1))
-        b = np.reshape(np.arange(-floor(n_lattice_points[1]/2.),
-                       ceil(n_lattice_points[1]/2.),1)
-                       /n_lattice_points[1],( 1,-1, 1, 1))
-        c = np.reshape(np.arange(-floor(n_lattice_points[2]/2.),
-                       ceil(n_lattice_points[2]/2.),1)
-                       /n_lattice_points[2],( 1, 1,-1, 1))
-        a1, a2, a3 = cell_vectors.T
-
-        r = a*a1.reshape(1,1,1,-1)+b*a2.reshape(1,1,1,-1) \
-            +c*a3.reshape(1,1,1,-1)
-        dist = np.sqrt((r**2).sum(axis=3))
-    elif 0 <= dim <3:
-        # directional SCFs
-        # for floor/ceil convention see *i*fftshift definition
-        a = np.reshape(np.arange(-floor(n_lattice_points[0]/2.),
-                                 ceil(n_lattice_points[0]/2.),1)
-                       /n_lattice_points[0],(-1, 1, 1, 1))
-        b = np.reshape(np.arange(-floor(n_lattice_points[1]/2.),
-                                 ceil(n_lattice_points[1]/2.),1)
-                       /n_lattice_points[1],( 1,-1, 1, 1))
-        c = np.reshape(np.arange(-floor(n_lattice_points[2]/2.),
-                                 ceil(n_lattice_points[2]/2.),1)
-                       /n_lattice_points[2],( 1, 1,-1, 1))
-        a1, a2, a3 = cell_vectors.T
-        r = a*a1.reshape(1,1,1,-1) +b*a2.reshape(1,1,1,-1) \
-            +c*a3.reshape(1,1,1,-1)
-        dist = np.abs(r[:,:,:,dim])  # use indices to access directions
-    else:
-        print('invalid correlation direction: '+str(dim))
-        sys.exit()
+    # FFT, values are real
+    Q_schlange = np.fft.rfftn(Q)
+    C_schlange = np.abs(Q_schlange)**2
+    C = np.fft.irfftn(C_schlange, s=Q.shape)*n_lattice_points.prod() \
+        /n_atoms/n_atoms
 
     nbins = int(length_cutoff/output_gridsize)
-    bins = np.arange(0, length_cutoff+length_cutoff/nbins,
-                     length_cutoff/nbins)
-    SCF, edges = np.histogram(np.ravel(dist), bins=bins,
-                              weights=np.ravel(np.real(C)))
-    n, edges = np.histogram(np.reshape(dist,(-1,1)), bins=bins)
-    n[n==0] = 1
+    index, n, edges = _distance_shells(tuple(np.ravel(cell_vectors)),
+                                       tuple(n_lattice_points), dim,
+                                       length_cutoff, nbins)
+    SCF = np.bincount(index, weights=np.ravel(C), minlength=len(edges))[:-1]
     SCF /= n
     # Alternative to the above three lines:
     # SCF *= atoms.get_volume()/np.prod(n_lattice_points) / slice_volume
@@ -29,12 +29,15 @@ import os
 import glob
 import sys
 import re
+import shutil
+import tempfile
 
 from numpy.distutils.core import setup, Extension
 
 from numpy.distutils.command.build_ext import build_ext
 from numpy.distutils import log
 from distutils.dep_util import newer_group
+from distutils.errors import CompileError, LinkError
 from numpy.distutils.misc_util import filter_sources, has_f_sources, \
      has_cxx_sources, get_ext_source_files, \
      get_numpy_include_dirs, is_sequence, get_build_architecture, \
@@ -45,16 +48,53 @@ import versioneer
 # custom compilation options for various compilers
 # entry with key None gives default vaalues always used
 copt =  {
-          None: []
+          None: [],
         }
 
 cxxopt = {
-          None: ['-std=c++0x']
+          None: ['-std=c++0x'],
          }
 
 lopt =  {
         }
 
+# OpenMP is optional, the C code compiles serially without it. Candidate
+# (compile, link) flags are tried in turn on a test program, since the name of
+# the compiler does not tell whether it supports OpenMP (e.g. cc, prefixed
+# cross or conda compilers, clang with libomp).
+openmp_candidates = {
+    'msvc': [(['/openmp'], [])],
+    None: [(['-fopenmp'], ['-fopenmp']),
+           (['-Xpreprocessor', '-fopenmp'], ['-lomp'])],
+}
+
+openmp_test_program = """
+#include <omp.h>
+int main(void) { return omp_get_max_threads() > 0 ? 0 : 1; }
+"""
+
+def openmp_flags(compiler, lang='c'):
+    """Return compile and link flags that enable OpenMP for the compiler, or
+    None if OpenMP is not supported"""
+    candidates = openmp_candidates.get(compiler.compiler_type, openmp_candidates[None])
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmpdir, 'openmp_test' + ('.cpp' if lang == 'c++' else '.c'))
+        with open(source, 'w') as f:
+            f.write(openmp_test_program)
+        for compile_args, link_args in candidates:
+            try:
+                objects = compiler.compile([source], output_dir=tmpdir,
+                                           extra_postargs=compile_args)
+                compiler.link_executable(objects, os.path.join(tmpdir, 'openmp_test'),
+                                         extra_postargs=link_args, target_lang=lang)
+            except (CompileError, LinkError):
+                continue
+            return compile_args, link_args
+    finally:
+        shutil.rmtree(tmpdir)
+    return None
+
 version = versioneer.get_version()
 _version_short = re.findall('\d+\.\d+\.\d+', version)
 if len(_version_short) > 0:
@@ -100,9 +140,9 @@ class build_ext_subclass(build_ext):
         else:
             log.info("building '%s' extension", ext.name)
 
-        extra_args = ext.extra_compile_args or []
-        cxx_extra_args = ext.extra_compile_args or []
-        extra_link_args = ext.extra_link_args or []
+        extra_args = list(ext.extra_compile_args or [])
+        cxx_extra_args = list(ext.extra_compile_args or [])
+        extra_link_args = list(ext.extra_link_args or [])
 
         c = os.path.basename(self.compiler.compiler[0])
         cxx = os.path.basename(self.compiler.compiler_cxx[0])
@@ -121,6 +161,21 @@ class build_ext_subclass(build_ext):
         if cxx in lopt:
             extra_link_args += lopt[cxx]
 
+        compilers = [(self.compiler, 'c', extra_args)]
+        if self._cxx_compiler is not None:
+            compilers += [(self._cxx_compiler, 'c++', cxx_extra_args)]
+        for compiler, lang, args in compilers:
+            flags = openmp_flags(compiler, lang)
+            if flags is None:
+                log.warn("WARNING: %s compiler %r does not support OpenMP; "
+                         "building without OpenMP, the num_threads options "
+                         "will have no effect.", lang.upper(),
+                         ' '.join(compiler.compiler_so))
+                continue
+            compile_args, link_args = flags
+            args += compile_args
+            extra_link_args += [arg for arg in link_args if arg not in extra_link_args]
+
         macros = ext.define_macros[:]
         for undef in ext.undef_macros:
             macros.append((undef,))
@@ -321,6 +376,7 @@ setup(name='matscipy',
             '_matscipy',
             ['c/tools.c',
              'c/angle_distribution.c',
+             'c/eam.c',
              'c/neighbours.c',
              'c/islands.cpp',
              'c/ring_statistics.cpp',
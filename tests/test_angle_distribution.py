@@ -49,7 +49,7 @@ import ase.io as io
 import ase.lattice.hexagonal
 
 import matscipytest
-from matscipy.neighbours import neighbour_list
+from matscipy.neighbours import first_neighbours, neighbour_list, triplet_list
 from matscipy.angle_distribution import angle_distribution
 
 ###
@@ -96,6 +96,39 @@ class TestAngleDistribution(matscipytest.MatSciPyTestCase):
         self.assertArrayAlmostEqual(hist, [0, 0, 0, 0, 0, 4, 0, 0, 0, 0,
                                            2, 0, 0, 0, 0, 0, 0, 0, 0, 0])
         #                                  ^ 90 degrees
+
+    def test_types(self):
+        a = ase.Atoms('CCO', positions=[[0.5, 0.5, 0.5], [0.5, 0.5, 1.0],
+                                       [0.5, 1.0, 1.0]],
+                      cell=[2, 2, 2], pbc=True)
+        i, j, dr = neighbour_list("ijD", a, 1.1)
+        hist = angle_distribution(i, j, dr, 20)
+        species, types = np.unique(a.numbers, return_inverse=True)
+        typed_hist = angle_distribution(i, j, dr, 20, types=types)
+        self.assertEqual(typed_hist.shape, (2, 2, 2, 20))
+        self.assertArrayAlmostEqual(typed_hist.sum(axis=(0, 1, 2)), hist)
+        # O-C-C angle of 90 degrees, centered on atom 1
+        self.assertArrayAlmostEqual(typed_hist[0, 0, 1, 10], 1)
+        self.assertArrayAlmostEqual(typed_hist[0, 1, 0, 10], 1)
+        # C-O-C angle of 45 degrees
+        self.assertArrayAlmostEqual(typed_hist[1, 0, 0, 5], 2)
+        self.assertEqual(typed_hist[1, 1].sum(), 0)
+
+    def test_triplet_list_and_accumulation(self):
+        a = io.read('aC.cfg')
+        i, j, dr = neighbour_list("ijD", a, 1.85)
+        types = np.arange(len(a)) % 2
+        hist = angle_distribution(i, j, dr, 36, 1.6, types=types,
+                                  num_threads=1)
+        ij_t, ik_t = triplet_list(first_neighbours(len(a), i))
+        out = np.zeros_like(hist)
+        for num_threads in [1, 2]:
+            angle_distribution(i, j, dr, 36, 1.6, types=types,
+                               triplet_list=(ij_t, ik_t), out=out,
+                               num_threads=num_threads)
+        self.assertArrayAlmostEqual(out, 2*hist)
+        self.assertArrayAlmostEqual(hist, hist.transpose(0, 2, 1, 3))
+
 ###
 
 if __name__ == '__main__':
@@ -51,7 +51,9 @@ import matscipytest
 from matscipy.neighbours import mic, neighbour_list
 from matscipy.atomic_strain import (get_delta_plus_epsilon_dgesv,
                                     get_delta_plus_epsilon,
-                                    get_D_square_min)
+                                    get_D_square_min,
+                                    atomic_strain,
+                                    atomic_strain_trajectory)
 
 ###
 
@@ -71,6 +73,20 @@ class TestAtomicStrain(matscipytest.MatSciPyTestCase):
 
         self.assertArrayAlmostEqual(dgrad1, dgrad2)
 
+    def test_trajectory(self):
+        a = Diamond('C', size=[4,4,4])
+        frames = []
+        for k in range(3):
+            b = a.copy()
+            b.positions += (np.random.random(b.positions.shape)-0.5)*0.1
+            frames += [b]
+        neighbours = neighbour_list("ij", a, 1.85)
+
+        for b, (dgrad1, d2min1) in zip(frames, atomic_strain_trajectory(frames, a, cutoff=1.85)):
+            dgrad2, d2min2 = atomic_strain(b, a, neighbours=neighbours)
+            self.assertArrayAlmostEqual(dgrad1, dgrad2)
+            self.assertArrayAlmostEqual(d2min1, d2min2)
+
 ###
 
 if __name__ == '__main__':
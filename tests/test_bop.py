@@ -20,6 +20,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import tracemalloc
+
 import numpy as np
 
 import pytest
@@ -68,6 +70,96 @@ def test_hessian_divide_by_masses():
     np.testing.assert_allclose(D_ana, H_ana, atol=1e-4)
 
 
+def test_per_atom_energies_and_stresses():
+    # Per-atom energies and virials must sum to the totals
+    atoms = ase.io.read('aSi.cfg')
+    atoms.calc = Manybody(**Kumagai(kumagai.Kumagai_Comp_Mat_Sci_39_Si))
+    np.testing.assert_allclose(atoms.get_potential_energies().sum(),
+                               atoms.get_potential_energy())
+    np.testing.assert_allclose(atoms.get_stresses().sum(axis=0),
+                               atoms.get_stress(), atol=1e-10)
+
+
+def test_memory_budget():
+    # Evaluation in blocks of atoms must not change the results
+    atoms = ase.io.read('aSi.cfg')
+    par = Kumagai(kumagai.Kumagai_Comp_Mat_Sci_39_Si)
+    calc = Manybody(**par)
+    atoms.calc = calc
+    e = atoms.get_potential_energy()
+    f_nc = atoms.get_forces()
+    s_v = atoms.get_stress()
+    H = calc.get_hessian(atoms)
+    # Budget is smaller than the memory required by a single atom
+    calc = Manybody(**par, memory_budget=1000)
+    atoms.calc = calc
+    np.testing.assert_allclose(atoms.get_potential_energy(), e)
+    np.testing.assert_allclose(atoms.get_forces(), f_nc, atol=1e-10)
+    np.testing.assert_allclose(atoms.get_stress(), s_v, atol=1e-10)
+    np.testing.assert_allclose(calc.get_hessian(atoms).toarray(), H.toarray(), atol=1e-10)
+
+
+def test_isolated_atom():
+    # An isolated atom at index 0 has no pairs and no triplets
+    cluster = Diamond('Si', size=[2, 2, 2], latticeconstant=5.43)
+    cluster.rattle(0.01, seed=2)
+    cluster.pbc = False
+    cluster.cell = [40, 40, 40]
+    cluster.center()
+    atoms = Atoms('Si', positions=[[1, 1, 1]], cell=cluster.cell) + cluster
+    par = Kumagai(kumagai.Kumagai_Comp_Mat_Sci_39_Si)
+    cluster.calc = Manybody(**par)
+    e = cluster.get_potential_energy()
+    f_nc = cluster.get_forces()
+    H = cluster.calc.get_hessian(cluster).toarray()
+    for memory_budget in [None, 2000]:
+        calc = Manybody(**par, memory_budget=memory_budget)
+        atoms.calc = calc
+        np.testing.assert_allclose(atoms.get_potential_energy(), e)
+        np.testing.assert_allclose(atoms.get_forces()[0], 0)
+        np.testing.assert_allclose(atoms.get_forces()[1:], f_nc, atol=1e-10)
+        np.testing.assert_allclose(calc.get_hessian(atoms).toarray()[3:, 3:], H, atol=1e-10)
+
+
+def test_memory_budget_peak_memory():
+    # Temporary memory beyond that of a block of a single atom must stay
+    # within the budget
+    atoms = Diamond('Si', size=[3, 3, 3], latticeconstant=5.43)
+    atoms.rattle(0.05, seed=1)
+    par = Kumagai(kumagai.Kumagai_Comp_Mat_Sci_39_Si)
+    memory_budget = 300000
+
+    def peak_memory(f, memory_budget):
+        calc = Manybody(**par, memory_budget=memory_budget)
+        tracemalloc.start()
+        try:
+            f(calc)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    for f in [lambda calc: calc.get_potential_energy(atoms),
+              lambda calc: calc.get_hessian(atoms, 'neighbour-list')]:
+        single_atom_peak = peak_memory(f, 1)
+        assert peak_memory(f, memory_budget) - single_atom_peak <= memory_budget
+        # Without budget, the temporary memory exceeds the budget
+        assert peak_memory(f, None) - single_atom_peak > memory_budget
+
+
+def test_hessian_operator():
+    # Test Hessian-vector products of the linear operator
+    atoms = ase.io.read('aSi.cfg')
+    masses_n = np.random.randint(1, 10, size=len(atoms))
+    atoms.set_masses(masses=masses_n)
+    kumagai_potential = kumagai.Kumagai_Comp_Mat_Sci_39_Si
+    calc = Manybody(**Kumagai(kumagai_potential))
+    v_n = np.random.random((3 * len(atoms), 2))
+    for divide_by_masses in [False, True]:
+        H = calc.get_hessian(atoms, divide_by_masses=divide_by_masses)
+        H_op = calc.get_hessian_operator(atoms, divide_by_masses=divide_by_masses)
+        np.testing.assert_allclose(H_op @ v_n, H @ v_n, atol=1e-8)
+
+
 @pytest.mark.parametrize('d', np.arange(1.0, 2.3, 0.15))
 @pytest.mark.parametrize('par', [Kumagai(kumagai.Kumagai_Comp_Mat_Sci_39_Si),
                                  TersoffBrenner(tersoff_brenner.Tersoff_PRB_39_5566_Si_C),
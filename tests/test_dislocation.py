@@ -571,6 +571,9 @@ class TestDislocation(matscipytest.MatSciPyTestCase):
 
         W = W * [2, 2, 2]
         del W[0]
+        # break the symmetry around the vacancy, otherwise forces on some
+        # atoms vanish and only round-off makes them nonzero
+        W.rattle(0.01, seed=42)
         W.calc = calc_EAM
         for line_direction in [[1, 0, 0],
                                [0, 1, 0],
@@ -164,7 +164,58 @@ class TestEAMCalculator(matscipytest.MatSciPyTestCase):
         syms = np.array(a.get_chemical_symbols())
         self.assertTrue(abs((e-(syms=='Cu').sum()*e_Cu-
                                 (syms=='Ag').sum()*e_Ag)/len(a)-0.083)<0.0005)
-   
+
+    def test_half_neighbour_list(self):
+        for fn, kind, elements in [('CuAg.eam.alloy', 'eam/alloy', ['Cu', 'Ag']),
+                                   ('CuZr_mm.eam.fs', 'eam/fs', ['Cu', 'Zr'])]:
+            calc = EAM(fn, kind=kind)
+            a = L1_2(elements, size=[2,2,2], latticeconstant=4.0)
+            a.rattle(0.1)
+            i_n, j_n, dr_nc, abs_dr_n = neighbour_list('ijDd', a, cutoff=calc.cutoff)
+            epot, virial, f = calc.energy_virial_and_forces(a.numbers, i_n, j_n, dr_nc, abs_dr_n)
+            i_n, j_n, dr_nc, abs_dr_n = neighbour_list('ijDd', a, cutoff=calc.cutoff, half=True)
+            epot2, virial2, f2 = calc.energy_virial_and_forces(a.numbers, i_n, j_n, dr_nc, abs_dr_n,
+                                                              half=True)
+            self.assertAlmostEqual(epot, epot2)
+            self.assertArrayAlmostEqual(virial, virial2)
+            self.assertArrayAlmostEqual(f, f2)
+
+    def test_packed_splines(self):
+        # Packed spline coefficients must reproduce the spline objects
+        for fn, kind, elements in [('CuAg.eam.alloy', 'eam/alloy', ['Cu', 'Ag']),
+                                   ('CuZr_mm.eam.fs', 'eam/fs', ['Cu', 'Zr'])]:
+            calc = EAM(fn, kind=kind)
+            calc2 = EAM(atomic_numbers=calc._db_atomic_numbers, F=calc.F,
+                        f=calc.f, rep=calc.rep, cutoff=calc.cutoff)
+            a = L1_2(elements, size=[2,2,2], latticeconstant=4.0)
+            a.rattle(0.1)
+            a.set_calculator(calc)
+            epot, f = a.get_potential_energy(), a.get_forces()
+            H = calc.calculate_hessian_matrix(a).todense()
+            a.set_calculator(calc2)
+            self.assertAlmostEqual(epot, a.get_potential_energy())
+            self.assertArrayAlmostEqual(f, a.get_forces())
+            self.assertArrayAlmostEqual(H, calc2.calculate_hessian_matrix(a).todense())
+
+    def test_per_atom_energies_and_stresses(self):
+        for fn, kind, elements in [('CuAg.eam.alloy', 'eam/alloy', ['Cu', 'Ag']),
+                                   ('CuZr_mm.eam.fs', 'eam/fs', ['Cu', 'Zr'])]:
+            calc = EAM(fn, kind=kind)
+            a = L1_2(elements, size=[2,2,2], latticeconstant=4.0)
+            a.rattle(0.1)
+            a.set_calculator(calc)
+            e_i = a.get_potential_energies()
+            s_iv = a.get_stresses()
+            self.assertAlmostEqual(e_i.sum(), a.get_potential_energy())
+            self.assertArrayAlmostEqual(s_iv.sum(axis=0), a.get_stress())
+            # Evaluation without packed splines on a full neighbour list
+            i_n, j_n, dr_nc, abs_dr_n = neighbour_list('ijDd', a, cutoff=calc.cutoff)
+            calc._F_sgx = None
+            epot, virial_v, f_ic, epot_i, virial_iv = calc.energy_virial_and_forces(
+                a.numbers, i_n, j_n, dr_nc, abs_dr_n, per_atom=True)
+            self.assertArrayAlmostEqual(epot_i, e_i)
+            self.assertArrayAlmostEqual(virial_iv/a.get_volume(), s_iv)
+
     def test_CuZr(self):
         # This is a test for the potential published in:
         # Mendelev, Sordelet, Kramer, J. Appl. Phys. 102, 043501 (2007)
@@ -19,8 +19,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import os
+
 import numpy as np
 
+import ase
 import ase.io
 from math import exp, sqrt
 from ase.calculators.calculator import Calculator
@@ -28,6 +31,7 @@ from ase.calculators.calculator import Calculator
 from matscipy.calculators.mcfm.neighbour_list_mcfm.neighbour_list_mcfm import NeighbourListMCFM
 from matscipy.calculators.mcfm.qm_cluster import QMCluster
 from matscipy.calculators.mcfm.calculator import MultiClusterForceMixingPotential
+from matscipy.calculators.mcfm.mcfm_parallel.mcfm_parallel_control import ClusterWorkerPool
 
 import unittest
 import matscipytest
@@ -146,6 +150,23 @@ class MorsePotentialPerAtom(Calculator):
         self.results['potential_energies'] = energies
 
 
+class DyingCalculator(object):
+    """QM calculator whose process dies during the evaluation"""
+
+    def get_forces(self, atoms):
+        os._exit(1)
+
+
+class SeedCalculator(object):
+    """QM calculator that returns its calculation seed as charges"""
+
+    calculationSeed = None
+
+    def get_forces(self, atoms):
+        self.results = {'charges': np.full(len(atoms), float(self.calculationSeed))}
+        return np.zeros((len(atoms), 3))
+
+
 def create_mcfm_potential(atoms,
                           classical_calculator=None,
                           qm_calculator=None,
@@ -248,6 +269,13 @@ class TestMCFM(matscipytest.MatSciPyTestCase):
         for idx in range(len(self.atoms)):
             self.assertTrue((neighbour_list_check[idx] == nl.neighbours[idx]).all())
 
+    def test_neighbours_of_list(self):
+        self.prepare_data()
+        nl = create_neighbour_list(self.atoms)
+        indices = [12, 0, 29, 5]
+        self.assertArrayAlmostEqual(nl.get_neighbours_of_list(indices),
+                                    np.concatenate([nl.get_neighbours(idx) for idx in indices]))
+
     def test_clustering(self):
         self.prepare_data()
         self.mcfm_pot.qm_cluster.flagging_module.qm_flag_potential_energies[12, :] *= -20
@@ -276,6 +304,51 @@ class TestMCFM(matscipytest.MatSciPyTestCase):
                 self.assertArrayAlmostEqual(f[idx, :], fm1[idx, :])
 
 
+    def test_persistent_workers(self):
+        self.prepare_data()
+        self.mcfm_pot.qm_cluster.flagging_module.qm_flag_potential_energies[12, :] *= -20
+
+        # Compare parallel evaluations with persistent workers to serial ones
+        self.mcfm_pot.persistent_workers = True
+        try:
+            for i in range(2):
+                self.atoms.positions[0, 0] += 0.01 * i
+                self.mcfm_pot.doParallel = False
+                f = self.mcfm_pot.get_forces(self.atoms)
+                self.mcfm_pot.doParallel = True
+                self.mcfm_pot.results = {}
+                self.assertArrayAlmostEqual(self.mcfm_pot.get_forces(self.atoms), f)
+            pool = self.mcfm_pot.worker_pool
+            self.assertEqual(len(pool.runtimes), len(self.mcfm_pot.cluster_list))
+            # Clusters stay with the worker that evaluated them
+            keys = [tuple(sorted(cluster)) for cluster in self.mcfm_pot.cluster_list]
+            self.assertEqual(pool.preferred_workers(self.mcfm_pot.cluster_list,
+                                                    [1.0] * len(keys)),
+                             [pool.ranks[key] for key in keys])
+        finally:
+            self.mcfm_pot.shutdown_workers()
+
+    def test_dead_worker(self):
+        # A worker that dies must not hang the evaluation
+        pool = ClusterWorkerPool(DyingCalculator(), 1, poll_interval=0.1)
+        with self.assertRaises(RuntimeError):
+            pool.evaluate([ase.Atoms('H')], [[0]], 1, [1], [1.0])
+        self.assertEqual(pool.workers, [])
+
+    def test_worker_seed(self):
+        # Persistent workers keep their calculation seed across evaluations
+        cluster = ase.Atoms('H', info={'no_quantum_atoms': 1})
+        cluster.arrays['orig_index'] = np.array([0])
+        cluster.arrays['cluster_mark'] = np.array([1])
+        pool = ClusterWorkerPool(SeedCalculator(), 1)
+        try:
+            seeds = [pool.evaluate([cluster], [[0]], 1, [1], [1.0])[0].qm_charges[0]
+                     for i in range(2)]
+        finally:
+            pool.close()
+        self.assertEqual(seeds[0], seeds[1])
+
+
 ###
 
 
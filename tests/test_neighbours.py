@@ -189,6 +189,32 @@ class TestNeighbours(matscipytest.MatSciPyTestCase):
         i = neighbour_list("i", a, cutoffs)
         self.assertArrayAlmostEqual(np.bincount(i), [1,3,1,0,1])
 
+    def test_pair_cutoffs(self):
+        # Cutoffs differ strongly between pairs of elements, compare to a
+        # search with a single large cutoff
+        np.random.seed(13)
+        nat = 200
+        cutoffs = {(1, 1): 1.0, (1, 92): 2.0, (92, 92): 6.5, (8, 92): 3.0}
+        cutoff_zz = {}
+        for (el1, el2), c in cutoffs.items():
+            cutoff_zz[el1, el2] = c
+            cutoff_zz[el2, el1] = c
+        for pbc in [True, False, [True, False, True]]:
+            a = ase.Atoms(numbers=np.random.choice([1, 8, 92], nat),
+                          positions=12 * np.random.random((nat, 3)),
+                          cell=[12, 12, 12], pbc=pbc)
+            for half in [False, True]:
+                i, j, D = neighbour_list('ijD', a, cutoffs, half=half)
+                self.assertTrue((np.diff(i) >= 0).all())
+                i2, j2, d2, D2 = neighbour_list('ijdD', a, 6.5, half=half)
+                c2 = np.array([cutoff_zz.get((a.numbers[i], a.numbers[j]), 0)
+                               for i, j in zip(i2, j2)])
+                mask = d2 < c2
+                self.assertEqual(
+                    sorted(zip(i, j, map(tuple, np.round(D, 8)))),
+                    sorted(zip(i2[mask], j2[mask],
+                               map(tuple, np.round(D2[mask], 8)))))
+
     def test_noncubic(self):
         a = bulk("Al", cubic=False)
         i, j, d = neighbour_list("ijd", a, 3.1)
@@ -218,6 +244,23 @@ class TestNeighbours(matscipytest.MatSciPyTestCase):
                     self.assertTrue(abs(dd) < 1e-10)
                     self.assertTrue(not (c2 - c).any())
 
+    def test_atoms_outside_nonperiodic_cell(self):
+        # Crystal that extends far beyond a small nonperiodic cell
+        a = bulk('Cu', 'fcc', a=3.6, cubic=True) * (5, 5, 5)
+        a.rattle(0.05, seed=7)
+        a.set_cell(np.diag([5.0, 5.0, 5.0]), scale_atoms=False)
+        a.set_pbc(False)
+        i, j, d, D, S = neighbour_list('ijdDS', a, 3.0)
+        self.assertTrue((np.diff(i) >= 0).all())
+        self.assertArrayAlmostEqual(D, a.positions[j] - a.positions[i])
+        self.assertTrue((S == 0).all())
+
+        # Compare to all pairs
+        d_ij = np.linalg.norm(a.positions.reshape(-1, 1, 3) -
+                              a.positions.reshape(1, -1, 3), axis=2)
+        i_ref, j_ref = np.nonzero(np.logical_and(d_ij > 0, d_ij < 3.0))
+        self.assertEqual(sorted(zip(i, j)), sorted(zip(i_ref, j_ref)))
+
     def test_wrong_number_of_cutoffs(self):
         nat = 10
         atoms = ase.Atoms(numbers=range(nat),
@@ -249,6 +292,212 @@ class TestNeighbours(matscipytest.MatSciPyTestCase):
 
         self.assertTrue(np.all(np.abs(dr-dr_direct) < 1e-12))
 
+    def test_num_threads(self):
+        for pbc in [True, False, [True, False, True]]:
+            a = io.read('aC.cfg')
+            a.set_pbc(pbc)
+            serial = neighbour_list('ijdDS', a, 1.85, num_threads=1)
+            for num_threads in [2, 3, 8]:
+                parallel = neighbour_list('ijdDS', a, 1.85,
+                                          num_threads=num_threads)
+                for q1, q2 in zip(serial, parallel):
+                    self.assertTrue((q1 == q2).all())
+
+    def test_half_neighbour_list(self):
+        small = bulk('Cu', 'fcc', a=3.6, cubic=True)
+        small.rattle(0.05, seed=1)
+        large = io.read('aC.cfg')
+        for a, cutoff in [(small, 5.0), (small, {('Cu', 'Cu'): 4.0}),
+                          (large, 1.85), (large, np.full(len(large), 0.9))]:
+            for pbc in [True, False, [True, False, True]]:
+                a.set_pbc(pbc)
+                i, j, D = neighbour_list('ijD', a, cutoff)
+                ih, jh, Dh = neighbour_list('ijD', a, cutoff, half=True)
+                self.assertEqual(2*len(ih), len(i))
+                self.assertTrue((ih <= jh).all())
+                self.assertTrue((np.diff(ih) >= 0).all())
+                # Reconstruct the full list from the half list
+                fi = np.concatenate((ih, jh))
+                fj = np.concatenate((jh, ih))
+                fD = np.concatenate((Dh, -Dh))
+                s1 = np.lexsort(np.transpose(np.round(D, 8))[::-1].tolist() +
+                                [j, i])
+                s2 = np.lexsort(np.transpose(np.round(fD, 8))[::-1].tolist() +
+                                [fj, fi])
+                self.assertArrayAlmostEqual(i[s1], fi[s2])
+                self.assertArrayAlmostEqual(j[s1], fj[s2])
+                self.assertArrayAlmostEqual(D[s1], fD[s2], tol=1e-12)
+        # Atom interacting with its own periodic images
+        a = bulk('Cu', 'fcc', a=3.6)
+        i, j, S = neighbour_list('ijS', a, 5.0, half=True)
+        self.assertTrue((i == j).all())
+        self.assertEqual(len(set(map(tuple, S))), len(S))
+        self.assertEqual(len(set(map(tuple, S)) & set(map(tuple, -S))), 0)
+        self.assertEqual(2*len(S), len(neighbour_list('i', a, 5.0)))
+
+    def test_reverse_pairs(self):
+        small = bulk('Cu', 'fcc', a=3.6, cubic=True)
+        small.rattle(0.05, seed=3)
+        large = io.read('aC.cfg')
+        for a, cutoff in [(small, 5.0), (small, 8.0), (large, 1.85)]:
+            for pbc in [True, False, [True, False, True]]:
+                a.set_pbc(pbc)
+                i, j, d, D, R = neighbour_list('ijdDR', a, cutoff)
+                self.assertTrue((R >= 0).all())
+                self.assertArrayAlmostEqual(i[R], j)
+                self.assertArrayAlmostEqual(j[R], i)
+                self.assertArrayAlmostEqual(D[R], -D, tol=1e-12)
+                self.assertArrayAlmostEqual(R[R], np.arange(len(R)))
+                if a is large:
+                    self.assertArrayAlmostEqual(
+                        R, find_indices_of_reversed_pairs(i, j, d))
+        self.assertRaises(ValueError, neighbour_list, 'ijR', large, 1.85,
+                          half=True)
+
+    def test_find_common_neighbours(self):
+        a = bulk('Cu', 'fcc', a=3.6, cubic=True)*(2, 2, 2)
+        a.rattle(0.05, seed=2)
+        i_n, j_n = neighbour_list('ij', a, 4.0)
+        cnl_i1_i2, cnl_j1, nl_index_i1_j1, nl_index_i2_j1 = \
+            find_common_neighbours(i_n, j_n, len(a))
+        self.assertArrayAlmostEqual(cnl_i1_i2[:, 0], i_n[nl_index_i1_j1])
+        self.assertArrayAlmostEqual(cnl_i1_i2[:, 1], i_n[nl_index_i2_j1])
+        self.assertArrayAlmostEqual(cnl_j1, j_n[nl_index_i1_j1])
+        self.assertArrayAlmostEqual(cnl_j1, j_n[nl_index_i2_j1])
+        # Each pair is combined with all pairs sharing the same j
+        self.assertArrayAlmostEqual(
+            np.bincount(nl_index_i1_j1, minlength=len(i_n)),
+            np.bincount(j_n)[j_n])
+        self.assertTrue((np.diff(nl_index_i1_j1) >= 0).all())
+
+        for max_rows in [1, 1000, 10000, 10**8]:
+            chunks = list(find_common_neighbours_chunked(i_n, j_n, len(a),
+                                                         max_rows=max_rows))
+            for cnl_1, cnl_2 in zip(map(np.concatenate, zip(*chunks)),
+                                    [cnl_i1_i2, cnl_j1, nl_index_i1_j1,
+                                     nl_index_i2_j1]):
+                self.assertArrayAlmostEqual(cnl_1, cnl_2)
+            # Rows of an atom i1 are never split across chunks
+            i1 = [np.unique(chunk[0][:, 0]) for chunk in chunks]
+            self.assertEqual(len(np.concatenate(i1)), len(a))
+            if max_rows >= 10000:
+                self.assertTrue(all(len(chunk[1]) <= max_rows
+                                    for chunk in chunks))
+
+    def test_neighbour_list_with_skin(self):
+        a = io.read('aC.cfg')
+        for cutoff in [1.85, {('C', 'C'): 1.85}, 0.925*np.ones(len(a))]:
+            b = a.copy()
+            nl = NeighbourList(cutoff, skin=0.5)
+            for step in range(10):
+                b.positions += 0.02*(np.random.random((len(b), 3))-0.5)
+                i, j, d, D, S = nl.get('ijdDS', b)
+                i2, j2, d2, D2, S2 = neighbour_list('ijdDS', b, cutoff)
+                # Order of j is not guaranteed, sort before comparing
+                s = np.lexsort((j, i))
+                s2 = np.lexsort((j2, i2))
+                self.assertArrayAlmostEqual(i[s], i2[s2])
+                self.assertArrayAlmostEqual(j[s], j2[s2])
+                self.assertArrayAlmostEqual(d[s], d2[s2])
+                self.assertArrayAlmostEqual(D[s], D2[s2])
+                self.assertArrayAlmostEqual(S[s], S2[s2])
+            self.assertEqual(nl.nupdates, 1)
+
+            # Large displacement triggers rebuild
+            b.positions[0] += 0.3
+            nl.get('i', b)
+            self.assertEqual(nl.nupdates, 2)
+
+            # Change of cell triggers rebuild
+            b.set_cell(1.01*b.cell, scale_atoms=True)
+            i, j = nl.get('ij', b)
+            self.assertEqual(nl.nupdates, 3)
+            i2, j2 = neighbour_list('ij', b, cutoff)
+            self.assertEqual(len(i), len(i2))
+
+    def test_neighbour_list_batch(self):
+        a = io.read('aC.cfg')
+        frames = []
+        for k in range(5):
+            b = a.copy()
+            b.rattle(0.05, seed=k)
+            b.set_cell((1 + 0.01 * k) * a.cell, scale_atoms=True)
+            frames += [b]
+        for pbc in [True, False, [True, False, True]]:
+            for b in frames:
+                b.set_pbc(pbc)
+            offsets, i, j, d, D, S, R = \
+                neighbour_list_batch('ijdDSR', frames, 1.85)
+            self.assertEqual(len(offsets), len(frames) + 1)
+            self.assertEqual(offsets[-1], len(i))
+            for f, b in enumerate(frames):
+                i2, j2, d2, D2, S2, R2 = neighbour_list('ijdDSR', b, 1.85)
+                s = slice(offsets[f], offsets[f + 1])
+                self.assertArrayAlmostEqual(i[s], i2)
+                self.assertArrayAlmostEqual(j[s], j2)
+                self.assertArrayAlmostEqual(d[s], d2)
+                self.assertArrayAlmostEqual(D[s], D2)
+                self.assertArrayAlmostEqual(S[s], S2)
+                self.assertArrayAlmostEqual(R[s], R2 + offsets[f])
+
+        # Stacked positions with a common cell
+        positions = np.array([b.positions for b in frames])
+        offsets, i, j = neighbour_list_batch('ij', positions=positions,
+                                             cutoff=1.85, cell=a.cell,
+                                             pbc=True)
+        for f in range(len(frames)):
+            i2, j2 = neighbour_list('ij', positions=positions[f], cutoff=1.85,
+                                    cell=a.cell, pbc=[True, True, True])
+            self.assertArrayAlmostEqual(i[offsets[f]:offsets[f + 1]], i2)
+            self.assertArrayAlmostEqual(j[offsets[f]:offsets[f + 1]], j2)
+
+        # Frames must contain the same atoms
+        with self.assertRaises(ValueError):
+            neighbour_list_batch('i', [a, a[:-1]], 1.85)
+
+    def test_single_precision(self):
+        a = io.read('aC.cfg')
+        i, j, d, D = neighbour_list('ijdD', a, 1.85)
+        i2, j2, d2, D2 = neighbour_list('ijdD', a, 1.85, dtype=np.float32)
+        self.assertEqual(d2.dtype, np.float32)
+        self.assertEqual(D2.dtype, np.float32)
+        self.assertArrayAlmostEqual(i, i2)
+        self.assertArrayAlmostEqual(j, j2)
+        self.assertArrayAlmostEqual(d, d2, tol=1e-5)
+        self.assertArrayAlmostEqual(D, D2, tol=1e-5)
+        with self.assertRaises(ValueError):
+            neighbour_list('d', a, 1.85, dtype=np.int32)
+
+    def test_output_arrays(self):
+        a = io.read('aC.cfg')
+        i, j, d, D, S = neighbour_list('ijdDS', a, 1.85)
+        n = len(i)
+
+        # Large enough arrays are reused
+        out = {'i': np.empty(n + 10, dtype=np.int32),
+               'j': np.empty(n + 10, dtype=np.int32),
+               'd': np.empty(n + 10),
+               'D': np.empty((n + 10, 3)),
+               'S': np.empty((n + 10, 3), dtype=np.int32)}
+        ret = neighbour_list('ijdDS', a, 1.85, out=out)
+        for q, r, r2 in zip('ijdDS', [i, j, d, D, S], ret):
+            self.assertTrue(np.shares_memory(r2, out[q]))
+            self.assertArrayAlmostEqual(r, r2)
+
+        # Arrays that are too small are not used
+        out = {'i': np.empty(n - 1, dtype=np.int32)}
+        i2 = neighbour_list('i', a, 1.85, out=out)
+        self.assertFalse(np.shares_memory(i2, out['i']))
+        self.assertArrayAlmostEqual(i, i2)
+
+        # Arrays must have the correct type
+        with self.assertRaises(TypeError):
+            neighbour_list('d', a, 1.85, out={'d': np.empty(n + 10,
+                                                            dtype=np.float32)})
+        d2 = neighbour_list('d', a, 1.85, dtype=np.float32,
+                            out={'d': np.empty(n + 10, dtype=np.float32)})
+        self.assertArrayAlmostEqual(d, d2, tol=1e-5)
+
 
 class TestTriplets(matscipytest.MatSciPyTestCase):
 
@@ -314,6 +563,35 @@ class TestTriplets(matscipytest.MatSciPyTestCase):
         assert np.all(a[0] == ij_t_comp)
         assert np.all(a[1] == ik_t_comp)
 
+    def test_triplet_list_jk(self):
+        small = bulk('Si', 'diamond', a=5.43)
+        large = io.read('aC.cfg')
+        for a, cutoff in [(small, 3.0), (small, 6.0), (large, 1.85)]:
+            i_p, j_p, d_p = neighbour_list('ijd', a, cutoff)
+            first_i = first_neighbours(len(a), i_p)
+            ij_t, ik_t, jk_t = triplet_list(first_i, i_p=i_p, j_p=j_p)
+            ij2_t, ik2_t = triplet_list(first_i)
+            self.assertArrayAlmostEqual(ij_t, ij2_t)
+            self.assertArrayAlmostEqual(ik_t, ik2_t)
+            # Reference: first pair j-k in the neighbour list
+            jk2_t = -np.ones_like(jk_t)
+            for t, (ij, ik) in enumerate(zip(ij_t, ik_t)):
+                jk, = np.nonzero(np.logical_and(i_p == j_p[ij],
+                                                j_p == j_p[ik]))
+                if len(jk) > 0:
+                    jk2_t[t] = jk[0]
+            self.assertArrayAlmostEqual(jk_t, jk2_t)
+
+        i_p, j_p, d_p = neighbour_list('ijd', small, 6.0)
+        first_i = first_neighbours(len(small), i_p)
+        ij_t, ik_t, jk_t = triplet_list(first_i, d_p, 4.0, i_p=i_p, j_p=j_p)
+        ij2_t, ik2_t = triplet_list(first_i, d_p, 4.0)
+        self.assertArrayAlmostEqual(ij_t, ij2_t)
+        self.assertArrayAlmostEqual(ik_t, ik2_t)
+        self.assertTrue((jk_t >= 0).all())
+        self.assertTrue((i_p[jk_t[jk_t >= 0]] == j_p[ij_t[jk_t >= 0]]).all())
+        self.assertTrue((j_p[jk_t[jk_t >= 0]] == j_p[ik_t[jk_t >= 0]]).all())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -64,6 +64,7 @@ from matscipy.calculators.pair_potential import PairPotential, LennardJonesQuadr
 from matscipy.elasticity import fit_elastic_constants, elastic_moduli, full_3x3x3x3_to_Voigt_6x6, measure_triclinic_elastic_constants
 from matscipy.calculators.calculator import MatscipyCalculator
 from matscipy.hessian_finite_differences import fd_hessian
+from matscipy.neighbours import neighbour_list
 
 ###
 
@@ -152,6 +153,27 @@ def test_amorphous_stress():
     sn = b.calculate_numerical_stress(atoms, d=0.0001)
     np.testing.assert_allclose(s, sn, atol=1e-4)
 
+def test_per_atom_energies_and_stresses():
+    """
+    Test per-atom energies and virials of a glass
+    """
+    calc = {(1, 1): LennardJonesQuadratic(1, 1, 2.5),
+            (1, 2): LennardJonesQuadratic(1.5, 0.8, 2.0),
+            (2, 2): LennardJonesQuadratic(0.5, 0.88, 2.2)}
+    atoms = io.read('glass_min.xyz')
+    b = PairPotential(calc)
+    atoms.calc = b
+    e_n = atoms.get_potential_energies()
+    np.testing.assert_allclose(e_n.sum(), atoms.get_potential_energy())
+    np.testing.assert_allclose(atoms.get_stresses().sum(axis=0),
+                               atoms.get_stress(), atol=1e-10)
+    # Half of the energy of each bond belongs to each of its atoms
+    i_p, j_p, r_p = neighbour_list('ijd', atoms, b.dict)
+    for i in [0, 10, 20]:
+        e = sum(calc[tuple(sorted((atoms.numbers[i], atoms.numbers[j])))](r)
+                for j, r in zip(j_p[i_p == i], r_p[i_p == i]))
+        np.testing.assert_allclose(e_n[i], e/2)
+
 def test_hessian():
     """
     Test the computation of the Hessian matrix 
@@ -172,6 +194,32 @@ def test_hessian():
     H_analytical = H_analytical.todense()
     np.testing.assert_allclose(H_analytical, H_numerical, atol=1e-4)
 
+def test_tabulated_pair_functions():
+    """
+    Test tabulated evaluation of the pair functions against analytic
+    evaluation
+    """
+    calc = {(1, 1): LennardJonesQuadratic(1, 1, 2.5),
+            (1, 2): LennardJonesQuadratic(1.5, 0.8, 2.0),
+            (2, 2): LennardJonesQuadratic(0.5, 0.88, 2.2)}
+    atoms = io.read("glass_min.xyz")
+    atoms.center(vacuum=5.0)
+    atoms.pbc = True
+    atoms.calc = PairPotential(calc)
+    e = atoms.get_potential_energy()
+    f = atoms.get_forces()
+    s = atoms.get_stress()
+    H = atoms.calc.get_hessian(atoms, "sparse").todense()
+
+    # r_min is chosen such that some pairs are evaluated analytically
+    b = PairPotential(calc, r_min=0.9)
+    atoms.calc = b
+    np.testing.assert_allclose(atoms.get_potential_energy(), e, atol=1e-8)
+    np.testing.assert_allclose(atoms.get_forces(), f, atol=1e-8)
+    np.testing.assert_allclose(atoms.get_stress(), s, atol=1e-8)
+    np.testing.assert_allclose(b.get_hessian(atoms, "sparse").todense(), H,
+                               atol=1e-5)
+
 def test_symmetry_dense():
     """
     Test the symmetry of the dense Hessian matrix 
@@ -225,6 +273,28 @@ def test_hessian_divide_by_masses():
     D_analytical = b.get_hessian(atoms, "dense", divide_by_masses=True)
     np.testing.assert_allclose(H_analytical, D_analytical, atol=1e-4)
 
+def test_hessian_operator():
+    """
+    Test Hessian-vector products of the linear operator against the sparse
+    Hessian and dynamical matrix
+    """
+    calc = {(1, 1): LennardJonesQuadratic(1, 1, 2.5),
+            (1, 2): LennardJonesQuadratic(1.5, 0.8, 2.0),
+            (2, 2): LennardJonesQuadratic(0.5, 0.88, 2.2)}
+    atoms = io.read("glass_min.xyz")
+    atoms.set_masses(masses=np.random.randint(1, 10, size=len(atoms)))
+    b = PairPotential(calc)
+    atoms.calc = b
+    v_n = np.random.random((3*len(atoms), 2))
+    for divide_by_masses in [False, True]:
+        H = b.get_hessian(atoms, "sparse", divide_by_masses=divide_by_masses)
+        H_op = b.get_hessian_operator(atoms, divide_by_masses=divide_by_masses)
+        np.testing.assert_allclose(H_op @ v_n, H @ v_n, atol=1e-10)
+        # Generic implementation from Hessian blocks
+        H_op = MatscipyCalculator.get_hessian_operator(
+            b, atoms, divide_by_masses=divide_by_masses)
+        np.testing.assert_allclose(H_op @ v_n, H @ v_n, atol=1e-10)
+
 def test_non_affine_forces_glass():
     """
     Test the computation of the non-affine forces 
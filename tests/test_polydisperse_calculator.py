@@ -122,6 +122,20 @@ def test_glass_stress():
     sn = calc.calculate_numerical_stress(atoms, d=0.00001)
     np.testing.assert_allclose(s, sn, atol=1e-4)
 
+def test_per_atom_energies_and_stresses():
+    """
+    Test that per-atom energies and virials sum to the totals
+    """
+    calc = Polydisperse(InversePowerLawPotential(1.0, 1.4, 0.1, 3, 1, 2.22))
+    atoms = io.read('glass_min.xyz')
+    atoms.set_array("size", np.random.uniform(1.0, 2.22, size=len(atoms)), dtype=float)
+    atoms.set_atomic_numbers(np.repeat(1.0, len(atoms)))
+    atoms.calc = calc
+    np.testing.assert_allclose(atoms.get_potential_energies().sum(),
+                               atoms.get_potential_energy())
+    np.testing.assert_allclose(atoms.get_stresses().sum(axis=0),
+                               atoms.get_stress(), atol=1e-10)
+
 def test_symmetry_sparse():
     """
     Test the symmetry of the dense Hessian matrix 
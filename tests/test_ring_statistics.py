@@ -40,6 +40,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # ======================================================================
 
+import sys
 import unittest
 
 import numpy as np
@@ -50,8 +51,8 @@ import ase.lattice.hexagonal
 
 import matscipytest
 from matscipy.neighbours import neighbour_list
-from matscipy.rings import ring_statistics
-from _matscipy import distances_on_graph, find_sp_rings
+from matscipy.rings import ring_enum, ring_statistics
+from _matscipy import distances_on_graph, enum_sp_rings, find_sp_rings
 
 ###
 
@@ -107,6 +108,38 @@ class TestNeighbours(matscipytest.MatSciPyTestCase):
         self.assertArrayAlmostEqual(r, [0,0,0,0,4,813,2678,1917,693,412,209,89,
                                         21,3])
 
+    def test_no_reference_leak(self):
+        a = ase.build.molecule('C6H6')
+        a = a[a.numbers==6]
+        a.center(vacuum=5)
+        i, j, r = neighbour_list('ijD', a, 1.85)
+        d = distances_on_graph(i, j)
+        refcounts = [sys.getrefcount(x) for x in (i, j, r, d)]
+        for k in range(10):
+            find_sp_rings(i, j, r, d)
+            enum_sp_rings(i, j, r, None)
+            with self.assertRaises(ValueError):
+                find_sp_rings(i, j[:-1], r, d)
+        self.assertEqual([sys.getrefcount(x) for x in (i, j, r, d)],
+                         refcounts)
+
+    def test_dense_distances(self):
+        a = ase.io.read('aC.cfg')
+        a = a[np.all(a.positions < 10, axis=1)]
+        i, j, r = neighbour_list('ijD', a, 1.85)
+        d = distances_on_graph(i, j)
+        for maxlength in [8, 12]:
+            ringstat = ring_statistics(a, 1.85, maxlength=maxlength)
+            self.assertArrayAlmostEqual(
+                find_sp_rings(i, j, r, d, maxlength, 1), ringstat)
+            self.assertArrayAlmostEqual(
+                find_sp_rings(i, j, r, None, maxlength, 1), ringstat)
+            rings = ring_enum(a, 1.85, maxlength=maxlength)
+            self.assertArrayAlmostEqual(
+                enum_sp_rings(i, j, r, d, maxlength, 1), rings)
+            self.assertArrayAlmostEqual(
+                np.bincount((rings >= 0).sum(axis=1)), ringstat)
+
 ###
 
 if __name__ == '__main__':
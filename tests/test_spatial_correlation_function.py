@@ -45,7 +45,8 @@ import numpy as np
 from matscipy.neighbours import neighbour_list
 from ase import Atoms
 import matscipytest
-from matscipy.spatial_correlation_function import spatial_correlation_function
+from matscipy.spatial_correlation_function import (spatial_correlation_function,
+                                                     assign_to_grid)
 import ase.io as io
 
 #import matplotlib.pyplot as plt
@@ -78,6 +79,19 @@ class TestSpatialCorrelationFunction(unittest.TestCase):
 
             self.assertTrue(np.abs(SCF1-SCF2).max() < 0.31)
 
+    def test_assign_to_grid(self):
+        n_lattice_points = np.array([4, 8, 16])
+        abc = np.random.rand(20, 3)
+        values = np.random.rand(20)
+        for delta in ['simple', 'cic']:
+            Q = assign_to_grid(abc, values, n_lattice_points, delta=delta)
+            self.assertAlmostEqual(Q.sum(), values.sum())
+        # Atoms on grid points are assigned to these points by both methods
+        abc = np.random.randint(0, 4, size=(20, 3))/n_lattice_points
+        Q1 = assign_to_grid(abc, values, n_lattice_points, delta='simple')
+        Q2 = assign_to_grid(abc, values, n_lattice_points, delta='cic')
+        self.assertTrue(np.allclose(Q1, Q2))
+
 #    def test_peak_count(self):
 #        n=50
 #